@@ -1,13 +1,19 @@
-from agno.agent import Agent
-from agno.models.google import Gemini
+from typing import TYPE_CHECKING
 
+from agents.common import build_agent
 
-def create_coder_agent(model_id: str = "gemini-2.5-flash") -> Agent:
+if TYPE_CHECKING:
+	from agno.agent import Agent
+
+
+def create_coder_agent(model_id: str = "gemini-2.5-flash", temperature: float | None = None,
+                       api_key: str | None = None) -> "Agent":
 	"""Factory to create and return a code-generation Agent instance."""
-	model = Gemini(id=model_id)
-	coder = Agent(
+	return build_agent(
 		name="coder",
-		model=model,
+		model_id=model_id,
+		api_key=api_key,
+		temperature=temperature,
 		instructions=(
 			"You are a helpful code-generation assistant. Given a short programming specification, "
             "produce clean, runnable Python code ONLY (no extra explanation, no prose before the code). "
@@ -16,7 +22,6 @@ def create_coder_agent(model_id: str = "gemini-2.5-flash") -> Agent:
             "place it as a single top-level module docstring at the very top of the file. Output must be valid Python source."
 		),
 	)
-	return coder
 
 
 if __name__ == "__main__":
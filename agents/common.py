@@ -0,0 +1,150 @@
+# agents/common.py
+import asyncio
+import hashlib
+import inspect
+import os
+import threading
+
+from agents import model_backend
+from utils import tracing
+from utils.agent_cache import maybe_cached
+from utils.import_timing import timed_import
+from utils.rate_limit import LimitedAgent
+from utils.stream_sanitizer import estimate_tokens
+
+# agno Agents built so far, per (name, model, temperature, instructions, API key); they live as long as the process
+_agents = {}
+_agents_lock = threading.Lock()
+
+
+def _gemini_agent(name: str, instructions: str, model_id: str, temperature: float | None, api_key: str | None):
+	"""The agno Agent for these settings, built on first use; agno and the Gemini client are imported then too."""
+	key = (name, model_id, temperature, instructions, hashlib.sha256((api_key or "").encode("utf-8")).hexdigest())
+	with _agents_lock:
+		agent = _agents.get(key)
+		if agent is None:
+			Agent = timed_import("agno.agent").Agent
+			Gemini = timed_import("agno.models.google").Gemini
+			agent = _agents[key] = Agent(
+				name=name,
+				model=Gemini(id=model_id, temperature=temperature, api_key=api_key),
+				instructions=instructions,
+			)
+		return agent
+
+
+def clear_agents() -> None:
+	"""Forget the memoized agents (the next build_agent call constructs new ones)."""
+	with _agents_lock:
+		_agents.clear()
+
+
+def build_agent(name: str, instructions: str, model_id: str = "gemini-2.5-flash", temperature: float | None = None,
+				api_key: str | None = None):
+	"""Shared construction for the agent factories; wraps the agent in the response cache when AGENT_CACHE=1.
+
+	MODEL_BACKEND=replay answers from a cassette file instead of a model, MODEL_BACKEND=record
+	writes one (see agents/model_backend.py). Calls that reach the model go through the shared
+	rate limiter and retry transient errors (utils/rate_limit.py); cache hits do not.
+	The underlying agno Agent is built once per name, model, temperature, instructions and
+	`api_key` and reused, with its client, by later runs in the same process. The key is given
+	to the model explicitly; without one, GOOGLE_API_KEY is read here, when the agent is built.
+	"""
+	backend = model_backend.backend()
+	if backend == "replay":
+		return LimitedAgent(model_backend.replay_agent(name, instructions, model_id))
+	if api_key is None:
+		api_key = os.environ.get("GOOGLE_API_KEY")
+	agent = _gemini_agent(name, instructions, model_id, temperature, api_key)
+	if backend == "record":
+		agent = model_backend.RecordingAgent(agent, model_backend.cassette_path())
+	return maybe_cached(LimitedAgent(agent))
+
+
+# Streamed events that carry a piece of the answer (agno 2.x/3.x and 1.x names)
+_CONTENT_EVENTS = {"RunContent", "RunResponseContent", "RunResponse"}
+
+
+def chunk_text(event) -> str:
+	"""Text carried by one streamed event; other events (started, completed, tool calls) yield ''."""
+	if isinstance(event, str):
+		return event
+	name = getattr(event, "event", None)
+	if name is not None and str(getattr(name, "value", name)) not in _CONTENT_EVENTS:
+		return ""
+	content = getattr(event, "content", None)
+	return content if isinstance(content, str) else ""
+
+
+def model_id(agent):
+	"""Model id an agent calls (wrappers forward the attribute), or None."""
+	return getattr(agent, "model_id", None) or getattr(getattr(agent, "model", None), "id", None)
+
+
+def _usage(out):
+	"""(input tokens, output tokens) reported by an agno response, or None."""
+	metrics = getattr(out, "metrics", None)
+	if metrics is None:
+		return None
+	if isinstance(metrics, dict):  # agno 1.x: lists of per-message counts
+		tokens_in, tokens_out = metrics.get("input_tokens"), metrics.get("output_tokens")
+		tokens_in = sum(tokens_in) if isinstance(tokens_in, list) else tokens_in
+		tokens_out = sum(tokens_out) if isinstance(tokens_out, list) else tokens_out
+	else:
+		tokens_in, tokens_out = getattr(metrics, "input_tokens", None), getattr(metrics, "output_tokens", None)
+	if isinstance(tokens_in, int) and isinstance(tokens_out, int) and (tokens_in or tokens_out):
+		return tokens_in, tokens_out
+	return None
+
+
+async def arun_agent(agent, prompt: str, on_chunk=None):
+	"""Await one agent call, using agno's async API when the agent provides it.
+
+	With `on_chunk`, the response is streamed: `on_chunk(delta)` is called for every piece of text as it
+	arrives and the full text is returned. An exception raised by `on_chunk` cancels the stream and propagates.
+	The call is recorded as an "llm.<agent name>" span with its model and token counts (and, from the rate limiter,
+	its queue_wait_s and retries).
+	"""
+	with tracing.span(f"llm.{getattr(agent, 'name', None) or 'agent'}", streamed=on_chunk is not None) as span:
+		if model_id(agent):
+			span.set(model=model_id(agent))
+		out = None
+		try:
+			out = await _arun_agent(agent, prompt, on_chunk)
+			return out
+		finally:
+			usage = _usage(out)
+			span.set(tokens_estimated=usage is None)
+			if usage is None:
+				text = getattr(out, "content", out)
+				usage = (estimate_tokens(str(prompt)), estimate_tokens(text) if isinstance(text, str) else 0)
+			span.set(tokens_in=usage[0], tokens_out=usage[1])
+
+
+async def _arun_agent(agent, prompt: str, on_chunk=None):
+	if on_chunk is None:
+		if hasattr(agent, "arun"):
+			return await agent.arun(prompt)
+		return await asyncio.to_thread(agent.run, prompt)
+	if not hasattr(agent, "arun"):
+		out = await asyncio.to_thread(agent.run, prompt)
+		text = getattr(out, "content", out)
+		text = text if isinstance(text, str) else str(text)
+		on_chunk(text)
+		return text
+	stream = agent.arun(prompt, stream=True)
+	if inspect.isawaitable(stream):  # agno 1.x returns a coroutine resolving to the iterator
+		stream = await stream
+	parts = []
+	try:
+		async for event in stream:
+			delta = chunk_text(event)
+			if delta:
+				parts.append(delta)
+				on_chunk(delta)
+	finally:
+		# If on_chunk raised to cut the generation short, close the stream so the model call is cancelled
+		aclose = getattr(stream, "aclose", None)
+		if aclose is not None:
+			await aclose()
+	return "".join(parts)
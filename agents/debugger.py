@@ -1,12 +1,17 @@
-from agno.agent import Agent
-from agno.models.google import Gemini
+from typing import TYPE_CHECKING
 
-def create_debugger_agent(model_id: str = "gemini-2.5-flash") -> Agent:
-    model = Gemini(id=model_id)
+from agents.common import build_agent
 
-    debugger = Agent(
+if TYPE_CHECKING:
+    from agno.agent import Agent
+
+def create_debugger_agent(model_id: str = "gemini-2.5-flash", temperature: float | None = None,
+                          api_key: str | None = None) -> "Agent":
+    return build_agent(
         name="debugger",
-        model=model,
+        model_id=model_id,
+        api_key=api_key,
+        temperature=temperature,
         instructions=(
             "You are a professional Python debugging assistant.\n"
             "You will receive:\n"
@@ -17,13 +22,13 @@ def create_debugger_agent(model_id: str = "gemini-2.5-flash") -> Agent:
             "- Analyze all signals.\n"
             "- Identify syntax errors, logical errors, style issues, or crashes.\n"
             "- Provide a numbered list of issues.\n"
-            "- Then provide a corrected full-file patch under a fenced block labeled ```PATCH```.\n"
-            "- The patch must contain ONLY the corrected Python file content."
+            "- Then provide a fix. Prefer a fenced block labeled ```EDIT``` holding only the top-level functions and\n"
+            "  classes you change or add, each in full, plus new imports and `# delete: name` lines for removals.\n"
+            "- Use a corrected full-file patch under a fenced block labeled ```PATCH``` only when most of the file changes.\n"
+            "- These blocks must contain ONLY Python source (and `# delete:` lines)."
         ),
     )
 
-    return debugger
-
 if __name__ == "__main__":
     d = create_debugger_agent()
     print(d.run("Test debugger agent: say hello"))
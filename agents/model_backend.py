@@ -0,0 +1,202 @@
+# agents/model_backend.py
+"""
+Offline model backends for the agent factories.
+
+MODEL_BACKEND selects what `build_agent` returns:
+  gemini  (default) an agno Agent on Gemini
+  record  the Gemini agent, with every response appended to the MODEL_CASSETTE file
+  replay  a CassetteAgent answering from MODEL_CASSETTE; no model, key or network is used
+
+A cassette is a JSON-lines file, one response per line:
+  {"agent": "debugger", "response": "...", "prompt_sha256": "...", "match": "regex", "model": "...", "latency_s": 1.2}
+Only "agent" and "response" are required. An entry with "model" only answers agents built for that
+model id (see workflows/model_routing.py); an agent with entries for its model ignores the others.
+A call is answered by, in this order:
+  1. an unused entry recorded for exactly this prompt ("prompt_sha256", written by record mode)
+  2. the first entry whose "match" regex is found in the prompt (reusable; this is how scripted
+     cassettes react to the code they are shown)
+  3. the next unused entry for the agent without "match", in file order; the last one repeats
+Step 3 also replays recorded runs whose prompts differ in details such as workspace paths.
+Each agent keeps its own place in the file, and model routing builds one agent per model. So a
+scripted response meant for an escalated call, such as a coder retry, needs a "match" or a "model".
+MODEL_LATENCY sets the simulated latency of every replayed response: seconds (default 0), or
+"recorded" to use each entry's "latency_s". Streamed replies arrive in chunks spread over it.
+"""
+import asyncio
+import hashlib
+import inspect
+import json
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import List, Optional
+
+STREAM_CHUNKS = 16
+
+
+@dataclass
+class StubResponse:
+	content: str
+	metrics: Optional[dict] = None
+
+
+class CassetteMiss(LookupError):
+	pass
+
+
+def prompt_sha256(agent: str, prompt: str) -> str:
+	return hashlib.sha256(f"{agent}\0{prompt}".encode("utf-8")).hexdigest()
+
+
+def load_cassette(path: str) -> List[dict]:
+	with open(path, "r", encoding="utf-8") as f:
+		entries = [json.loads(line) for line in f if line.strip()]
+	for i, e in enumerate(entries, 1):
+		if not isinstance(e.get("agent"), str) or not isinstance(e.get("response"), str):
+			raise ValueError(f"{path}:{i}: a cassette entry needs string 'agent' and 'response' fields")
+	return entries
+
+
+class CassetteAgent:
+	"""Agent stand-in that answers from cassette entries (see the module docstring)."""
+
+	def __init__(self, name: str, entries: List[dict], latency: Optional[float] = 0.0, instructions: str = "",
+				model_id: Optional[str] = None):
+		self.name = name
+		self.instructions = instructions
+		self.model_id = model_id
+		self.latency = latency  # None: each entry's recorded latency
+		self.calls = 0
+		self._entries = [e for e in entries if e["agent"] == name and e.get("model") == model_id]
+		if not self._entries:
+			self._entries = [e for e in entries if e["agent"] == name and "model" not in e]
+		self._used = set()
+		self._lock = threading.Lock()
+
+	def _pick(self, prompt: str) -> dict:
+		key = prompt_sha256(self.name, prompt)
+		with self._lock:
+			self.calls += 1
+			for i, e in enumerate(self._entries):
+				if e.get("prompt_sha256") == key and i not in self._used:
+					self._used.add(i)
+					return e
+			for e in self._entries:
+				if e.get("match") and re.search(e["match"], prompt):
+					return e
+			ordered = [i for i, e in enumerate(self._entries) if not e.get("match")]
+			for i in ordered:
+				if i not in self._used:
+					self._used.add(i)
+					return self._entries[i]
+			if ordered:
+				return self._entries[ordered[-1]]
+		raise CassetteMiss(f"no cassette entry for agent {self.name!r} matches the prompt")
+
+	def _delay(self, entry: dict) -> float:
+		return float(entry.get("latency_s", 0.0)) if self.latency is None else self.latency
+
+	def run(self, prompt, **kwargs):
+		entry = self._pick(str(prompt))
+		time.sleep(self._delay(entry))
+		return StubResponse(entry["response"])
+
+	def arun(self, prompt, stream: bool = False, **kwargs):
+		# Mirrors agno: a coroutine for plain calls, an async iterator of chunks when streaming
+		if stream:
+			return self._arun_stream(str(prompt))
+		return self._arun(str(prompt))
+
+	async def _arun(self, prompt):
+		entry = self._pick(prompt)
+		await asyncio.sleep(self._delay(entry))
+		return StubResponse(entry["response"])
+
+	async def _arun_stream(self, prompt):
+		entry = self._pick(prompt)
+		text = entry["response"]
+		size = max(1, -(-len(text) // STREAM_CHUNKS))
+		pieces = [text[i:i + size] for i in range(0, len(text), size)] or [""]
+		for piece in pieces:
+			await asyncio.sleep(self._delay(entry) / len(pieces))
+			yield piece
+
+
+class RecordingAgent:
+	"""Wraps an agno Agent and appends each plain or streamed response to a cassette file."""
+
+	_file_lock = threading.Lock()
+
+	def __init__(self, agent, path: str):
+		self._agent = agent
+		self._path = path
+
+	def __getattr__(self, name):
+		return getattr(self._agent, name)
+
+	def _record(self, prompt, content, seconds: float) -> None:
+		content = getattr(content, "content", content)
+		if not isinstance(content, str):
+			return
+		name = str(getattr(self._agent, "name", ""))
+		entry = {"agent": name, "prompt_sha256": prompt_sha256(name, str(prompt)), "response": content,
+				"latency_s": round(seconds, 3)}
+		with self._file_lock:
+			with open(self._path, "a", encoding="utf-8") as f:
+				f.write(json.dumps(entry) + "\n")
+
+	def run(self, prompt, **kwargs):
+		start = time.perf_counter()
+		out = self._agent.run(prompt, **kwargs)
+		if not kwargs.get("stream"):
+			self._record(prompt, out, time.perf_counter() - start)
+		return out
+
+	def arun(self, prompt, stream: bool = False, **kwargs):
+		if stream:
+			return self._arun_stream(prompt, **kwargs)
+		return self._arun(prompt, **kwargs)
+
+	async def _arun(self, prompt, **kwargs):
+		start = time.perf_counter()
+		out = await self._agent.arun(prompt, **kwargs)
+		self._record(prompt, out, time.perf_counter() - start)
+		return out
+
+	async def _arun_stream(self, prompt, **kwargs):
+		from agents.common import chunk_text
+
+		start = time.perf_counter()
+		stream = self._agent.arun(prompt, stream=True, **kwargs)
+		if inspect.isawaitable(stream):
+			stream = await stream
+		parts = []
+		try:
+			async for event in stream:
+				parts.append(chunk_text(event))
+				yield event
+		finally:
+			# a stream the caller cut short is recorded as far as it got; the replay is cut at the same point
+			self._record(prompt, "".join(parts), time.perf_counter() - start)
+
+
+def backend() -> str:
+	name = os.environ.get("MODEL_BACKEND", "gemini")
+	if name not in ("gemini", "record", "replay"):
+		raise ValueError(f"MODEL_BACKEND must be gemini, record or replay, not {name!r}")
+	return name
+
+
+def cassette_path() -> str:
+	path = os.environ.get("MODEL_CASSETTE")
+	if not path:
+		raise ValueError(f"MODEL_BACKEND={backend()} needs MODEL_CASSETTE=<path to a .jsonl cassette>")
+	return path
+
+
+def replay_agent(name: str, instructions: str = "", model_id: Optional[str] = None) -> CassetteAgent:
+	latency = os.environ.get("MODEL_LATENCY", "0")
+	return CassetteAgent(name, load_cassette(cassette_path()), None if latency == "recorded" else float(latency), instructions,
+						model_id)
@@ -1,25 +1,28 @@
 # agents/researcher.py
-from agno.agent import Agent
-from agno.models.google import Gemini
+from typing import TYPE_CHECKING
+
+from agents.common import build_agent
+
+if TYPE_CHECKING:
+	from agno.agent import Agent
 
 
 # A lightweight Researcher agent that returns concise factual answers.
 # Edit instructions to control style/length.
 
 
-def create_researcher_agent(model_id: str = "gemini-2.5-flash") -> Agent:
+def create_researcher_agent(model_id: str = "gemini-2.5-flash", api_key: str | None = None) -> "Agent":
 	"""Factory to create and return a researcher Agent instance."""
-	model = Gemini(id=model_id)
-	researcher = Agent(
+	return build_agent(
 		name="researcher",
-		model=model,
+		model_id=model_id,
+		api_key=api_key,
 		instructions=(
 			"You are a concise research assistant. When asked a question, return a short, factual answer "
 			"(2-4 sentences). If the user asks for step-by-step instructions, return a numbered list. "
 			"If you need to ask for clarification, ask one clarifying question only."
 		),
 	)
-	return researcher
 
 
 if __name__ == "__main__":
@@ -1,8 +1,12 @@
 # agents/test_writer.py
-from agno.agent import Agent
-from agno.models.google import Gemini
+from typing import TYPE_CHECKING
 
-def create_test_writer_agent(model_id: str = "gemini-2.5-flash") -> Agent:
+from agents.common import build_agent
+
+if TYPE_CHECKING:
+    from agno.agent import Agent
+
+def create_test_writer_agent(model_id: str = "gemini-2.5-flash", api_key: str | None = None) -> "Agent":
     """
     Produces pytest-style unit tests for a single Python file that contains one or more functions.
     The agent receives:
@@ -16,19 +20,18 @@ def create_test_writer_agent(model_id: str = "gemini-2.5-flash") -> Agent:
       - Keep tests deterministic and avoid network/IO
     Output must be valid Python text suitable to save as test_generated.py.
     """
-    model = Gemini(id=model_id)
     instructions = (
         "You are a test writer. Input: (1) a short spec, (2) Python file content. "
         "Produce a pytest-compatible test file only (no commentary). "
         "Name test functions with test_ prefix. Do not import anything except from the generated module. "
         "Avoid network, file or PID operations. Keep tests fast and deterministic."
     )
-    agent = Agent(
+    return build_agent(
         name="test_writer",
-        model=model,
+        model_id=model_id,
+        api_key=api_key,
         instructions=instructions,
     )
-    return agent
 
 if __name__ == "__main__":
     t = create_test_writer_agent()
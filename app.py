@@ -1,7 +1,7 @@
 import streamlit as st
 import os
-import time
-from workflows.ml_coach import autonomous_loop
+from utils.import_timing import IMPORT_SECONDS, format_import_times
+from workflows.jobs import get_default_runner
 
 st.set_page_config(page_title="Autonomous ML Coach", layout="wide")
 
@@ -14,9 +14,8 @@ st.markdown(
 # --- Sidebar for Configuration ---
 with st.sidebar:
     st.header("Configuration")
+    # The key is handed to this session's runs only; it is never written to the server's environment
     api_key = st.text_input("Enter your Google API Key", type="password")
-    if api_key:
-        os.environ["GOOGLE_API_KEY"] = api_key
 
     st.info(
         "Your API key is used for this session only and is not stored.", icon="🔒"
@@ -41,6 +40,20 @@ with st.sidebar:
         value=True,
         help="If enabled, the workflow will automatically apply patches suggested by the debugger without asking.",
     )
+    routing = st.selectbox(
+        "Model Routing",
+        options=["adaptive", "fixed"],
+        index=0 if os.environ.get("MODEL_ROUTING", "adaptive") == "adaptive" else 1,
+        help="Adaptive starts with a lighter model and escalates when the sanitizer rejects the coder's output "
+        "or the checks keep failing. Fixed uses the standard model for every agent.",
+    )
+    # The workflow, agno and the model client are imported by the first run and stay loaded for later reruns
+    if IMPORT_SECONDS:
+        st.caption(f"Startup imports: {format_import_times()}")
+
+# Runs execute on the job runner's threads; this script only submits them and renders their progress
+runner = get_default_runner()
+POLL_INTERVAL = float(os.environ.get("APP_POLL_INTERVAL", "0.5"))
 
 
 # --- Main App Body ---
@@ -61,43 +74,85 @@ if run_button:
         st.warning("Please enter a prompt.")
         st.stop()
 
-    # Create placeholders for live output
-    st.subheader("Workflow Progress")
-    status_placeholder = st.empty()
-    latest_code = ""
-
-    # Use columns to display results side-by-side
-    col1, col2 = st.columns(2)
-    with col1:
-        code_placeholder = st.empty()
-    with col2:
-        test_placeholder = st.empty()
-    debugger_placeholder = st.empty()
-
-    # The autonomous_loop is now a generator yielding status updates
-    for status in autonomous_loop(
+    previous = runner.get(st.session_state.get("job_id", ""))
+    if previous is not None and previous.active:
+        previous.cancel()  # one run per session: a new run replaces the one in progress
+    job_id = runner.submit(
         user_prompt,
         max_iters=max_iters,
         run_timeout=run_timeout,
         auto_patch_enabled=auto_patch,
-    ):
-        status_placeholder.info(status["message"])
+        routing=routing,
+        api_key=api_key,
+    )
+    st.session_state["job_id"] = job_id
+    st.query_params["job"] = job_id  # reloading the page reattaches to the run
 
-        if "code_text" in status:
-            latest_code = status["code_text"]
-            with col1:
-                st.code(latest_code, language="python", line_numbers=True)
+job_id = st.session_state.get("job_id") or st.query_params.get("job")
+job = runner.get(job_id) if job_id else None
 
-        if "test_text" in status:
-            with col2:
-                st.code(status["test_text"], language="python", line_numbers=True)
 
-        if "debugger_output" in status:
-            with debugger_placeholder.container():
-                st.subheader("Debugger Analysis")
-                st.markdown(status["debugger_output"])
+def render_progress(job, polling: bool):
+    """Current state of the run; every poll replaces the previous rendering in place."""
+    snap = job.snapshot()
+    streams = snap["streams"]
+    st.subheader("Workflow Progress")
+    if snap["status"] == "queued":
+        st.info(f"Queued behind {runner.queued_ahead(job.id)} other run(s)...")
+    else:
+        st.info(snap.get("message", "Starting..."))
 
-        time.sleep(0.5) # Small delay for better UX
+    # Partial agent output while a stage streams, its final artifact once it is done
+    research = streams.get("researcher") or snap.get("research_text")
+    if research:
+        st.markdown(research)
 
-    st.success("✅ Workflow finished!")
-    st.balloons()
+    # Use columns to display results side-by-side
+    col1, col2 = st.columns(2)
+    with col1:
+        code = streams.get("coder") or snap.get("code_text")
+        if code:
+            st.code(code, language="python", line_numbers="coder" not in streams)
+    with col2:
+        tests = streams.get("test_writer") or snap.get("test_text")
+        if tests:
+            st.code(tests, language="python", line_numbers="test_writer" not in streams)
+
+    debugger = streams.get("debugger") or snap.get("debugger_output")
+    if debugger:
+        st.subheader("Debugger Analysis")
+        st.markdown(debugger)
+
+    if snap["status"] == "awaiting_approval":
+        st.warning("The debugger suggested a patch. Apply it and continue?")
+        with st.expander("Suggested patch"):
+            st.code(snap.get("patch_text") or "", language="python")
+        apply_col, skip_col = st.columns(2)
+        if apply_col.button("Apply patch", key=f"apply-{job.id}-{snap['events']}"):
+            job.respond(True)
+        if skip_col.button("Skip patch", key=f"skip-{job.id}-{snap['events']}"):
+            job.respond(False)
+    elif job.active and st.button("⏹ Stop run", key=f"stop-{job.id}"):
+        job.cancel()
+
+    with st.expander(f"Log ({snap['events']} updates, {snap['seconds']}s)"):
+        st.text("\n".join(snap["messages"]))
+
+    if polling and not job.active:
+        st.rerun()  # the run ended: render the final state once, without polling
+
+
+if job is not None:
+    polling = job.active
+    st.fragment(run_every=POLL_INTERVAL if polling else None)(render_progress)(job, polling)
+    if job.status == "finished":
+        st.success("✅ Workflow finished!")
+        if st.session_state.get("celebrated") != job.id:
+            st.session_state["celebrated"] = job.id
+            st.balloons()
+    elif job.status == "cancelled":
+        st.warning("Run stopped.")
+    elif job.status == "error":
+        st.error(f"The run failed: {job.error}")
+elif job_id:
+    st.info("That run is no longer available. Start a new one.")
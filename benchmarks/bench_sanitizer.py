@@ -0,0 +1,132 @@
+"""
+Correctness + throughput benchmark for the coder output sanitizer.
+
+Runs the same post-processing the workflow applies to coder output
+(strip_code_fence -> sanitize_generated_code -> fix_unquoted_docstrings) over
+benchmarks/sanitizer_corpus.jsonl, once with utils.sanitizer and once with the
+previous regex implementation (benchmarks/legacy_sanitizer.py).
+
+Corpus entries: {"id", "raw", "compiles", "contains", "not_contains"}; an entry passes if
+the output compiles (when "compiles" is true) and the substring checks hold.
+
+    python -m benchmarks.bench_sanitizer [--rounds N] [--large-kb KB]
+"""
+import argparse
+import json
+import os
+import time
+import warnings
+
+from benchmarks import legacy_sanitizer
+from utils import sanitizer
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sanitizer_corpus.jsonl")
+
+
+def load_corpus(path: str = CORPUS_PATH) -> list:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def pipeline(mod, raw: str) -> str:
+    return mod.fix_unquoted_docstrings(mod.sanitize_generated_code(mod.strip_code_fence(raw)))
+
+
+def _compiles(code: str) -> bool:
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            compile(code, "<bench>", "exec")
+        return True
+    except (SyntaxError, ValueError):
+        return False
+
+
+def check(entry: dict, out: str) -> list:
+    """Failure reasons for one corpus entry (empty list = pass)."""
+    problems = []
+    if entry.get("compiles") and not _compiles(out):
+        problems.append("does not compile")
+    problems += [f"missing {s!r}" for s in entry.get("contains", []) if s not in out]
+    problems += [f"unexpected {s!r}" for s in entry.get("not_contains", []) if s in out]
+    return problems
+
+
+def large_output(kb: int) -> str:
+    """A long chatty response: prose, a shell block, then a big fenced module."""
+    funcs = []
+    i = 0
+    while sum(len(f) for f in funcs) < kb * 1024:
+        funcs.append(
+            f"def feature_{i}(xs):\n"
+            f'    """Compute feature {i}.\n\n    Returns the scaled sum of xs.\n    """\n'
+            f"    total = sum(xs)\n    return total * {i + 1} / max(len(xs), 1)\n\n\n"
+        )
+        i += 1
+    return (
+        "Sure! Below is the complete implementation. First install the requirements:\n\n"
+        "```bash\npip install numpy\n```\n\nAnd here is the code:\n\n```python\n"
+        + "".join(funcs)
+        + "```\n\nEach function computes one feature. Let me know if you want tests as well."
+    )
+
+
+def throughput(mod, texts: list, rounds: int):
+    """(MB/s of raw model output processed, number of inputs the implementation raised on)."""
+    size = sum(len(t.encode("utf-8")) for t in texts) * rounds
+    errors = 0
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for t in texts:
+            try:
+                pipeline(mod, t)
+            except Exception:
+                errors += 1
+    elapsed = time.perf_counter() - start
+    return (size / elapsed / 1e6 if elapsed > 0 else float("inf")), errors // rounds
+
+
+def _rate(mbps: float, errors: int) -> str:
+    return f"{mbps:.2f} MB/s" + (f" ({errors} inputs raised)" if errors else "")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--large-kb", type=int, default=256)
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    failures = 0
+    for name, mod in (("new", sanitizer), ("legacy", legacy_sanitizer)):
+        bad = []
+        for entry in corpus:
+            try:
+                problems = check(entry, pipeline(mod, entry["raw"]))
+            except Exception as e:
+                problems = [f"raised {type(e).__name__}: {e}"]
+            if problems:
+                bad.append((entry["id"], problems))
+        print(f"[{name}] correctness: {len(corpus) - len(bad)}/{len(corpus)} passed")
+        for entry_id, problems in bad:
+            print(f"    {entry_id}: {'; '.join(problems)}")
+        if name == "new":
+            failures = len(bad)
+
+    large = [large_output(args.large_kb)]
+    large_rounds = max(1, args.rounds // 50)
+    for name, mod in (("new", sanitizer), ("legacy", legacy_sanitizer)):
+        small = throughput(mod, [e["raw"] for e in corpus], args.rounds)
+        big = throughput(mod, large, large_rounds)
+        try:
+            out = pipeline(mod, large[0])
+            large_ok = _compiles(out) and "def feature_0(xs):" in out
+        except Exception:
+            large_ok = False
+        print(f"[{name}] corpus: {_rate(*small)}   large ({args.large_kb} KB): {_rate(*big)}"
+              + ("" if large_ok else ", wrong output"))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
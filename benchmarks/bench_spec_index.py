@@ -0,0 +1,82 @@
+"""
+Lookup latency benchmark for the researcher spec index (utils/spec_index.py).
+
+Builds an in-memory SpecIndex over a low-diversity corpus: prompts drawn from a few dozen words, so
+every word and trigram is shared by thousands of entries and no feature is selective. This is the
+worst case for candidate generation. It then reports the p50/p95 latency of lookups, and how many
+lookups of stored prompts (with extra filler words) come back with a spec of the same prompt.
+
+    python -m benchmarks.bench_spec_index [--entries N] [--queries Q] [--max-ms MS]
+
+Exits non-zero when the p95 lookup latency is above --max-ms.
+"""
+import argparse
+import random
+import statistics
+import time
+
+from utils.spec_index import SpecIndex
+from utils.tracing import percentile
+
+TASKS = ("sort", "merge", "search", "parse", "count", "filter", "group", "scale", "split", "join", "rank", "sum")
+MODIFIERS = ("fast", "stable", "recursive", "iterative", "sorted", "unique", "large", "small", "nested", "empty")
+OBJECTS = ("list", "numbers", "strings", "matrix", "records", "words", "values", "items")
+
+
+def low_diversity_prompts(n: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    return [
+        f"{rng.choice(TASKS)} {rng.choice(MODIFIERS)} {rng.choice(OBJECTS)} "
+        f"{rng.choice(MODIFIERS)} {rng.choice(OBJECTS)} {rng.choice(TASKS)}"
+        for _ in range(n)
+    ]
+
+
+def build_index(n: int, seed: int = 0) -> SpecIndex:
+    index = SpecIndex()
+    for i, prompt in enumerate(low_diversity_prompts(n, seed)):
+        index.add(prompt, f"spec {i}")
+    return index
+
+
+def bench(index: SpecIndex, queries: int, seed: int = 1) -> dict:
+    rng = random.Random(seed)
+    index.lookup("warm up")  # document norms are computed on the first lookup
+    unseen = low_diversity_prompts(queries, seed + 1)
+    times, found = [], 0
+    for i in range(queries):
+        doc_id = rng.randrange(len(index))
+        index.lookup(unseen[i])
+        times.append(index.last_lookup_ms)
+        # the filler words are all stopwords: the stored prompt (or a reordering of it) scores 1.0
+        spec, score = index.lookup("please write python code to " + index.prompts[doc_id])
+        times.append(index.last_lookup_ms)
+        found += spec is not None and score > 0.999
+    return {
+        "p50_ms": statistics.median(times),
+        "p95_ms": percentile(times, 0.95),
+        "found": found / queries,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--entries", type=int, default=30000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--max-ms", type=float, default=1.0, help="fail when the p95 lookup latency is above this")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index = build_index(args.entries)
+    build_s = time.perf_counter() - start
+    res = bench(index, args.queries)
+    print(f"[spec-index] {args.entries} low-diversity entries (built in {build_s:.1f}s): "
+          f"lookup p50 {res['p50_ms']:.3f} ms p95 {res['p95_ms']:.3f} ms, stored prompt found {res['found']:.0%}")
+    if res["p95_ms"] > args.max_ms:
+        print(f"FAIL p95 {res['p95_ms']:.3f} ms is above {args.max_ms} ms")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
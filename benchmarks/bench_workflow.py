@@ -0,0 +1,148 @@
+"""
+Offline end-to-end benchmark for the autonomous workflow.
+
+Runs `autonomous_loop` over the scenarios in benchmarks/workflow_scenarios.jsonl with
+MODEL_BACKEND=replay (agents/model_backend.py), so no model, API key or network is involved and the
+timings measure the workflow itself: sanitizer, inspection, test runner, triage, patching.
+
+Scenario entries: {"id", "prompt", "max_iters", "green_at", "cassette": [cassette entries]}, where
+"green_at" is the iteration the scenario is expected to pass in. Per scenario the report gives the
+end-to-end p50/p95 seconds, the p50 of each stage's time per run (from the run's trace, see
+utils/tracing.py), iterations-to-green and the tracemalloc peak of one run. A run that does not reach
+green in "green_at" iterations is a failure. `--save` writes the figures as JSON, and `--baseline`
+compares with a saved file: slower p50s (beyond --tolerance) and more iterations are regressions.
+
+    python -m benchmarks.bench_workflow [--rounds N] [--latency S] [--only ID] [--save F] [--baseline F]
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+from utils.tracing import percentile
+
+SCENARIOS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "workflow_scenarios.jsonl")
+# Spans reported per stage, in workflow order
+STAGES = ("stage.research", "stage.coder", "stage.checks", "stage.test_writer", "stage.pytest", "stage.debugger",
+          "subprocess.run_file", "subprocess.pytest")
+
+
+def load_scenarios(path: str = SCENARIOS_PATH) -> list:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def run_scenario(scenario: dict, root: str) -> dict:
+    """One offline run of `scenario`; returns its figures."""
+    from utils.workspace import Workspace
+    from workflows.ml_coach import autonomous_loop
+
+    cassette = os.path.join(root, f"{scenario['id']}.cassette.jsonl")
+    with open(cassette, "w", encoding="utf-8") as f:
+        for entry in scenario["cassette"]:
+            f.write(json.dumps(entry) + "\n")
+    os.environ["MODEL_CASSETTE"] = cassette
+    ws = Workspace.create(root=root)
+    iterations, last = 0, {}
+    start = time.perf_counter()
+    for status in autonomous_loop(scenario["prompt"], max_iters=scenario.get("max_iters", 3), auto_patch_enabled=True,
+                                  workspace=ws):
+        if status.get("message", "").startswith("==== ITERATION"):
+            iterations += 1
+        last.update(status)
+    seconds = time.perf_counter() - start
+    shutil.rmtree(ws.path, ignore_errors=True)
+    green = bool(last.get("syntax_ok")) and last.get("run_retcode") == 0 and last.get("pytest_code") == 0
+    summary = last.get("trace_summary", {})
+    return {
+        "seconds": seconds,
+        "iterations": iterations,
+        "green": green,
+        "stages": {name: summary[name]["total_s"] for name in STAGES if name in summary},
+    }
+
+
+def bench(scenario: dict, rounds: int, root: str) -> dict:
+    runs = [run_scenario(scenario, root) for _ in range(rounds)]
+    tracemalloc.start()
+    run_scenario(scenario, root)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    seconds = [r["seconds"] for r in runs]
+    return {
+        "p50_s": round(statistics.median(seconds), 3),
+        "p95_s": round(percentile(seconds, 0.95), 3),
+        "iterations": max(r["iterations"] for r in runs),
+        "green_rate": sum(r["green"] and r["iterations"] <= scenario["green_at"] for r in runs) / len(runs),
+        "stages_p50_s": {
+            name: round(statistics.median(r["stages"].get(name, 0.0) for r in runs), 3)
+            for name in STAGES if any(name in r["stages"] for r in runs)
+        },
+        "peak_mb": round(peak / 1e6, 2),
+    }
+
+
+def regressions(results: dict, baseline: dict, tolerance: float) -> list:
+    problems = []
+    for sid, res in results.items():
+        old = baseline.get(sid)
+        if old is None:
+            continue
+        if res["p50_s"] > old["p50_s"] * (1 + tolerance) + 0.05:
+            problems.append(f"{sid}: p50 {res['p50_s']}s vs {old['p50_s']}s")
+        if res["iterations"] > old["iterations"]:
+            problems.append(f"{sid}: {res['iterations']} iterations vs {old['iterations']}")
+        if res["green_rate"] < old["green_rate"]:
+            problems.append(f"{sid}: green rate {res['green_rate']} vs {old['green_rate']}")
+    return problems
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--latency", default="0", help='simulated seconds per model response, or "recorded"')
+    parser.add_argument("--only", action="append", help="run only this scenario id (repeatable)")
+    parser.add_argument("--save", help="write the results as JSON to this path")
+    parser.add_argument("--baseline", help="compare with results saved by --save")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed relative p50 slowdown vs the baseline")
+    args = parser.parse_args()
+
+    os.environ.update({"MODEL_BACKEND": "replay", "MODEL_LATENCY": args.latency, "AUTO_PATCH": "1"})
+    for var in ("AGENT_CACHE", "SPEC_REUSE", "TRACE_DIR"):
+        os.environ.pop(var, None)  # every round must do the same work
+    os.environ["CHECK_CACHE"] = "0"
+
+    scenarios = [s for s in load_scenarios() if not args.only or s["id"] in args.only]
+    results = {}
+    root = tempfile.mkdtemp(prefix="bench_workflow_")
+    try:
+        for scenario in scenarios:
+            res = results[scenario["id"]] = bench(scenario, args.rounds, root)
+            stages = "  ".join(f"{n.removeprefix('stage.')} {s:.2f}" for n, s in res["stages_p50_s"].items())
+            print(f"[{scenario['id']}] e2e p50 {res['p50_s']:.2f}s p95 {res['p95_s']:.2f}s, "
+                  f"{res['iterations']} iteration(s), green {res['green_rate']:.0%}, heap peak {res['peak_mb']} MB")
+            print(f"    stage p50 (s): {stages}")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    failed = [sid for sid, res in results.items() if res["green_rate"] < 1]
+    for sid in failed:
+        print(f"FAIL {sid}: not green within the expected iterations")
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    problems = []
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            problems = regressions(results, json.load(f), args.tolerance)
+        for p in problems:
+            print(f"REGRESSION {p}")
+    return 1 if failed or problems else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
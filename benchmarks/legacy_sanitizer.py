@@ -0,0 +1,120 @@
+"""
+Frozen copy of the regex-based sanitizer that lived in workflows/ml_coach.py before utils/sanitizer.py.
+Only used by bench_sanitizer.py as the baseline for speed and correctness comparisons.
+"""
+import re
+
+
+def strip_code_fence(s: str) -> str:
+    if not s:
+        return s
+    s = s.strip()
+    # If it's a fenced block, remove fence and return inner content
+    fence_match = re.search(r"```(?:python)?\n(.*?)\n```", s, flags=re.DOTALL | re.IGNORECASE)
+    if fence_match:
+        return fence_match.group(1).strip()
+    # otherwise remove leading/trailing triple-backticks if present
+    s = re.sub(r"^```(?:python)?\s*", "", s, flags=re.IGNORECASE)
+    s = re.sub(r"\s*```$", "", s, flags=re.IGNORECASE)
+    return s
+
+
+def _clean_docstring_noise(code: str) -> str:
+    if not code:
+        return code
+    # Replace multiple adjacent triple-quote sequences with one
+    code = re.sub(r'(["\']{3}){2,}', r'\1', code)
+    # If starts with single triple quote and not closed, close it
+    if code.startswith('"""') and code.count('"""') == 1:
+        code = code + '\n"""'
+    if code.startswith("'''") and code.count("'''") == 1:
+        code = code + "\n'''"
+    # Remove stray triple-quote-only lines
+    code = re.sub(r'^[ \t]*("{3}|\'{3})[ \t]*$', '', code, flags=re.MULTILINE)
+    # Collapse duplicated docstrings
+    code = re.sub(r'("""\s*""")+', '"""', code)
+    return code.strip()
+
+def sanitize_generated_code(raw: str) -> str:
+    if not raw:
+        return ""
+    s = raw.strip()
+    # 1) prefer fenced block
+    fence_match = re.search(r"```(?:python)?\n(.*?)\n```", s, flags=re.DOTALL | re.IGNORECASE)
+    if fence_match:
+        code = fence_match.group(1).strip()
+        return _clean_docstring_noise(code)
+    # 2) remove lines that are exactly quote sequences
+    s = re.sub(r'^[ \t]*("{3,}|\'{3,})[ \t]*$', '', s, flags=re.MULTILINE)
+    # 3) accidental '"""def' -> remove leading quotes
+    s = re.sub(r'^(?P<q>["\']{3,})\s*(?=(def |class |import |from ))', '', s, count=1)
+    # 4) find first python code token
+    token_search = re.search(r'\b(def |class |import |from )', s)
+    if token_search:
+        pos = token_search.start()
+        leading = s[:pos].strip()
+        code_part = s[pos:].lstrip()
+        if leading:
+            leading = re.sub(r'(^```(?:python)?\s*|\s*```$)', '', leading, flags=re.IGNORECASE).strip()
+            leading = re.sub(r'(^["\']{3,}\s*|\s*["\']{3,}$)', '', leading).strip()
+            leading = re.sub(r'\n\s*\n+', '\n\n', leading).strip()
+            doc = '"""' + leading + '"""' + "\n\n"
+            cleaned = doc + _clean_docstring_noise(code_part)
+            return cleaned
+        else:
+            return _clean_docstring_noise(code_part)
+    # 5) no tokens found -> strip fences and return best-effort
+    s = re.sub(r'(^```(?:python)?\s*|\s*```$)', '', s, flags=re.IGNORECASE).strip()
+    s = _clean_docstring_noise(s)
+    return s
+
+
+def fix_unquoted_docstrings(code: str) -> str:
+    if not code:
+        return code
+    lines = code.splitlines()
+    out_lines = []
+    i = 0
+    n = len(lines)
+    while i < n:
+        line = lines[i]
+        out_lines.append(line)
+        m = re.match(r'^(\s*)def\s+\w+\s*\(.*\)\s*:\s*$', line)
+        if m:
+            indent = m.group(1) + "    "
+            j = i + 1
+            while j < n and lines[j].strip() == "":
+                out_lines.append(lines[j])
+                j += 1
+            doc_lines = []
+            while j < n:
+                nxt = lines[j]
+                if not nxt.startswith(indent) and nxt.strip() != "":
+                    break
+                stripped = nxt[len(indent):] if nxt.startswith(indent) else nxt.lstrip()
+                if re.match(r'^(?:return\b|if\b|for\b|while\b|with\b|assert\b|import\b|from\b|def\b|class\b)', stripped):
+                    break
+                if stripped.startswith('"""') or stripped.startswith("'''") or stripped.startswith('"') or stripped.startswith("'"):
+                    break
+                doc_lines.append(stripped)
+                j += 1
+            doc_lines_clean = [dl.rstrip() for dl in doc_lines]
+            non_empty = [dl for dl in doc_lines_clean if dl.strip() != ""]
+            if len(non_empty) >= 1:
+                remove_count = 0
+                while remove_count < (j - (i + 1)):
+                    out_lines.pop()
+                    remove_count += 1
+                docstring = '\n'.join(non_empty)
+                docstring_lines = [indent + '"""' + (docstring.splitlines()[0] if docstring else "")]
+                rem = docstring.splitlines()[1:]
+                for l in rem:
+                    docstring_lines.append(indent + l)
+                docstring_lines.append(indent + '"""')
+                for dl in docstring_lines:
+                    out_lines.append(dl)
+                if j < n and lines[j].strip() != "":
+                    out_lines.append(indent.rstrip())
+                i = j - 1
+        i += 1
+    return "\n".join(out_lines)
@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+from utils.agent_cache import AgentResponseCache, CachedAgent
+from workflows import ml_coach
+
+CODE = "import math\n\n\ndef area(r):\n    return math.pi * r ** 2\n"
+
+
+class FakeCoder:
+    """Streams scripted answers in small chunks and counts the model calls."""
+
+    name = "coder"
+    instructions = "write code"
+
+    def __init__(self, answers):
+        self.answers = list(answers)
+        self.calls = 0
+
+    def arun(self, prompt, stream=False):
+        answer = self.answers[min(self.calls, len(self.answers) - 1)]
+        self.calls += 1
+        if not stream:
+            async def whole():
+                return answer
+            return whole()
+
+        async def chunks():
+            for i in range(0, len(answer), 16):
+                yield answer[i:i + 16]
+        return chunks()
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return AgentResponseCache(str(tmp_path / "cache"))
+
+
+def _run(agent, streamed=True):
+    stream = ml_coach._StreamEmitter(lambda status: None, "coder", "Coder", interval=0) if streamed else None
+    return asyncio.run(ml_coach.arun_coder_with_retries(agent, "area of a circle", stream=stream, retries=2))
+
+
+def test_stream_stopped_at_the_closing_fence_is_cached(cache, monkeypatch):
+    monkeypatch.setenv("STREAM_VALIDATE", "1")
+    # the validator stops reading at the closing fence, before the trailing chatter
+    coder = FakeCoder(["```python\n" + CODE + "```\n\nLet me know if you need anything else!" * 20])
+    first = _run(CachedAgent(coder, cache))
+    second = _run(CachedAgent(coder, cache))
+    assert first == second == CODE.strip()
+    assert coder.calls == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_stream_read_to_the_end_is_cached(cache, monkeypatch):
+    monkeypatch.setenv("STREAM_VALIDATE", "0")
+    coder = FakeCoder([CODE])
+    _run(CachedAgent(coder, cache))
+    _run(CachedAgent(coder, cache))
+    assert coder.calls == 1
+
+
+def test_rejected_answers_are_not_served_to_the_retry(cache):
+    coder = FakeCoder(["Sorry, I cannot do that.", "Sorry, I cannot do that.", CODE])
+    out = _run(CachedAgent(coder, cache), streamed=False)
+    assert out == CODE.strip()
+    assert coder.calls == 3
+    # the rejected first answer was dropped, the accepted retry answer was kept
+    again = FakeCoder(["Sorry, I cannot do that."])
+    assert _run(CachedAgent(again, cache), streamed=False) == CODE.strip()
+    assert again.calls == 1
@@ -0,0 +1,109 @@
+import pytest
+
+from utils.patcher import PatchError, apply_edits, apply_unified_diff, resolve_patch
+
+SOURCE = '''"""Stats helpers."""
+import math
+
+
+def mean(xs):
+    return sum(xs) / len(xs)
+
+
+def std(xs):
+    m = mean(xs)
+    return math.sqrt(sum((x - m) ** 2 for x in xs) / len(xs))
+
+
+if __name__ == "__main__":
+    print(mean([1, 2, 3]))
+'''
+
+
+def test_apply_edits_replaces_only_the_named_definition():
+    code, changes = apply_edits(SOURCE, "def mean(xs):\n    return sum(xs) / max(len(xs), 1)\n")
+    assert changes == ["replace mean"]
+    assert "return sum(xs) / max(len(xs), 1)" in code
+    assert "def std(xs):\n    m = mean(xs)" in code
+    assert code.endswith('if __name__ == "__main__":\n    print(mean([1, 2, 3]))\n')
+
+
+def test_apply_edits_adds_imports_and_definitions_before_main_block():
+    edit = "import statistics\n\ndef median(xs):\n    return statistics.median(xs)\n"
+    code, changes = apply_edits(SOURCE, edit)
+    assert changes == ["import statistics", "add median"]
+    assert code.index("import statistics") < code.index("def mean")
+    assert code.index("def median") < code.index('if __name__ == "__main__":')
+    compile(code, "<patched>", "exec")
+
+
+def test_apply_edits_skips_imports_the_file_already_has():
+    _, changes = apply_edits(SOURCE, "import math\n\ndef mean(xs):\n    return 0\n")
+    assert changes == ["replace mean"]
+
+
+def test_apply_edits_deletes_definitions():
+    code, changes = apply_edits(SOURCE, "# delete: std\n")
+    assert changes == ["delete std"]
+    assert "def std" not in code
+    compile(code, "<patched>", "exec")
+
+
+@pytest.mark.parametrize("edit, message", [
+    ("# delete: missing\n", "no such top-level definition"),
+    ("print('hi')\n", "unsupported top-level statement"),
+    ("def mean(:\n", "does not parse"),
+    ('"""Only a docstring."""\n', "changes nothing"),
+])
+def test_apply_edits_rejects_unusable_edits(edit, message):
+    with pytest.raises(PatchError, match=message):
+        apply_edits(SOURCE, edit)
+
+
+def test_apply_unified_diff_locates_hunks_by_context():
+    diff = (
+        "--- a/generated_code.py\n+++ b/generated_code.py\n"
+        "@@ -40,2 +40,2 @@\n"  # wrong line hint: the context decides
+        " def mean(xs):\n"
+        "-    return sum(xs) / len(xs)\n"
+        "+    return sum(xs) / max(len(xs), 1)\n"
+    )
+    code, changes = apply_unified_diff(SOURCE, diff)
+    assert changes == ["hunk at line 5 (-2/+2)"]
+    assert "return sum(xs) / max(len(xs), 1)" in code
+    assert code.count("def mean") == 1
+
+
+def test_apply_unified_diff_tolerates_whitespace_drift_and_lost_blank_context():
+    diff = (
+        "@@ -6,5 +6,5 @@\n"
+        "     return sum(xs) / len(xs)   \n"  # trailing spaces the file does not have
+        "\n"                                # blank context lines without their leading space
+        "\n"
+        " def std(xs):\n"
+        "-    m = mean(xs)\n"
+        "+    m = mean(list(xs))\n"
+    )
+    code, _ = apply_unified_diff(SOURCE, diff)
+    assert "    m = mean(list(xs))\n" in code
+
+
+@pytest.mark.parametrize("diff, message", [
+    ("just some text\n", "no hunks"),
+    ("@@ -1,1 +1,1 @@\n-def nothing_like_this():\n+def f():\n", "does not match"),
+    ("@@ -1,1 +1,1 @@\n*import math\n", "malformed"),
+])
+def test_apply_unified_diff_rejects_bad_diffs(diff, message):
+    with pytest.raises(PatchError, match=message):
+        apply_unified_diff(SOURCE, diff)
+
+
+def test_resolve_patch_falls_back_to_full_file_when_edit_fails():
+    answer = "```EDIT\n# delete: missing\n```\n\n```PATCH\nprint('full')\n```"
+    patch = resolve_patch(SOURCE, answer)
+    assert patch.kind == "full"
+    assert patch.code == "print('full')"
+
+
+def test_resolve_patch_without_a_block_is_none():
+    assert resolve_patch(SOURCE, "Looks fine to me.") is None
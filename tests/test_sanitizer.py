@@ -0,0 +1,84 @@
+import pytest
+
+from benchmarks.bench_sanitizer import check, load_corpus, pipeline
+from utils import sanitizer
+from utils.sanitizer import repair_code, sanitize_generated_code, strip_code_fence
+
+CORPUS = load_corpus()
+
+
+@pytest.mark.parametrize("entry", CORPUS, ids=[e["id"] for e in CORPUS])
+def test_corpus_entry(entry):
+    assert check(entry, pipeline(sanitizer, entry["raw"])) == []
+
+
+def test_valid_code_is_returned_untouched():
+    code = 'def f():\n    """Doc.\n\n    More.\n    """\n    return """"""\n'
+    assert repair_code(code) == code
+
+
+def test_duplicated_quotes_are_only_collapsed_on_the_failing_line():
+    code = 'EMPTY = """"""\n\n\ndef f():\n    """Doc.""""""\n    return EMPTY\n'
+    fixed = repair_code(code)
+    compile(fixed, "<fixed>", "exec")
+    assert fixed.startswith('EMPTY = """"""\n')
+    assert '    """Doc."""\n' in fixed
+
+
+@pytest.mark.parametrize("raw", [
+    "def f(:\n    return 1\n",           # not repairable by rule
+    "def f():\nreturn 1\n",
+    "class A:\nreturn 1\n",
+])
+def test_unrepairable_code_is_returned_as_is_for_the_debugger(raw):
+    assert repair_code(raw) == raw
+
+
+def test_prose_only_answer_is_not_turned_into_code():
+    raw = "I'm sorry, but I can't help with that request."
+    out = sanitize_generated_code(strip_code_fence(raw))
+    assert "def " not in out and "import " not in out
+
+
+def test_shell_block_is_skipped_for_the_python_block():
+    raw = "Install:\n\n```bash\npip install numpy\n```\n\n```python\nimport numpy as np\n```\n"
+    assert sanitize_generated_code(strip_code_fence(raw)) == "import numpy as np"
+
+
+def _count_compiles(monkeypatch):
+    calls = []
+    real_compile = compile
+    monkeypatch.setattr(sanitizer, "compile", lambda *a, **k: calls.append(1) or real_compile(*a, **k), raising=False)
+    return calls
+
+
+def test_code_without_marks_is_not_compiled(monkeypatch):
+    calls = _count_compiles(monkeypatch)
+    assert repair_code("x = 1\n") == "x = 1\n"
+    assert repair_code("def f(:\n    return 1\n") == "def f(:\n    return 1\n"
+    assert calls == []
+
+
+def test_prose_lines_are_repaired_without_compiling(monkeypatch):
+    calls = _count_compiles(monkeypatch)
+    fixed = repair_code("def f(x):\n    Squares the input.\n    return x * x\n\nHope this helps!\n")
+    assert fixed == 'def f(x):\n    """Squares the input."""\n    return x * x\n\n# Hope this helps!\n'
+    assert calls == []
+
+
+def test_repeated_calls_check_the_code_every_time(monkeypatch):
+    # "Works for" could start a comprehension line, so the compiler decides; there is no cross-call memo
+    calls = _count_compiles(monkeypatch)
+    assert repair_code("Works for ints.\nx = 1\n") == "# Works for ints.\nx = 1\n"
+    first = len(calls)
+    repair_code("Works for ints.\nx = 1\n")
+    assert first and len(calls) == 2 * first
+
+
+@pytest.mark.parametrize("code", [
+    '# use """ for docstrings\nx = 1\n',
+    'Q = \'"""\'\n\n\ndef f():\n    """Doc\n    more words here\n    """\n',
+    's = "hello " \\\n    "world"\nx = a \\\n    or b\n',
+])
+def test_valid_code_that_looks_marked_is_left_alone(code):
+    assert repair_code(code) == code
@@ -0,0 +1,62 @@
+import pytest
+
+from benchmarks.bench_spec_index import bench, build_index, low_diversity_prompts
+from utils.spec_index import SpecIndex
+
+
+@pytest.fixture(scope="module")
+def large_index():
+    return build_index(30000)
+
+
+def test_near_duplicate_prompt_reuses_the_spec():
+    index = SpecIndex()
+    index.add("write merge sort", "MERGE")
+    index.add("parse a csv file into records", "CSV")
+    spec, score = index.lookup("implement merge sort in python")
+    assert spec == "MERGE" and score > 0.99
+
+
+def test_different_prompt_is_below_the_threshold():
+    index = SpecIndex()
+    index.add("write merge sort", "MERGE")
+    spec, score = index.lookup("train a linear regression model")
+    assert spec is None and score < index.threshold
+
+
+def test_entries_are_replayed_from_the_file(tmp_path):
+    path = str(tmp_path / "index.jsonl")
+    SpecIndex(path).add("binary search over a sorted list", "BSEARCH")
+    index = SpecIndex(path)
+    assert len(index) == 1
+    assert index.lookup("binary search in a sorted list")[0] == "BSEARCH"
+
+
+def test_corpus_without_selective_features_still_finds_stored_prompts():
+    index = SpecIndex()
+    prompts = low_diversity_prompts(2000)
+    for i, prompt in enumerate(prompts):
+        index.add(prompt, f"spec {i}")
+    spec, score = index.lookup(prompts[1234])
+    assert score > 0.99
+    assert prompts[int(spec.split()[1])] == prompts[1234]
+
+
+def test_scanned_postings_are_capped():
+    index = SpecIndex()
+    index.MAX_SCANNED_POSTINGS = 100
+    for i in range(1000):
+        index.add("sort list" if i < 500 else "sort list tree", f"spec {i}")
+    # both query features have 1000-entry postings: only the newest 100 documents are scored,
+    # so the older exact matches are out of reach
+    spec, score = index.lookup("sort list")
+    assert spec is None and 0.5 < score < index.threshold
+    index.MAX_SCANNED_POSTINGS = 2000
+    assert index.lookup("sort list")[0] is not None
+
+
+def test_lookup_latency_on_a_low_diversity_corpus(large_index):
+    res = bench(large_index, 200)
+    print(f"30k low-diversity entries: lookup p50 {res['p50_ms']:.3f} ms p95 {res['p95_ms']:.3f} ms")
+    assert res["p50_ms"] < 1.0
+    assert res["found"] > 0.95
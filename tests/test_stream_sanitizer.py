@@ -0,0 +1,68 @@
+import pytest
+
+from utils.stream_sanitizer import StopGeneration, StreamingCodeValidator
+
+
+def _feed(text, chunk=23, **kwargs):
+    """Feed `text` in chunks; returns the StopGeneration raised, or None if the whole text was accepted."""
+    validator = StreamingCodeValidator(**kwargs)
+    try:
+        for i in range(0, len(text), chunk):
+            validator.feed(text[i:i + chunk])
+    except StopGeneration as stop:
+        return stop
+    return None
+
+
+def test_plain_code_streams_to_the_end():
+    assert _feed("import os\n\n\ndef main():\n    print(os.getcwd())\n\n\nif __name__ == '__main__':\n    main()\n") is None
+
+
+def test_long_prose_without_code_is_aborted():
+    stop = _feed("I am sorry, but I cannot write that program for you. " * 40)
+    assert stop is not None and not stop.accept
+    assert "prose" in stop.reason
+
+
+def test_prose_under_the_limit_is_kept_waiting():
+    assert _feed("Here is the plan before the code. " * 10) is None
+
+
+def test_module_docstring_is_not_prose():
+    text = '"""\n' + "Trains a model on the dataset and reports its metrics.\n" * 40 + '"""\nimport os\n'
+    assert _feed(text) is None
+
+
+def test_runaway_code_fences_are_aborted():
+    stop = _feed("Here you go:\n```\n```\n```\n```\n```\n")
+    assert stop is not None and not stop.accept
+    assert stop.reason == "runaway code fences"
+
+
+def test_broken_indentation_is_aborted():
+    stop = _feed("def main():\n    x = 1\n      y = 2\n    return x\n")
+    assert stop is not None and not stop.accept
+    assert stop.reason.startswith("broken indentation")
+
+
+def test_other_syntax_errors_are_left_to_the_sanitizer():
+    assert _feed("def main(:\n    return 1\n") is None
+
+
+def test_closed_python_fence_is_accepted_and_trimmed():
+    text = "Sure!\n\n```python\ndef f():\n    return 1\n```\n\nThis function returns one. " * 3
+    stop = _feed(text)
+    assert stop is not None and stop.accept
+    assert stop.text == "Sure!\n\n```python\ndef f():\n    return 1\n```"
+
+
+def test_closed_shell_fence_is_not_accepted():
+    stop = _feed("Install first:\n```bash\npip install numpy\n```\n\n```python\nimport numpy as np\n```\n")
+    assert stop is not None and stop.accept
+    assert stop.text.endswith("```python\nimport numpy as np\n```")
+
+
+@pytest.mark.parametrize("chunk", [1, 7, 4096])
+def test_decision_does_not_depend_on_chunking(chunk):
+    stop = _feed("```python\nx = 1\n```\ntrailing text", chunk=chunk)
+    assert stop is not None and stop.accept and stop.text == "```python\nx = 1\n```"
@@ -0,0 +1,104 @@
+import pytest
+
+from utils.static_check import check_source
+from utils.test_runner import PytestRecord
+from workflows.triage import triage
+
+CODE = '''def calculate_mean(xs):
+    return sum(xs) / len(xs)
+
+
+def load_data(path):
+    return [1, 2, 3]
+
+
+if __name__ == "__main__":
+    print(calculate_mean(load_data("x")))
+'''
+
+
+def _triage(code=CODE, run_code=0, run_stderr="", pytest_code=0, test_output="", test_text=None, records=()):
+    diagnostics = check_source(code)
+    syntax_ok = not any(d.code == "E999" for d in diagnostics)
+    return triage(code, syntax_ok, diagnostics, run_code, run_stderr, pytest_code, test_output, test_text, records)
+
+
+def _cannot_import(name):
+    return f"ImportError: cannot import name '{name}' from 'generated_code' (/tmp/ws/generated_code.py)"
+
+
+def test_all_green_passes_without_debugger():
+    verdict = _triage()
+    assert verdict.kind == "pass"
+    assert verdict.code is None and verdict.test_text is None
+
+
+def test_syntax_error_escalates():
+    assert _triage("def f(:\n    pass\n").kind == "escalate"
+
+
+def test_missing_stdlib_import_is_added():
+    code = "def root(x):\n    return math.sqrt(x)\n"
+    verdict = _triage(code, run_code=None, pytest_code=None)
+    assert verdict.kind == "fixed"
+    assert verdict.fixes == ["missing-import: import math"]
+    assert verdict.code.startswith("import math\n")
+    assert _triage(verdict.code, run_code=0, pytest_code=None).kind == "pass"
+
+
+def test_missing_import_also_explains_failing_tests():
+    code = "def root(x):\n    return math.sqrt(x)\n"
+    records = [PytestRecord("test_generated.py::test_root", "failed", message="NameError: name 'math' is not defined")]
+    verdict = _triage(code, run_code=None, pytest_code=1, records=records)
+    assert verdict.kind == "fixed"
+
+
+def test_unknown_undefined_name_escalates():
+    verdict = _triage("def f():\n    return helper()\n", run_code=None, pytest_code=None)
+    assert verdict.kind == "escalate"
+
+
+def test_unexplained_run_failure_escalates():
+    verdict = _triage(run_code=1, run_stderr="ZeroDivisionError: division by zero")
+    assert verdict.kind == "escalate"
+
+
+@pytest.mark.parametrize("wanted, existing", [
+    ("calcualte_mean", "calculate_mean"),   # typo
+    ("calculateMean", "calculate_mean"),    # case / underscores only
+    ("LoadData", "load_data"),
+])
+def test_test_import_of_a_variant_name_is_aliased(wanted, existing):
+    verdict = _triage(pytest_code=2, test_output=_cannot_import(wanted))
+    assert verdict.kind == "fixed"
+    assert verdict.fixes == [f"test-import-alias: {wanted} = {existing}"]
+    assert f"{wanted} = {existing}\n" in verdict.code
+    # the alias goes before the __main__ block
+    assert verdict.code.index(f"{wanted} = {existing}") < verdict.code.index("if __name__")
+
+
+@pytest.mark.parametrize("wanted", ["save_data", "calculate_median", "standard_deviation"])
+def test_test_import_of_a_different_name_escalates(wanted):
+    verdict = _triage(pytest_code=2, test_output=_cannot_import(wanted))
+    assert verdict.kind == "escalate"
+
+
+def test_ambiguous_alias_escalates():
+    code = "def encode_a(x):\n    return x\n\n\ndef encode_b(x):\n    return x\n"
+    verdict = _triage(code, pytest_code=2, test_output=_cannot_import("encode_c"))
+    assert verdict.kind == "escalate"
+
+
+def test_placeholder_module_import_is_redirected():
+    test_text = "import pytest\nfrom solution import calculate_mean\n\n\ndef test_mean():\n    assert calculate_mean([2]) == 2\n"
+    verdict = _triage(pytest_code=2, test_output="ModuleNotFoundError: No module named 'solution'", test_text=test_text)
+    assert verdict.kind == "fixed"
+    assert verdict.code is None
+    assert "from generated_code import calculate_mean\n" in verdict.test_text
+    assert verdict.test_text.count("\n") == test_text.count("\n")
+
+
+def test_placeholder_importing_undefined_names_escalates():
+    test_text = "from solution import calculate_median\n"
+    verdict = _triage(pytest_code=2, test_output="ModuleNotFoundError: No module named 'solution'", test_text=test_text)
+    assert verdict.kind == "escalate"
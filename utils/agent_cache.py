@@ -0,0 +1,221 @@
+"""
+Content-addressed on-disk cache for agent responses.
+
+Entries are keyed by sha256(model id + instructions + prompt) and stored one JSON file per key.
+Reads refresh the file mtime, so evicting the oldest mtimes first gives LRU order once the
+directory grows past `max_bytes`. Entries older than `ttl` seconds are treated as misses.
+"""
+import hashlib
+import inspect
+import json
+import os
+import threading
+import time
+from typing import Optional
+
+
+class AgentResponseCache:
+    def __init__(self, directory: str = ".agent_cache", max_bytes: int = 64 * 1024 * 1024, ttl: float = 24 * 3600):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def make_key(model_id: str, instructions: str, prompt: str) -> str:
+        h = hashlib.sha256()
+        for part in (model_id, instructions, prompt):
+            h.update(part.encode("utf-8"))
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".json")
+
+    def get(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        with self._lock:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                self.misses += 1
+                return None
+            if self.ttl and time.time() - entry.get("created", 0) > self.ttl:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                self.misses += 1
+                return None
+            try:
+                os.utime(path)  # mark as recently used
+            except OSError:
+                pass
+            self.hits += 1
+            return entry.get("content")
+
+    def put(self, key: str, content: str, model_id: str = "") -> None:
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with self._lock:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"created": time.time(), "model_id": model_id, "content": content}, f)
+            os.replace(tmp, path)
+            self._evict()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def _evict(self) -> None:
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for e in it:
+                if not e.name.endswith(".json"):
+                    continue
+                try:
+                    st = e.stat()
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, e.path))
+                total += st.st_size
+        if total <= self.max_bytes:
+            return
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            for name in os.listdir(self.directory):
+                if name.endswith(".json"):
+                    os.remove(os.path.join(self.directory, name))
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+        }
+
+
+class CachedAgent:
+    """Wraps an agno Agent so plain `run(prompt)` / `arun(prompt)` calls are served from an AgentResponseCache.
+
+    Calls with extra keyword arguments (sessions, ...) bypass the cache. A streamed answer is stored once
+    the stream has been read to the end; a caller that stops reading early because it already has what it
+    needs stores that text with `remember(prompt, text)`. `forget(prompt)` drops the entry for a prompt
+    whose answer was rejected, so asking again reaches the model.
+    Any other attribute is forwarded to the wrapped agent.
+    """
+
+    def __init__(self, agent, cache: AgentResponseCache):
+        self._agent = agent
+        self._cache = cache
+
+    def __getattr__(self, name):
+        return getattr(self._agent, name)
+
+    def _key(self, prompt: str) -> str:
+        model = getattr(self._agent, "model", None)
+        model_id = str(getattr(model, "id", ""))
+        temperature = getattr(model, "temperature", None)
+        if temperature is not None:  # sampling variants of one agent must not share entries
+            model_id += f"@t={temperature}"
+        return self._cache.make_key(model_id, str(getattr(self._agent, "instructions", "")), str(prompt))
+
+    def _store(self, key: str, out) -> None:
+        content = getattr(out, "content", out)
+        if isinstance(content, str) and content:
+            self._cache.put(key, content, model_id=str(getattr(getattr(self._agent, "model", None), "id", "")))
+
+    def remember(self, prompt, text: str) -> None:
+        self._store(self._key(prompt), text)
+
+    def forget(self, prompt) -> None:
+        self._cache.delete(self._key(prompt))
+
+    def run(self, prompt, **kwargs):
+        if kwargs:
+            return self._agent.run(prompt, **kwargs)
+        key = self._key(prompt)
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached
+        out = self._agent.run(prompt)
+        self._store(key, out)
+        return out
+
+    def arun(self, prompt, stream: bool = False, **kwargs):
+        # Mirrors agno: a coroutine for plain calls, an async iterator of chunks when streaming
+        if kwargs:
+            return self._agent.arun(prompt, stream=stream, **kwargs)
+        if stream:
+            return self._arun_stream(prompt)
+        return self._arun(prompt)
+
+    async def _arun(self, prompt):
+        key = self._key(prompt)
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached
+        out = await self._agent.arun(prompt)
+        self._store(key, out)
+        return out
+
+    async def _arun_stream(self, prompt):
+        from agents.common import chunk_text
+
+        key = self._key(prompt)
+        cached = self._cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+        stream = self._agent.arun(prompt, stream=True)
+        if inspect.isawaitable(stream):
+            stream = await stream
+        parts = []
+        async for event in stream:
+            parts.append(chunk_text(event))
+            yield event
+        self._store(key, "".join(parts))
+
+
+_default_cache: Optional[AgentResponseCache] = None
+
+
+def get_default_cache() -> Optional[AgentResponseCache]:
+    """Process-wide cache configured from env; None unless AGENT_CACHE=1."""
+    global _default_cache
+    if os.environ.get("AGENT_CACHE", "") != "1":
+        return None
+    if _default_cache is None:
+        _default_cache = AgentResponseCache(
+            directory=os.environ.get("AGENT_CACHE_DIR", ".agent_cache"),
+            max_bytes=int(float(os.environ.get("AGENT_CACHE_MAX_MB", "64")) * 1024 * 1024),
+            ttl=float(os.environ.get("AGENT_CACHE_TTL", str(24 * 3600))),
+        )
+    return _default_cache
+
+
+def maybe_cached(agent):
+    cache = get_default_cache()
+    return CachedAgent(agent, cache) if cache is not None else agent
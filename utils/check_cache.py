@@ -0,0 +1,129 @@
+"""
+Fingerprints of generated code and a cache of verified outcomes.
+
+`code_fingerprint` hashes the AST dump of a source, so versions that differ only in comments, blank
+lines or formatting share a fingerprint (sources that do not parse are hashed by their stripped
+lines). The workflow uses fingerprints to notice repeated states: a patch that does not change the
+code, or one that returns to a version already checked, would only replay the same verdict.
+
+`CheckCache` keeps the outcome of the expensive checks per fingerprint: the run of the file, keyed by
+(code, run timeout), and the full pytest result, keyed by (code, tests). Static checks are not cached;
+they run in memory and their line numbers must match the exact text. Outcomes that depend on the
+machine rather than the code (timeouts, worker failures) are never stored. A cached outcome keeps the
+line numbers of the version it was recorded for, which only differ for formatting-only changes.
+"""
+import ast
+import hashlib
+import os
+import threading
+import warnings
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from utils import inspector
+from utils import test_runner
+from utils.test_runner import PytestResult
+
+
+def code_fingerprint(source: Optional[str]) -> str:
+    """Short hash of the normalized source; "" for no source."""
+    if source is None:
+        return ""
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            normalized = ast.dump(ast.parse(source))
+    except (SyntaxError, ValueError):
+        normalized = "\n".join(line.rstrip() for line in source.strip().splitlines())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()[:16]
+
+
+def state_fingerprint(code: Optional[str], tests: Optional[str]) -> str:
+    """Fingerprint of a (code, tests) state of the workflow."""
+    return f"{code_fingerprint(code)}:{code_fingerprint(tests)}"
+
+
+class CheckCache:
+    """Thread-safe LRU of run and pytest outcomes keyed by fingerprints."""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[tuple, object]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key: tuple):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def _put(self, key: tuple, value) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_run(self, code: str, timeout: float) -> Optional[Tuple[int, str, str]]:
+        return self._get(("run", code_fingerprint(code), timeout))
+
+    def put_run(self, code: str, timeout: float, result: Tuple[int, str, str]) -> None:
+        if result[0] >= 0:  # -1 timed out, -2 runner failure
+            self._put(("run", code_fingerprint(code), timeout), tuple(result))
+
+    def get_pytest(self, code: str, tests: str) -> Optional[PytestResult]:
+        return self._get(("pytest", code_fingerprint(code), code_fingerprint(tests)))
+
+    def put_pytest(self, code: str, tests: str, result: PytestResult) -> None:
+        if result.returncode < 0 or any(r.outcome in ("timeout", "not run") for r in result.records):
+            return
+        self._put(("pytest", code_fingerprint(code), code_fingerprint(tests)), result)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+
+_default_cache: Optional[CheckCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache() -> Optional[CheckCache]:
+    """Process-wide cache; disabled with CHECK_CACHE=0."""
+    global _default_cache
+    if os.environ.get("CHECK_CACHE", "1") == "0":
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = CheckCache(int(os.environ.get("CHECK_CACHE_ENTRIES", "256")))
+        return _default_cache
+
+
+def cached_run_file(code: str, path: str, timeout: float, cwd: Optional[str] = None) -> Tuple[Tuple[int, str, str], bool]:
+    """inspector.run_file for `code` (already saved at `path`), reusing a cached outcome; returns (result, cached)."""
+    cache = get_default_cache()
+    result = cache.get_run(code, timeout) if cache is not None else None
+    if result is not None:
+        return result, True
+    result = inspector.run_file(path, timeout=timeout, cwd=cwd)
+    if cache is not None:
+        cache.put_run(code, timeout, result)
+    return result, False
+
+
+def cached_run_pytest(code: str, tests: str, test_path: str, cwd: Optional[str] = None) -> Tuple[PytestResult, bool]:
+    """Full test_runner.run_pytest_structured run, reusing a cached result; returns (result, cached)."""
+    cache = get_default_cache()
+    result = cache.get_pytest(code, tests) if cache is not None else None
+    if result is not None:
+        return result, True
+    result = test_runner.run_pytest_structured(test_path, cwd=cwd)
+    if cache is not None:
+        cache.put_pytest(code, tests, result)
+    return result, False
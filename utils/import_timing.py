@@ -0,0 +1,38 @@
+"""
+Import-time measurement for startup.
+
+Heavy dependencies (agno and the Gemini client) are imported on first use through `timed_import`,
+which records how long the first import of each module took in IMPORT_SECONDS. Modules record their
+own import time with `record`. The CLI prints `format_import_times()` at the end of a run and the
+Streamlit app shows it in the sidebar. `python -X importtime` gives the per-module breakdown.
+"""
+import importlib
+import sys
+import threading
+import time
+from typing import Dict
+
+IMPORT_SECONDS: Dict[str, float] = {}
+_lock = threading.Lock()
+
+
+def record(name: str, seconds: float) -> None:
+    with _lock:
+        IMPORT_SECONDS.setdefault(name, seconds)
+
+
+def timed_import(name: str):
+    """`importlib.import_module(name)`, recording the time of the first import."""
+    if name in sys.modules:
+        # import_module still waits for a module another thread is importing right now
+        return importlib.import_module(name)
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    record(name, time.perf_counter() - start)
+    return module
+
+
+def format_import_times() -> str:
+    with _lock:
+        items = list(IMPORT_SECONDS.items())
+    return ", ".join(f"{name} {seconds:.2f}s" for name, seconds in items) or "(nothing measured)"
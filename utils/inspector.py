@@ -1,14 +1,34 @@
 import subprocess
 import sys
-import py_compile
 import os
+from typing import List, Optional
+
+from utils import tracing
+from utils.static_check import Diagnostic, check_source, format_diagnostics
+from utils.worker_pool import get_default_pool
+
+def check_code(source: str, path: Optional[str] = None) -> List[Diagnostic]:
+    """Syntax, undefined-name, unused-import and import-target checks on in-memory source.
+
+    `path` is where the code lives (or will run from); it is used for messages and import resolution.
+    """
+    search_path = os.path.dirname(os.path.abspath(path)) if path else None
+    return check_source(source, path or "<generated>", search_path)
+
+def syntax_status(diagnostics: List[Diagnostic], path: str = "<generated>"):
+    """The (ok, message) pair run_syntax_check has always returned, from check_code's diagnostics."""
+    errors = [d for d in diagnostics if d.code == "E999"]
+    if errors:
+        return False, format_diagnostics(errors, path)
+    return True, "Syntax OK"
 
 def run_syntax_check(path: str):
     try:
-        py_compile.compile(path, doraise=True)
-        return True, "Syntax OK"
-    except py_compile.PyCompileError as e:
+        with open(path, "r", encoding="utf-8") as f:
+            source = f.read()
+    except (OSError, UnicodeDecodeError) as e:
         return False, str(e)
+    return syntax_status(check_source(source, path), path)
 
 def run_flake8(path: str):
     try:
@@ -22,10 +42,22 @@ def run_flake8(path: str):
     except FileNotFoundError:
         return False, "flake8 not installed"
 
-def run_file(path: str, timeout: int = 10):
+def run_file(path: str, timeout: int = 10, cwd: str | None = None):
+    with tracing.subprocess_span("subprocess.run_file", timeout=timeout) as span:
+        code, out, err = _run_file(path, timeout, cwd)
+        span.set(returncode=code, output_bytes=len(out.encode("utf-8")) + len(err.encode("utf-8")))
+        return code, out, err
+
+def _run_file(path: str, timeout: int, cwd: str | None):
+    pool = get_default_pool()
+    if pool is not None:
+        try:
+            return pool.run_file(path, timeout=timeout, cwd=cwd)
+        except Exception as e:
+            return -2, "", f"Runtime error: {e}"
     try:
         completed = subprocess.run(
-            [sys.executable, path], capture_output=True, text=True, timeout=timeout
+            [sys.executable, os.path.abspath(path)], capture_output=True, text=True, timeout=timeout, cwd=cwd
         )
         return completed.returncode, completed.stdout, completed.stderr
     except subprocess.TimeoutExpired:
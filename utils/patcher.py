@@ -0,0 +1,256 @@
+"""
+Compact debugger patches.
+
+Besides a full corrected file in a ```PATCH``` block, the debugger may answer with
+  ```EDIT```  only the top-level functions/classes it changes or adds, written out in full, plus any
+              new imports or module-level assignments and `# delete: name, other` lines;
+  ```DIFF```  a unified diff of generated_code.py (line numbers are only a hint, hunks are located by
+              their context lines).
+`resolve_patch` turns the answer into the complete patched file and checks that it parses. A compact
+patch that cannot be applied falls back to a ```PATCH``` block in the same answer, otherwise it raises
+PatchError so the caller can ask for the full file.
+"""
+import ast
+import re
+import warnings
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+PATCH_INSTRUCTIONS = (
+    "If you propose a fix, prefer a compact patch: a fenced block labeled ```EDIT``` containing only the "
+    "top-level functions and classes you change or add, each written out in full, plus any new imports "
+    "or module-level constants, and a `# delete: name1, name2` line for definitions to remove. "
+    "Only when the change touches most of the file, give the complete corrected file inside a fenced "
+    "block labeled ```PATCH``` instead. Nothing else may appear inside these blocks."
+)
+
+_BLOCK_RE = {kind: re.compile(rf"```{label}[ \t]*\n?(.*?)\s*```", re.DOTALL)
+             for kind, label in (("edit", "EDIT"), ("diff", "DIFF"), ("full", "PATCH"))}
+_DELETE_RE = re.compile(r"^#\s*delete:\s*(.+)$", re.IGNORECASE | re.MULTILINE)
+_HUNK_RE = re.compile(r"^@@ -(\d+)(?:,\d+)? \+\d+(?:,\d+)? @@")
+_DEF_LINE_RE = re.compile(r"^(?:async\s+def|def|class)\s+(\w+)")
+
+
+class PatchError(ValueError):
+    pass
+
+
+@dataclass
+class Patch:
+    kind: str                 # edit | diff | full
+    code: str                 # the complete patched file
+    patch_chars: int          # size of the block the debugger wrote
+    changes: List[str] = field(default_factory=list)
+
+
+def _parse(source: str, what: str) -> ast.Module:
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            return ast.parse(source)
+    except (SyntaxError, ValueError) as e:
+        raise PatchError(f"{what} does not parse: {e}") from None
+
+
+def is_main_guard(node: ast.AST) -> bool:
+    return (
+        isinstance(node, ast.If) and isinstance(node.test, ast.Compare)
+        and isinstance(node.test.left, ast.Name) and node.test.left.id == "__name__"
+    )
+
+
+def _node_name(node: ast.AST) -> Optional[str]:
+    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+        return node.name
+    if isinstance(node, ast.Assign) and len(node.targets) == 1 and isinstance(node.targets[0], ast.Name):
+        return node.targets[0].id
+    if isinstance(node, ast.AnnAssign) and isinstance(node.target, ast.Name):
+        return node.target.id
+    if is_main_guard(node):
+        return "__main__"
+    return None
+
+
+def _span(node: ast.AST) -> Tuple[int, int]:
+    """0-based [start, end) line range of a top-level statement, decorators included."""
+    start = min([node.lineno] + [d.lineno for d in getattr(node, "decorator_list", [])])
+    return start - 1, node.end_lineno
+
+
+class _Layout:
+    """Where the named top-level statements and the import block of a file are."""
+
+    def __init__(self, lines: List[str]):
+        self.spans: Dict[str, Tuple[int, int]] = {}
+        self.imports: List[str] = []
+        self.import_end = 0
+        self.end = len(lines)
+        try:
+            tree = ast.parse("".join(lines))
+        except (SyntaxError, ValueError):
+            self._scan(lines)  # broken file: locate definitions by their column-0 header lines
+            return
+        for i, node in enumerate(tree.body):
+            if isinstance(node, (ast.Import, ast.ImportFrom)):
+                self.imports.append(ast.dump(node))
+                self.import_end = node.end_lineno
+            elif i == 0 and isinstance(node, ast.Expr) and isinstance(node.value, ast.Constant):
+                self.import_end = node.end_lineno  # module docstring
+            name = _node_name(node)
+            if name is not None:
+                self.spans.setdefault(name, _span(node))
+                if name == "__main__":
+                    self.end = _span(node)[0]
+
+    def _scan(self, lines: List[str]) -> None:
+        current, start, decorated = None, 0, None
+        for i, line in enumerate(lines + ["<end>"]):
+            if not line.strip() or line[0] in " \t#)]}":
+                continue
+            if current is not None:
+                end = i
+                while end > start and not lines[end - 1].strip():
+                    end -= 1
+                self.spans.setdefault(current, (start, end))
+                current = None
+            if line.startswith("@"):
+                decorated = i if decorated is None else decorated
+                continue
+            m = _DEF_LINE_RE.match(line)
+            if m:
+                current, start = m.group(1), (i if decorated is None else decorated)
+            elif line.startswith("if __name__"):
+                current, start = "__main__", i
+                self.end = min(self.end, i)
+            elif line.startswith(("import ", "from ")):
+                self.import_end = i + 1
+            decorated = None
+
+
+def apply_edits(source: str, edit: str) -> Tuple[str, List[str]]:
+    """Splice the definitions in `edit` into `source`; returns (new source, change descriptions)."""
+    tree = _parse(edit, "EDIT block")
+    edit_lines = edit.splitlines(keepends=True)
+    lines = source.splitlines(keepends=True)
+    if lines and not lines[-1].endswith("\n"):
+        lines[-1] += "\n"
+    layout = _Layout(lines)
+    ops = []  # (start, end, order, replacement lines)
+    changes = []
+    for order, node in enumerate(tree.body):
+        if isinstance(node, ast.Expr) and isinstance(node.value, ast.Constant) and order == 0:
+            continue  # a docstring heading the edit, not part of the file
+        start, end = _span(node)
+        text = "".join(edit_lines[start:end])
+        if not text.endswith("\n"):
+            text += "\n"
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            if ast.dump(node) not in layout.imports:
+                ops.append((layout.import_end, layout.import_end, order, [text]))
+                changes.append(ast.unparse(node))
+            continue
+        name = _node_name(node)
+        if name is None:
+            raise PatchError(f"unsupported top-level statement in EDIT block (line {node.lineno})")
+        if name in layout.spans:
+            s, e = layout.spans[name]
+            ops.append((s, e, order, [text]))
+            changes.append(f"replace {name}")
+        elif name == "__main__":
+            ops.append((len(lines), len(lines), order, ["\n\n", text]))
+            changes.append("add __main__ block")
+        elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+            ops.append((layout.import_end, layout.import_end, order, ["\n", text]))
+            changes.append(f"add {name}")
+        else:
+            ops.append((layout.end, layout.end, order, [text, "\n\n"] if layout.end < len(lines) else ["\n\n", text]))
+            changes.append(f"add {name}")
+    for names in _DELETE_RE.findall(edit):
+        for name in filter(None, (n.strip() for n in names.split(","))):
+            if name not in layout.spans:
+                raise PatchError(f"cannot delete '{name}': no such top-level definition")
+            s, e = layout.spans[name]
+            while e < len(lines) and not lines[e].strip():
+                e += 1  # and the blank lines that separated it from the next statement
+            ops.append((s, e, -1, []))
+            changes.append(f"delete {name}")
+    if not ops:
+        raise PatchError("EDIT block changes nothing")
+    ranges = sorted((s, e) for s, e, _, _ in ops if e > s)
+    if any(a_end > b_start for (_, a_end), (b_start, _) in zip(ranges, ranges[1:])):
+        raise PatchError("EDIT block touches the same definition twice")
+    # bottom-up; at one position replacements go before insertions, insertions keep the EDIT order
+    for start, end, _, new in sorted(ops, key=lambda op: (op[0], op[1] > op[0], op[2]), reverse=True):
+        lines[start:end] = new
+    return "".join(lines), changes
+
+
+def _hunks(diff: str) -> List[Tuple[int, List[str], List[str]]]:
+    """(hinted 0-based start, old lines, new lines) per hunk; lines without newline."""
+    hunks = []
+    current = None
+    for line in diff.splitlines():
+        m = _HUNK_RE.match(line)
+        if m:
+            current = (int(m.group(1)) - 1, [], [])
+            hunks.append(current)
+        elif line.startswith(("---", "+++")) and current is None:
+            continue
+        elif current is not None:
+            tag, body = (line[0], line[1:]) if line else (" ", "")  # blank context lines often lose their space
+            if tag in " -":
+                current[1].append(body)
+            if tag in " +":
+                current[2].append(body)
+            if tag not in " -+\\":
+                raise PatchError(f"malformed DIFF line: {line!r}")
+    if not hunks:
+        raise PatchError("DIFF block has no hunks")
+    return hunks
+
+
+def apply_unified_diff(source: str, diff: str) -> Tuple[str, List[str]]:
+    lines = source.splitlines()
+    changes = []
+    offset = 0
+    for hint, old, new in _hunks(diff):
+        def matches(at, norm):
+            return all(norm(lines[at + k]) == norm(old[k]) for k in range(len(old)))
+        found = None
+        for norm in (lambda s: s, lambda s: s.rstrip(), lambda s: s.strip()):
+            candidates = [i for i in range(len(lines) - len(old) + 1) if matches(i, norm)]
+            if candidates:
+                found = min(candidates, key=lambda i: abs(i - (hint + offset)))
+                break
+        if found is None:
+            raise PatchError(f"DIFF hunk near line {hint + 1} does not match the file")
+        lines[found:found + len(old)] = new
+        offset += len(new) - len(old)
+        changes.append(f"hunk at line {found + 1} (-{len(old)}/+{len(new)})")
+    return "\n".join(lines) + "\n", changes
+
+
+def extract_block(text: str, kind: str) -> Optional[str]:
+    m = _BLOCK_RE[kind].search(text or "")
+    return m.group(1).strip("\n") if m else None
+
+
+def resolve_patch(source: str, debugger_text: str) -> Optional[Patch]:
+    """The patched file described by the debugger's answer; None if it contains no patch block."""
+    errors = []
+    for kind, apply in (("edit", apply_edits), ("diff", apply_unified_diff)):
+        block = extract_block(debugger_text, kind)
+        if block is None:
+            continue
+        try:
+            code, changes = apply(source, block)
+            _parse(code, "patched file")
+            return Patch(kind, code, len(block), changes)
+        except PatchError as e:
+            errors.append(f"{kind.upper()}: {e}")
+    full = extract_block(debugger_text, "full")
+    if full is not None and full.strip():
+        return Patch("full", full.strip(), len(full), ["full file"])
+    if errors:
+        raise PatchError("; ".join(errors))
+    return None
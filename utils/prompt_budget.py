@@ -0,0 +1,203 @@
+"""
+Token budget for the debugger prompt.
+
+`fit_sections` takes the prompt sections (CODE, RUNTIME_STDOUT, PYTEST_STDOUT, ...) and a total
+token budget. Sections that fit their share of the budget are kept verbatim and their unused share
+goes to the others. Every section over its share is reduced by a section-specific rule, keeping what
+the debugger needs most:
+  CODE          the functions/classes named in `focus` (reached by failing tests, seen in tracebacks)
+                stay whole, other bodies are elided down to their signature, then head/tail truncation
+  *_STDERR      the last traceback with its final frames and exception, then the tail of the rest
+  PYTEST_STDOUT failure headers, `>` source lines, `E` assertion lines, locations and the summary
+  FAILED_TESTS  per-test messages cut shorter
+  everything    head/tail truncation at line boundaries, with an "elided" marker in between
+Token counts are estimates (~4 characters per token), so the budget bounds prompt size rather than
+matching the model's tokenizer exactly.
+"""
+import ast
+import re
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from utils.stream_sanitizer import estimate_tokens
+
+# Share of the budget per section when everything is over budget; unknown sections weigh 0.05
+SECTION_WEIGHTS = {
+    "CODE": 0.40,
+    "FAILED_TESTS": 0.18,
+    "RUNTIME_STDERR": 0.12,
+    "PYTEST_STDOUT": 0.10,
+    "STATIC_CHECKS": 0.06,
+    "RUNTIME_STDOUT": 0.06,
+    "PYTEST_STDERR": 0.04,
+    "SYNTAX_CHECK": 0.02,
+    "PYTEST_RETURN_CODE": 0.02,
+}
+ELIDED_BODY = "...  # body elided"
+_TRACEBACK_START = "Traceback (most recent call last):"
+_FRAME_FUNC_RE = re.compile(r'(?:File "[^"]*generated_code\.py", line \d+, in |generated_code\.py:\d+: in )(\w+)')
+_PYTEST_KEEP_RE = re.compile(r"^(?:_{3,} .* _{3,}|={3,} .* ={3,}|E |>|\S+\.py:\d+:|(?:FAILED|ERROR) )")
+
+
+@dataclass
+class BudgetReport:
+    budget: int
+    before: int = 0
+    after: int = 0
+    sections: Dict[str, Tuple[int, int]] = field(default_factory=dict)
+    code_elided: bool = False  # CODE lost bodies or lines: a full-file answer would drop them
+
+    def trimmed(self) -> List[str]:
+        return [name for name, (b, a) in self.sections.items() if a < b]
+
+    def as_dict(self) -> dict:
+        return {
+            "budget_tokens": self.budget, "tokens_before": self.before, "tokens_after": self.after,
+            "trimmed": self.trimmed(), "sections": {n: {"before": b, "after": a} for n, (b, a) in self.sections.items()},
+        }
+
+
+def _marker(lines: int, tokens: int) -> str:
+    return f"[... {lines} lines (~{tokens} tokens) elided ...]"
+
+
+def truncate_text(text: str, budget: int, head_share: float = 0.3) -> str:
+    """Keep the head and (the larger) tail of `text` within ~`budget` tokens, at line boundaries."""
+    if estimate_tokens(text) <= budget:
+        return text
+    chars = max(0, budget * 4 - 60)  # room for the marker
+    head_chars = int(chars * head_share)
+    tail_chars = chars - head_chars
+    head, tail = text[:head_chars], text[len(text) - tail_chars:] if tail_chars else ""
+    # prefer whole lines unless a single line is longer than the kept part
+    if "\n" in head:
+        head = head[:head.rfind("\n") + 1]
+    if "\n" in tail:
+        tail = tail[tail.find("\n") + 1:]
+    middle = text[len(head):len(text) - len(tail)]
+    return f"{head}{_marker(middle.count(chr(10)) + 1, estimate_tokens(middle))}\n{tail}"
+
+
+def condense_traceback(text: str, budget: int, frames: int = 3) -> str:
+    """The last traceback (its final `frames` frames and the exception), then as much earlier output as fits."""
+    idx = text.rfind(_TRACEBACK_START)
+    if idx < 0:
+        return truncate_text(text, budget, head_share=0.1)
+    before, lines = text[:idx], text[idx:].splitlines()
+    starts = [i for i, ln in enumerate(lines) if ln.startswith('  File "')]
+    if len(starts) > frames:
+        dropped = starts[-frames] - starts[0]
+        lines = lines[:1] + [f"  [... {len(starts) - frames} frames ({dropped} lines) elided ...]"] + lines[starts[-frames]:]
+    tb = "\n".join(lines)
+    if estimate_tokens(tb) > budget:
+        return truncate_text(tb, budget, head_share=0.2)
+    rest = budget - estimate_tokens(tb)
+    return (truncate_text(before, rest, head_share=0.1) if before.strip() and rest > 20 else "") + tb
+
+
+def condense_pytest_output(text: str, budget: int) -> str:
+    """Failure headers, failing source lines (`>`), assertion details (`E`), locations and summaries."""
+    kept, skipped = [], 0
+    for line in text.splitlines():
+        if _PYTEST_KEEP_RE.match(line):
+            if skipped:
+                kept.append(f"    [... {skipped} lines elided ...]")
+                skipped = 0
+            kept.append(line)
+        else:
+            skipped += 1
+    if skipped:
+        kept.append(f"    [... {skipped} lines elided ...]")
+    return truncate_text("\n".join(kept), budget, head_share=0.6)
+
+
+def traceback_functions(*texts: str, frames: int = 5) -> Set[str]:
+    """Names of generated_code.py functions in the innermost `frames` frames of each text's tracebacks."""
+    return {m for t in texts if t for m in _FRAME_FUNC_RE.findall(t)[-frames:]}
+
+
+def focus_code(code: str, budget: int, focus: Iterable[str] = ()) -> Tuple[str, bool]:
+    """(code within ~`budget` tokens, whether anything was left out); `focus` definitions are kept whole."""
+    if estimate_tokens(code) <= budget:
+        return code, False
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        return truncate_text(code, budget, head_share=0.5), True
+    focus = set(focus)
+    lines = code.splitlines()
+    # largest unfocused definitions first, until the rest fits
+    candidates = sorted(
+        (n for n in tree.body
+         if isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)) and n.name not in focus and n.body),
+        key=lambda n: n.end_lineno - n.body[0].lineno, reverse=True,
+    )
+    replace = {}
+    size = estimate_tokens(code)
+    for node in candidates:
+        if size <= budget:
+            break
+        first = node.body[0]
+        start = first.lineno - 1 if not (isinstance(first, ast.Expr) and isinstance(first.value, ast.Constant)) \
+            else first.end_lineno  # keep the docstring
+        if start >= node.end_lineno:
+            continue
+        indent = " " * first.col_offset
+        replace[start] = (node.end_lineno, f"{indent}{ELIDED_BODY} ({node.end_lineno - start} lines)")
+        size -= estimate_tokens("\n".join(lines[start:node.end_lineno]))
+    out, i = [], 0
+    while i < len(lines):
+        if i in replace:
+            end, stub = replace[i]
+            out.append(stub)
+            i = end
+        else:
+            out.append(lines[i])
+            i += 1
+    return truncate_text("\n".join(out), budget, head_share=0.5), True
+
+
+def _allocate(sizes: Dict[str, int], budget: int) -> Dict[str, int]:
+    """Water-filling: sections under their weighted share keep their size, the rest split what is left."""
+    alloc, remaining, pending = {}, budget, set(sizes)
+    while pending:
+        weight = {n: SECTION_WEIGHTS.get(n, 0.05) for n in pending}
+        total = sum(weight.values())
+        share = {n: remaining * weight[n] / total for n in pending}
+        fits = {n for n in pending if sizes[n] <= share[n]}
+        if not fits:
+            alloc.update({n: int(share[n]) for n in pending})
+            break
+        for n in fits:
+            alloc[n] = sizes[n]
+            remaining -= sizes[n]
+        pending -= fits
+    return alloc
+
+
+def fit_sections(sections: Dict[str, str], budget: int, focus: Iterable[str] = (),
+                 failed_tests: Optional[Callable[[int], str]] = None) -> Tuple[Dict[str, str], BudgetReport]:
+    """Reduce `sections` to ~`budget` tokens in total. `failed_tests(max_chars)` re-renders FAILED_TESTS shorter."""
+    sizes = {n: estimate_tokens(t) for n, t in sections.items()}
+    report = BudgetReport(budget, before=sum(sizes.values()))
+    out = dict(sections)
+    if report.before > budget:
+        for name, limit in _allocate(sizes, budget).items():
+            text = sections[name]
+            if sizes[name] <= limit:
+                continue
+            if name == "CODE":
+                text, report.code_elided = focus_code(text, limit, focus)
+            elif name.endswith("STDERR"):
+                text = condense_traceback(text, limit)
+            elif name == "PYTEST_STDOUT":
+                text = condense_pytest_output(text, limit)
+            elif name == "FAILED_TESTS" and failed_tests is not None:
+                max_chars = 1500
+                while estimate_tokens(text) > limit and max_chars > 100:
+                    max_chars //= 2
+                    text = failed_tests(max_chars)
+            out[name] = truncate_text(text, limit)
+    report.sections = {n: (sizes[n], estimate_tokens(out[n])) for n in sections}
+    report.after = sum(a for _, a in report.sections.values())
+    return out, report
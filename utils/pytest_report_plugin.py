@@ -0,0 +1,85 @@
+"""
+pytest plugin used by test_runner.run_pytest_structured (loaded with `-p utils.pytest_report_plugin`).
+
+  --report-jsonl=PATH      append one JSON object per event: {"event": "collected", "nodeids": [...]},
+                           {"event": "start", "nodeid"} and {"event": "report", "nodeid", "when",
+                           "outcome", "duration", "message"}, where a test stopped by the per-test
+                           timeout reports outcome "timeout"; lines are flushed as they happen, so a
+                           killed run still leaves the results of the tests that finished
+  --per-test-timeout=SECS  fail a single test that runs longer than SECS (SIGALRM, main thread only)
+"""
+import json
+import signal
+import threading
+
+import pytest
+
+MAX_MESSAGE_CHARS = 2000
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("ml_coach")
+    group.addoption("--report-jsonl", default=None, help="write per-test results as JSON lines to this path")
+    group.addoption("--per-test-timeout", type=float, default=0.0, help="timeout in seconds for each test")
+
+
+def pytest_configure(config):
+    path = config.getoption("report_jsonl")
+    timeout = config.getoption("per_test_timeout")
+    if path or timeout > 0:
+        config.pluginmanager.register(_Reporter(path, timeout), "ml_coach_reporter")
+
+
+class _Reporter:
+    def __init__(self, path, timeout: float):
+        self._f = open(path, "a", encoding="utf-8") if path else None
+        self.timeout = timeout
+        self._timed_out = set()
+
+    def _write(self, record: dict) -> None:
+        if self._f is not None:
+            self._f.write(json.dumps(record) + "\n")
+            self._f.flush()
+
+    def pytest_unconfigure(self, config):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+    def pytest_collection_finish(self, session):
+        self._write({"event": "collected", "nodeids": [item.nodeid for item in session.items]})
+
+    def pytest_runtest_logstart(self, nodeid, location):
+        self._write({"event": "start", "nodeid": nodeid})
+
+    def pytest_runtest_logreport(self, report):
+        message, outcome = "", report.outcome
+        if report.nodeid in self._timed_out and report.when == "call":
+            outcome = "timeout"
+        if report.failed:
+            message = report.longreprtext
+        elif report.skipped and isinstance(report.longrepr, tuple):
+            message = str(report.longrepr[2])
+        self._write({
+            "event": "report", "nodeid": report.nodeid, "when": report.when, "outcome": outcome,
+            "duration": report.duration, "message": message[-MAX_MESSAGE_CHARS:],
+        })
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_runtest_call(self, item):
+        timeout = self.timeout
+        if timeout <= 0 or not hasattr(signal, "SIGALRM") or threading.current_thread() is not threading.main_thread():
+            yield
+            return
+
+        def on_timeout(signum, frame):
+            self._timed_out.add(item.nodeid)
+            pytest.fail(f"Timeout: test exceeded {timeout:g}s", pytrace=False)
+
+        previous = signal.signal(signal.SIGALRM, on_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+        try:
+            yield
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
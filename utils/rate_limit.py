@@ -0,0 +1,370 @@
+"""
+Shared limits, backoff and retries for model calls.
+
+`RateLimiter` holds a token bucket for requests per minute and one for model tokens per minute, plus
+a cap on calls in flight. A call reserves one request and its estimated prompt tokens before it
+starts, waiting until both buckets can pay, then takes an in-flight slot; its output tokens are
+charged when it ends, so the token bucket may go negative and hold back later calls. Buckets start
+full and refill continuously, so a burst of up to one minute's quota passes at once.
+
+With a `state_file` the limits are shared by every process that uses the same file: bucket levels
+live in that file, updated under an exclusive flock, and in-flight slots are flocks on
+`<state_file>.slot<N>` files, which the OS releases when a process dies.
+
+`LimitedAgent` applies the process-wide limiter (env below) to an agent and retries retryable
+failures with jittered exponential backoff. Those are quota/429, 5xx/unavailable, timeouts and
+connection errors. A streamed call is only retried before its first chunk. Time spent queueing and
+the retry count are added to the current trace span (`queue_wait_s`, `retries`).
+  LLM_RPM, LLM_TPM        requests / tokens per minute (0 = unlimited, the default)
+  LLM_MAX_IN_FLIGHT       concurrent calls (0 = unlimited, the default)
+  LLM_RETRIES             retries per call (default 4)
+  LLM_BACKOFF_BASE/MAX    backoff base and cap in seconds (default 1 / 30)
+  RATE_LIMIT_FILE         share the limits across processes through this file
+"""
+import asyncio
+import inspect
+import json
+import os
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+from utils import tracing
+from utils.stream_sanitizer import estimate_tokens
+
+try:
+    import fcntl
+except ImportError:  # not on Windows: limits stay per process
+    fcntl = None
+
+RETRYABLE_STATUS = (408, 429, 500, 502, 503, 504)
+_RETRYABLE_TEXT = re.compile(
+    r"\b(?:429|500|502|503|504|resource[_ ]exhausted|quota|rate.?limit|unavailable|overloaded|deadline|timed? ?out)\b",
+    re.IGNORECASE,
+)
+_RETRY_AFTER_RE = re.compile(r"retry(?:[_ ]?delay|[_ -]?after| in)\W{0,4}(\d+(?:\.\d+)?)\s*s", re.IGNORECASE)
+
+
+def is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, (ConnectionError, TimeoutError, asyncio.TimeoutError)):
+        return True
+    for attr in ("status_code", "code", "status"):
+        value = getattr(exc, attr, None)
+        if isinstance(value, int) and value in RETRYABLE_STATUS:
+            return True
+    return bool(_RETRYABLE_TEXT.search(str(exc)))
+
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """Delay the server asked for ("retry in 12s", "retryDelay": "12s"), if any."""
+    m = _RETRY_AFTER_RE.search(str(exc))
+    return float(m.group(1)) if m else None
+
+
+def backoff_delay(attempt: int, base: float, cap: float, exc: Optional[BaseException] = None) -> float:
+    """Full-jitter exponential backoff for retry `attempt` (1-based), at least the server's retry-after."""
+    delay = random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+    hinted = retry_after(exc) if exc is not None else None
+    return max(delay, min(hinted, cap)) if hinted is not None else delay
+
+
+@dataclass
+class Lease:
+    waited: float = 0.0
+    slot: Optional[object] = None  # open slot file (cross-process) or True (in-process)
+    tokens: int = 0
+
+
+@dataclass
+class LimiterStats:
+    calls: int = 0
+    retries: int = 0
+    failures: int = 0
+    waited_s: float = 0.0
+    max_wait_s: float = 0.0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def record_wait(self, seconds: float) -> None:
+        with self._lock:
+            self.calls += 1
+            self.waited_s += seconds
+            self.max_wait_s = max(self.max_wait_s, seconds)
+
+    def record_error(self, retried: bool) -> None:
+        with self._lock:
+            if retried:
+                self.retries += 1
+            else:
+                self.failures += 1
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls, "retries": self.retries, "failures": self.failures,
+                "queue_wait_s": round(self.waited_s, 3), "max_queue_wait_s": round(self.max_wait_s, 3),
+            }
+
+
+class RateLimiter:
+    def __init__(self, rpm: float = 0, tpm: float = 0, max_in_flight: int = 0, state_file: Optional[str] = None):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_in_flight = max_in_flight
+        self.state_file = state_file if fcntl is not None else None
+        self.stats = LimiterStats()
+        self._lock = threading.Lock()
+        now = time.time()
+        self._levels = {"requests": float(rpm), "tokens": float(tpm), "t": now}
+        self._in_flight = 0
+
+    # -- buckets --
+    def _refill(self, levels: dict, now: float) -> None:
+        dt = max(0.0, now - levels["t"])
+        if self.rpm:
+            levels["requests"] = min(self.rpm, levels["requests"] + dt * self.rpm / 60)
+        if self.tpm:
+            levels["tokens"] = min(self.tpm, levels["tokens"] + dt * self.tpm / 60)
+        levels["t"] = now
+
+    def _try_take(self, levels: dict, tokens: int) -> float:
+        """Take one request and `tokens` if both are there (0.0), else the seconds until they are."""
+        self._refill(levels, time.time())
+        tokens = min(tokens, self.tpm) if self.tpm else 0  # a prompt larger than a minute's quota waits for a full bucket
+        waits = []
+        if self.rpm and levels["requests"] < 1:
+            waits.append((1 - levels["requests"]) * 60 / self.rpm)
+        if self.tpm and levels["tokens"] < tokens:
+            waits.append((tokens - levels["tokens"]) * 60 / self.tpm)
+        if waits:
+            return max(waits)
+        if self.rpm:
+            levels["requests"] -= 1
+        if self.tpm:
+            levels["tokens"] -= tokens
+        return 0.0
+
+    def _with_levels(self, fn):
+        """Run fn(levels) on the current bucket levels (shared through the state file when there is one)."""
+        with self._lock:
+            if self.state_file is None:
+                return fn(self._levels)
+            with open(self.state_file + ".lock", "a") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    try:
+                        with open(self.state_file, "r", encoding="utf-8") as f:
+                            levels = json.load(f)
+                    except (OSError, ValueError):
+                        levels = {"requests": float(self.rpm), "tokens": float(self.tpm), "t": time.time()}
+                    result = fn(levels)
+                    tmp = f"{self.state_file}.{os.getpid()}.tmp"
+                    with open(tmp, "w", encoding="utf-8") as f:
+                        json.dump(levels, f)
+                    os.replace(tmp, self.state_file)
+                    return result
+                finally:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _reserve(self, tokens: int) -> float:
+        if not (self.rpm or self.tpm):
+            return 0.0
+        return self._with_levels(lambda levels: self._try_take(levels, tokens))
+
+    def charge(self, tokens: int) -> None:
+        """Charge tokens used after the call started (the output)."""
+        if self.tpm and tokens > 0:
+            def take(levels):
+                self._refill(levels, time.time())
+                levels["tokens"] -= tokens
+            self._with_levels(take)
+
+    # -- in-flight slots --
+    def _try_slot(self):
+        if not self.max_in_flight:
+            return True
+        if self.state_file is None:
+            with self._lock:
+                if self._in_flight < self.max_in_flight:
+                    self._in_flight += 1
+                    return True
+            return None
+        for i in range(self.max_in_flight):
+            f = open(f"{self.state_file}.slot{i}", "a")
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return f
+            except OSError:
+                f.close()
+        return None
+
+    def release(self, lease: Lease) -> None:
+        if lease.slot is None or not self.max_in_flight:
+            return
+        if lease.slot is True:
+            with self._lock:
+                self._in_flight -= 1
+        else:
+            fcntl.flock(lease.slot, fcntl.LOCK_UN)
+            lease.slot.close()
+        lease.slot = None
+
+    # -- acquire --
+    def _step(self, lease: Lease) -> float:
+        """One attempt to complete `lease`; 0.0 when done, else how long to wait before trying again."""
+        if lease.tokens >= 0:
+            wait = self._reserve(lease.tokens)
+            if wait > 0:
+                return min(wait, 1.0)
+            lease.tokens = -1  # bucket paid
+        lease.slot = self._try_slot()
+        return 0.0 if lease.slot is not None else 0.05
+
+    async def acquire(self, tokens: int = 0) -> Lease:
+        lease, start = Lease(tokens=tokens), time.monotonic()
+        while (wait := self._step(lease)) > 0:
+            await asyncio.sleep(wait)
+        lease.waited = time.monotonic() - start
+        self.stats.record_wait(lease.waited)
+        return lease
+
+    def acquire_sync(self, tokens: int = 0) -> Lease:
+        lease, start = Lease(tokens=tokens), time.monotonic()
+        while (wait := self._step(lease)) > 0:
+            time.sleep(wait)
+        lease.waited = time.monotonic() - start
+        self.stats.record_wait(lease.waited)
+        return lease
+
+
+_default_limiter: Optional[RateLimiter] = None
+_default_limiter_key = None
+_default_limiter_lock = threading.Lock()
+
+
+def get_default_limiter() -> RateLimiter:
+    """Process-wide limiter configured from env (rebuilt if the settings change)."""
+    global _default_limiter, _default_limiter_key
+    key = tuple(os.environ.get(v, "") for v in ("LLM_RPM", "LLM_TPM", "LLM_MAX_IN_FLIGHT", "RATE_LIMIT_FILE"))
+    with _default_limiter_lock:
+        if _default_limiter is None or key != _default_limiter_key:
+            _default_limiter = RateLimiter(float(key[0] or 0), float(key[1] or 0), int(key[2] or 0), key[3] or None)
+            _default_limiter_key = key
+        return _default_limiter
+
+
+def _output_tokens(out) -> int:
+    text = getattr(out, "content", out)
+    return estimate_tokens(text) if isinstance(text, str) else 0
+
+
+class LimitedAgent:
+    """Wraps an agent so every call goes through the process-wide limiter and retries retryable errors.
+
+    Any other attribute is forwarded to the wrapped agent.
+    """
+
+    def __init__(self, agent):
+        self._agent = agent
+
+    def __getattr__(self, name):
+        return getattr(self._agent, name)
+
+    @staticmethod
+    def _settings():
+        return (int(os.environ.get("LLM_RETRIES", "4")), float(os.environ.get("LLM_BACKOFF_BASE", "1")),
+                float(os.environ.get("LLM_BACKOFF_MAX", "30")))
+
+    @staticmethod
+    def _note(**counters) -> None:
+        span = tracing.current_span()
+        if span is not None:
+            span.add(**counters)
+
+    def _give_up(self, exc: BaseException, attempt: int, retries: int, limiter: RateLimiter) -> bool:
+        give_up = attempt > retries or not is_retryable(exc)
+        limiter.stats.record_error(retried=not give_up)
+        if not give_up:
+            self._note(retries=1)
+        return give_up
+
+    def run(self, prompt, **kwargs):
+        limiter = get_default_limiter()
+        retries, base, cap = self._settings()
+        attempt = 0
+        while True:
+            attempt += 1
+            lease = limiter.acquire_sync(estimate_tokens(str(prompt)))
+            self._note(queue_wait_s=round(lease.waited, 4))
+            try:
+                out = self._agent.run(prompt, **kwargs)
+                limiter.charge(_output_tokens(out))
+                return out
+            except Exception as e:
+                if self._give_up(e, attempt, retries, limiter):
+                    raise
+                delay = backoff_delay(attempt, base, cap, e)
+            finally:
+                limiter.release(lease)
+            time.sleep(delay)
+
+    def arun(self, prompt, stream: bool = False, **kwargs):
+        # Mirrors agno: a coroutine for plain calls, an async iterator of chunks when streaming
+        if stream:
+            return self._arun_stream(prompt, **kwargs)
+        return self._arun(prompt, **kwargs)
+
+    async def _arun(self, prompt, **kwargs):
+        limiter = get_default_limiter()
+        retries, base, cap = self._settings()
+        attempt = 0
+        while True:
+            attempt += 1
+            lease = await limiter.acquire(estimate_tokens(str(prompt)))
+            self._note(queue_wait_s=round(lease.waited, 4))
+            try:
+                out = await self._agent.arun(prompt, **kwargs)
+                limiter.charge(_output_tokens(out))
+                return out
+            except Exception as e:
+                if self._give_up(e, attempt, retries, limiter):
+                    raise
+                delay = backoff_delay(attempt, base, cap, e)
+            finally:
+                limiter.release(lease)
+            await asyncio.sleep(delay)
+
+    async def _arun_stream(self, prompt, **kwargs):
+        from agents.common import chunk_text
+
+        limiter = get_default_limiter()
+        retries, base, cap = self._settings()
+        attempt = 0
+        while True:
+            attempt += 1
+            lease = await limiter.acquire(estimate_tokens(str(prompt)))
+            self._note(queue_wait_s=round(lease.waited, 4))
+            parts = []
+            try:
+                stream = self._agent.arun(prompt, stream=True, **kwargs)
+                if inspect.isawaitable(stream):
+                    stream = await stream
+                try:
+                    async for event in stream:
+                        parts.append(chunk_text(event))
+                        yield event
+                finally:
+                    aclose = getattr(stream, "aclose", None)
+                    if aclose is not None:
+                        await aclose()
+                limiter.charge(estimate_tokens("".join(parts)))
+                return
+            except Exception as e:
+                if any(parts) or self._give_up(e, attempt, retries, limiter):
+                    raise  # text already went out: a retry would repeat it
+                delay = backoff_delay(attempt, base, cap, e)
+            finally:
+                limiter.release(lease)
+            await asyncio.sleep(delay)
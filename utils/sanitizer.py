@@ -0,0 +1,352 @@
+"""
+Single-pass sanitizer for raw model output that should be a Python file.
+
+One scan over the lines finds the first Python code fence (```, ```python, ```py) or, for unfenced
+output, the first line that starts real code; prose before it becomes the module docstring. The
+result is then checked. Every repair starts from one of a few textual marks (a fence, an odd or
+doubled triple quote, a line opening with two bare words outside triple-quoted strings), so code
+without any of them is returned without compiling. Marks that settle the repair on their own (plain
+prose lines, a docstring closed twice, an unterminated string) are repaired straight away; only what
+is left is handed to the compiler, with targeted repairs applied at the reported error line and a
+re-compile after each. This replaces the earlier cascade of whole-text regex passes, which also
+deleted legitimate closing-quote lines of multi-line docstrings.
+"""
+import ast
+import re
+import textwrap
+import warnings
+from typing import List, Optional
+
+PY_FENCE_LANGS = ("", "python", "py", "python3")
+MAX_REPAIRS = 8
+
+_FENCE_LINE_RE = re.compile(r"^[ \t]*```(.*)$", re.MULTILINE)
+
+_CODE_START_RE = re.compile(r"(?:async\s+def\s|def\s|class\s|import\s|from\s+[\w.]+\s+import\s|@\w|if\s+__name__\b)")
+_HEADER_RE = re.compile(r"^(\s*)(?:async\s+def|def|class)\b.*:\s*(?:#.*)?$")
+_QUOTE_ONLY_RE = re.compile(r"^\s*(\"{3,}|'{3,})\s*$")
+_DUP_TRIPLE_RE = re.compile(r"(\"\"\"|''')(?:\1)+")
+_PROSE_RE = re.compile(r"^[A-Za-z][\w'’,-]*(?:\s+\S+)+")
+# Marks a repair could start from; see _may_need_repair
+_TRIPLE_STRING_RE = re.compile(r'"""[\s\S]*?"""|\'\'\'[\s\S]*?\'\'\'')
+_QUOTED_TRIPLE_RE = re.compile(r"#[^\n]*(?:\"\"\"|''')|'[^'\n]*\"\"\"|\"[^\"\n]*'''")
+_BARE_WORDS_RE = re.compile(
+    r"^[ \t]*(?!(?:return|if|elif|else|for|while|with|try|except|finally|raise|assert|import|from|def|class|"
+    r"pass|break|continue|yield|global|nonlocal|del|lambda|async|await|and|or|not|in|is)\b)"
+    r"(?![A-Za-z]\w*,[^\n]*[^=!<>]=(?!=))"  # tuple unpacking: `X, y = ...`
+    r"[A-Za-z][\w'’,-]*[ \t]+(?![=+\-*/%<>!&|^~:.,;)\]}])\S",
+    re.MULTILINE,
+)
+# Two plain words in a row ("Computes the mean") never start a Python statement; soft keywords aside
+_TWO_WORDS_RE = re.compile(
+    r"^(?!(?:match|case|type)\b)[A-Za-z][\w'’-]*\s+"
+    r"(?!(?:if|else|for|in|is|and|or|not|async|await|lambda)\b)[A-Za-z_]"
+)
+# `name = ...`, `obj.attr += ...`: statements, whatever words follow
+_ASSIGN_RE = re.compile(r"^[A-Za-z_][\w.]*\s*(?:[-+*/%&|^@]|//|\*\*|>>|<<)?=(?!=)")
+_INDENTED_RE = re.compile(r"^\S", re.MULTILINE)
+_KEYWORD_START_RE = re.compile(
+    r"^(?:return|if|elif|else|for|while|with|try|except|finally|raise|assert|import|from|def|class|"
+    r"pass|break|continue|yield|global|nonlocal|del|lambda|async|await|print)\b"
+)
+
+
+# Compile warnings about the checked code (`x is 1`, invalid escapes) are not ours to show; a filter on its
+# pseudo-filename is cheaper than a catch_warnings() block around every compile
+warnings.filterwarnings("ignore", module=r"<generated>\Z")
+
+
+def _syntax_error(code: str) -> Optional[SyntaxError]:
+    try:
+        # Bytecode compile is cheaper than building an AST and reports the same errors
+        compile(code, "<generated>", "exec", dont_inherit=True)
+        return None
+    except SyntaxError as e:
+        return e
+    except (ValueError, OverflowError, RecursionError) as e:
+        return SyntaxError(str(e))
+
+
+def _parses(code: str) -> bool:
+    return _syntax_error(code) is None
+
+
+def _is_code_preamble(text: str) -> bool:
+    """True for leading text that is real code (docstring, comments, assignments), not prose like "Sure"."""
+    if _TWO_WORDS_RE.match(text):
+        return False  # "This module implements ...": no need to watch the parser fail on it
+    try:
+        tree = ast.parse(text)
+    except (SyntaxError, ValueError):
+        return False
+    return not any(isinstance(n, ast.Expr) and isinstance(n.value, ast.Name) for n in tree.body)
+
+
+def _is_fence(line: str) -> bool:
+    return line.lstrip().startswith("```")
+
+
+def _first_python_block(text: str) -> Optional[str]:
+    """Body of the first non-empty Python fence; an unterminated one runs to the end."""
+    if "```" not in text:
+        return None
+    lang = None
+    start = 0
+    for m in _FENCE_LINE_RE.finditer(text):
+        if lang is None:
+            lang, start = m.group(1).strip().lower(), m.end() + 1
+            continue
+        body = text[start:m.start()]
+        if lang in PY_FENCE_LANGS and body.strip():
+            return body
+        lang = None
+    if lang in PY_FENCE_LANGS:
+        body = text[start:].rstrip()
+        if body.endswith("```"):  # closing fence glued to the last line of code
+            body = body[:-3]
+        if body.strip():
+            return body
+    return None
+
+
+def strip_code_fence(s: str) -> str:
+    if not s:
+        return s
+    s = s.strip()
+    block = _first_python_block(s)
+    if block is not None:
+        return _dedent(block).strip()
+    # otherwise drop a leading/trailing fence line or trailing backticks
+    lines = s.splitlines()
+    if lines and _is_fence(lines[0]):
+        lines = lines[1:]
+    if lines and lines[-1].strip() == "```":
+        lines = lines[:-1]
+    s = "\n".join(lines)
+    if s.endswith("```"):
+        s = s[:-3]
+    return s.strip()
+
+
+def _prose_to_docstring(text: str) -> str:
+    text = text.strip()
+    text = re.sub(r"^(\"{3,}|'{3,})|(\"{3,}|'{3,})$", "", text).strip()
+    text = text.replace('"""', "'''")
+    text = re.sub(r"\n\s*\n+", "\n\n", text)
+    return '"""' + text + '"""'
+
+
+def _split_preamble(lines: List[str]):
+    """Index of the first line that starts code, tracking triple-quoted strings so docstring text never counts."""
+    in_string = None
+    for i, line in enumerate(lines):
+        stripped = line.strip()
+        if in_string is None and _CODE_START_RE.match(stripped):
+            return i
+        for q in ('"""', "'''"):
+            count = stripped.count(q)
+            if in_string in (None, q) and count % 2 == 1:
+                in_string = None if in_string == q else q
+    return None
+
+
+def _dedent(text: str) -> str:
+    # textwrap.dedent is a no-op (but not free) when some line already starts at column 0
+    return text if _INDENTED_RE.search(text) else textwrap.dedent(text)
+
+
+def sanitize_generated_code(raw: str) -> str:
+    if not raw:
+        return ""
+    text = raw.strip()
+    block = _first_python_block(text)
+    if block is not None:
+        return repair_code(_dedent(block).strip())
+    if "```" in text:
+        text = _FENCE_LINE_RE.sub("", text)
+    lines = text.splitlines()
+    start = _split_preamble(lines)
+    if start is None:
+        return repair_code("\n".join(lines).strip())
+    preamble = "\n".join(lines[:start]).strip()
+    body = "\n".join(lines[start:]).strip()
+    if preamble and not _is_code_preamble(preamble):
+        return _prose_to_docstring(preamble) + "\n\n" + repair_code(body)
+    return repair_code((preamble + "\n\n" + body) if preamble else body)
+
+
+# ---- Targeted repairs ----
+def _indent(line: str) -> str:
+    return line[:len(line) - len(line.lstrip())]
+
+
+def _looks_like_prose(stripped: str) -> bool:
+    if not _PROSE_RE.match(stripped) or _KEYWORD_START_RE.match(stripped) or _ASSIGN_RE.match(stripped):
+        return False
+    return bool(_TWO_WORDS_RE.match(stripped)) or not _parses(stripped)
+
+
+def _close_unterminated(lines: List[str], idx: int) -> Optional[List[str]]:
+    line = lines[idx]
+    if _QUOTE_ONLY_RE.match(line):
+        return lines[:idx] + lines[idx + 1:]  # stray quote line
+    quote = '"""' if '"""' in line else "'''"
+    base = len(_indent(line))
+    # The string should end before the next line that starts code at the same or a shallower indent
+    end = len(lines)
+    for j in range(idx + 1, len(lines)):
+        stripped = lines[j].strip()
+        if stripped and len(_indent(lines[j])) <= base and (
+            _CODE_START_RE.match(stripped) or _KEYWORD_START_RE.match(stripped)
+        ):
+            end = j
+            break
+    last = end - 1
+    while last > idx and not lines[last].strip():
+        last -= 1
+    out = list(lines)
+    out[last] = out[last].rstrip() + quote
+    return out
+
+
+def _quote_docstring(lines: List[str], idx: int) -> Optional[List[str]]:
+    h = idx - 1
+    while h >= 0 and not lines[h].strip():
+        h -= 1
+    if h < 0:
+        return None
+    header = _HEADER_RE.match(lines[h])
+    body_indent = _indent(lines[idx])
+    if not header or len(body_indent) <= len(header.group(1)):
+        return None
+    j = idx
+    while j < len(lines) and lines[j].strip() and _indent(lines[j]) == body_indent and _looks_like_prose(lines[j].strip()):
+        j += 1
+    if j == idx:
+        return None
+    text = "\n".join(body_indent + ln.strip() for ln in lines[idx:j]).strip()
+    return lines[:idx] + [body_indent + '"""' + text + '"""'] + lines[j:]
+
+
+def _repair_once(code: str, err: SyntaxError) -> Optional[str]:
+    lines = code.split("\n")
+    idx = (err.lineno or 0) - 1
+    if not 0 <= idx < len(lines):
+        return None
+    # Collapse duplicated triple quotes on the failing line only; elsewhere they may be intended
+    fixed = _DUP_TRIPLE_RE.sub(r"\1", lines[idx])
+    if fixed != lines[idx]:
+        lines[idx] = fixed
+        return "\n".join(lines)
+    if "unterminated triple-quoted" in (err.msg or ""):
+        fixed = _close_unterminated(lines, idx)
+        return "\n".join(fixed) if fixed else None
+    fixed = _quote_docstring(lines, idx)
+    if fixed is not None:
+        return "\n".join(fixed)
+    stripped = lines[idx].strip()
+    if _is_fence(stripped):
+        return "\n".join(lines[:idx] + lines[idx + 1:])
+    if _looks_like_prose(stripped):
+        lines[idx] = _indent(lines[idx]) + "# " + stripped
+        return "\n".join(lines)
+    return None
+
+
+def _blank_strings(code: str) -> str:
+    """`code` with triple-quoted strings reduced to their newlines, so line numbers still match."""
+    return _TRIPLE_STRING_RE.sub(lambda m: "\n" * m.group().count("\n"), code)
+
+
+def _may_need_repair(code: str) -> bool:
+    """False when no repair in _repair_once could apply to `code`, compiling or not."""
+    if _FENCE_LINE_RE.search(code) or _DUP_TRIPLE_RE.search(code):
+        return True
+    if code.count('"""') % 2 or code.count("'''") % 2:
+        return True  # unterminated string or stray quote line
+    # unquoted docstrings and prose lines both start with two bare words; docstring text doesn't count
+    return _BARE_WORDS_RE.search(_blank_strings(code)) is not None
+
+
+def _line_at(text: str, pos: int):
+    """(1-based number, text) of the line containing offset `pos`."""
+    start = text.rfind("\n", 0, pos) + 1
+    end = text.find("\n", pos)
+    return text.count("\n", 0, start) + 1, text[start:] if end < 0 else text[start:end]
+
+
+def _marked_error(code: str) -> Optional[SyntaxError]:
+    """The error compiling `code` would report at the first line carrying a mark, without compiling it.
+
+    Marks are a line with an odd number of triple quotes, some of them doubled (a docstring closed
+    twice), the triple quote left unpaired when they are matched up from the top like the tokenizer
+    does, and a line of plain prose outside triple-quoted strings.
+    """
+    found = []
+    for m in _DUP_TRIPLE_RE.finditer(code):
+        lineno, line = _line_at(code, m.start())
+        if line.count(m.group(1)) % 2:
+            found.append((lineno, "duplicated triple quotes"))
+            break
+    blanked = _blank_strings(code)
+    unpaired = [i for i in (blanked.find('"""'), blanked.find("'''")) if i >= 0]
+    if unpaired:
+        found.append((_line_at(blanked, min(unpaired))[0], "unterminated triple-quoted string literal"))
+    for m in _BARE_WORDS_RE.finditer(blanked):
+        lineno, line = _line_at(blanked, m.start())
+        if found and lineno >= min(found)[0]:
+            break
+        # the line must not hold the end of a string, and a backslash continuation can legally carry
+        # words on into the next line
+        if _TWO_WORDS_RE.match(line.strip()) and line == code.split("\n", lineno)[lineno - 1] and \
+                not blanked[:m.start()].rstrip().endswith("\\"):
+            found.append((lineno, "prose line"))
+            break
+    if not found:
+        return None
+    lineno, msg = min(found)
+    return SyntaxError(msg, ("<generated>", lineno, 1, None))
+
+
+def _repair_marked(code: str) -> str:
+    """Apply the repairs _marked_error points at, top to bottom, without compiling."""
+    for _ in range(MAX_REPAIRS):
+        err = _marked_error(code)
+        if err is None:
+            break
+        fixed = _repair_once(code, err)
+        if fixed is None or fixed == code:
+            break
+        code = fixed
+    return code
+
+
+def repair_code(code: str) -> str:
+    """Return `code` unchanged if it compiles, otherwise the first repaired version that does.
+
+    Repairs that a mark alone points at are trusted without compiling when they leave no mark behind.
+    Otherwise, if the repairs don't get it to compile, the input is returned as is for the debugger to
+    look at.
+    """
+    if not _may_need_repair(code):
+        return code
+    original = code
+    # a triple quote in a comment or a one-line string throws off the pairing _marked_error relies on
+    if not _QUOTED_TRIPLE_RE.search(code):
+        code = _repair_marked(code)
+        if code != original and not _may_need_repair(code):
+            return code
+    for _ in range(MAX_REPAIRS):
+        err = _syntax_error(code)
+        if err is None:
+            return code
+        fixed = _repair_once(code, err)
+        if fixed is None or fixed == code:
+            return original  # `code` is known not to compile
+        code = fixed
+    return code if _parses(code) else original
+
+
+def fix_unquoted_docstrings(code: str) -> str:
+    """Kept for callers of the old pipeline: sanitize_generated_code already applies every repair."""
+    return code
@@ -0,0 +1,213 @@
+"""
+Local similarity index over previous prompts and their researcher specs.
+
+Prompts are turned into TF-IDF weighted features (content words + character trigrams) and kept
+in an inverted index whose postings are NumPy arrays, so a lookup only touches the documents that
+share a feature with the query instead of scanning every stored prompt. Inserts are incremental and
+appended to a JSONL file, which is replayed on load.
+
+Lookups score candidates through the selective (low document frequency) features first and then
+compute the exact cosine for the few best candidates, so common trigrams with postings spanning
+most of the corpus are never scanned unless the query has nothing more specific. Even then only its
+words are used, and the postings scanned per lookup are capped (MAX_SCANNED_POSTINGS), so a corpus
+built from a small vocabulary keeps lookups well under a millisecond at 30k entries.
+"""
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+from typing import Optional, Tuple
+
+import numpy as np
+
+# Words that say how to ask rather than what to build; dropping them lets
+# "write merge sort" and "implement merge sort in python" map to the same features.
+_STOPWORDS = frozenset(
+    "a an the in of for to and or with using use python function functions write implement create "
+    "code program please me that which is are be make build simple small script give show it its "
+    "on as by can you i want need should".split()
+)
+_WORD_RE = re.compile(r"[a-z0-9_]+")
+
+
+def prompt_features(text: str) -> Counter:
+    words = [w for w in _WORD_RE.findall(text.lower()) if w not in _STOPWORDS]
+    feats = Counter("w:" + w for w in words)
+    for w in words:
+        padded = f"#{w}#"
+        for i in range(len(padded) - 2):
+            feats["c:" + padded[i:i + 3]] += 1
+    return feats
+
+
+class SpecIndex:
+    MIN_SELECTIVE_DF = 64   # postings at most this long (or n/20) are used for candidate generation
+    RESCORE_TOP_K = 16      # candidates that get an exact cosine score
+    MAX_SCANNED_POSTINGS = 32768  # posting entries scored per lookup, whatever the vocabulary looks like
+
+    def __init__(self, path: Optional[str] = None, threshold: float = 0.9):
+        self.path = path
+        self.threshold = threshold
+        self.prompts: list = []
+        self.specs: list = []
+        self.last_lookup_ms = 0.0
+        self._postings: dict = {}   # feature -> ([doc ids], [sublinear tf])
+        self._doc_feats: list = []  # doc id -> {feature: sublinear tf}, used for exact rescoring
+        self._arrays: dict = {}     # feature -> (ids ndarray, tf ndarray), rebuilt lazily after inserts
+        self._norms = np.zeros(0, dtype=np.float32)
+        self._norms_at = 0          # document count the norms were computed for
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            self._load()
+
+    def __len__(self):
+        return len(self.prompts)
+
+    def _load(self) -> None:
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                self._insert(entry["prompt"], entry["spec"])
+
+    def _insert(self, prompt: str, spec: str) -> None:
+        doc_id = len(self.prompts)
+        self.prompts.append(prompt)
+        self.specs.append(spec)
+        feats = {feat: 1.0 + math.log(count) for feat, count in prompt_features(prompt).items()}
+        self._doc_feats.append(feats)
+        for feat, tf in feats.items():
+            ids, tfs = self._postings.setdefault(feat, ([], []))
+            ids.append(doc_id)
+            tfs.append(tf)
+            self._arrays.pop(feat, None)
+
+    def add(self, prompt: str, spec: str) -> None:
+        with self._lock:
+            self._insert(prompt, spec)
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"prompt": prompt, "spec": spec, "created": time.time()}) + "\n")
+
+    def _idf(self, feat: str) -> float:
+        df = len(self._postings[feat][0])
+        return math.log((1 + len(self.prompts)) / (1 + df)) + 1.0
+
+    def _posting_arrays(self, feat: str):
+        arr = self._arrays.get(feat)
+        if arr is None:
+            ids, tfs = self._postings[feat]
+            arr = (np.asarray(ids, dtype=np.int32), np.asarray(tfs, dtype=np.float32))
+            self._arrays[feat] = arr
+        return arr
+
+    def _refresh_norms(self) -> None:
+        # IDF drifts as documents are added; recompute all document norms whenever the
+        # corpus has grown by half since the last pass, and extend with fresh rows in between.
+        n = len(self.prompts)
+        if n == self._norms_at:
+            return
+        if n > 1.5 * self._norms_at:
+            sq = np.zeros(n, dtype=np.float64)
+            for feat in self._postings:
+                ids, tfs = self._posting_arrays(feat)
+                w = tfs * self._idf(feat)
+                np.add.at(sq, ids, w * w)
+            self._norms = np.sqrt(sq).astype(np.float32)
+        else:
+            sq = np.zeros(n - self._norms_at, dtype=np.float64)
+            for doc_id in range(self._norms_at, n):
+                for feat, tf in self._doc_feats[doc_id].items():
+                    w = tf * self._idf(feat)
+                    sq[doc_id - self._norms_at] += w * w
+            self._norms = np.concatenate([self._norms, np.sqrt(sq).astype(np.float32)])
+        self._norms_at = n
+
+    def lookup(self, prompt: str) -> Tuple[Optional[str], float]:
+        """Return (spec, similarity) of the closest stored prompt, or (None, best score) below threshold."""
+        start = time.perf_counter()
+        with self._lock:
+            spec, score = self._lookup(prompt)
+        self.last_lookup_ms = (time.perf_counter() - start) * 1000
+        return spec, score
+
+    def _lookup(self, prompt: str):
+        n = len(self.prompts)
+        if not n:
+            return None, 0.0
+        self._refresh_norms()
+        query = {}  # feature -> query weight (tf * idf)
+        weights = {}  # feature -> query weight * idf, the factor for a document's tf in the dot product
+        q_sq = 0.0
+        unseen_idf = math.log(1 + n) + 1.0
+        for feat, count in prompt_features(prompt).items():
+            tf = 1.0 + math.log(count)
+            if feat in self._postings:
+                idf = self._idf(feat)
+                query[feat] = tf * idf
+                weights[feat] = query[feat] * idf
+                q_sq += query[feat] ** 2
+            else:
+                q_sq += (tf * unseen_idf) ** 2
+        if not query:
+            return None, 0.0
+        q_norm = math.sqrt(q_sq)
+
+        # Candidate generation through selective features only, rarest first and within a posting budget
+        max_df = max(self.MIN_SELECTIVE_DF, n // 20)
+        selective = [f for f in query if len(self._postings[f][0]) <= max_df]
+        if not selective:
+            # Nothing specific (a low-diversity corpus): a word's trigrams mostly repeat its own posting,
+            # so the common trigrams are skipped and the words alone pick the candidates
+            selective = [f for f in query if f.startswith("w:")] or list(query)
+        selective.sort(key=lambda f: len(self._postings[f][0]))
+        scores = np.zeros(n, dtype=np.float32)
+        budget = self.MAX_SCANNED_POSTINGS
+        for feat in selective:
+            ids, tfs = self._posting_arrays(feat)
+            if len(ids) > budget:
+                if budget < self.MAX_SCANNED_POSTINGS:
+                    break
+                # even the rarest feature is common: its newest documents stand in for the rest
+                ids, tfs = ids[-budget:], tfs[-budget:]
+            budget -= len(ids)
+            # doc ids within one posting list are unique, so fancy-index add is safe
+            scores[ids] += tfs * np.float32(weights[feat])
+        # Rank by partial cosine: the raw partial dot ties all documents sharing the scanned features
+        scores /= np.maximum(self._norms, np.float32(1e-9))
+        k = min(self.RESCORE_TOP_K, n)
+        candidates = np.argpartition(-scores, k - 1)[:k] if k < n else np.arange(n)
+
+        best, best_score = -1, 0.0
+        for doc_id in candidates.tolist():
+            if scores[doc_id] <= 0.0:
+                continue
+            feats = self._doc_feats[doc_id]
+            dot = sum(w * feats[f] for f, w in weights.items() if f in feats)
+            score = dot / (max(float(self._norms[doc_id]), 1e-9) * q_norm)
+            if score > best_score:
+                best, best_score = doc_id, score
+        if best >= 0 and best_score >= self.threshold:
+            return self.specs[best], best_score
+        return None, best_score
+
+
+_default_index: Optional[SpecIndex] = None
+
+
+def get_default_index() -> Optional[SpecIndex]:
+    """Process-wide index configured from env; None unless SPEC_REUSE=1."""
+    global _default_index
+    if os.environ.get("SPEC_REUSE", "") != "1":
+        return None
+    if _default_index is None:
+        _default_index = SpecIndex(
+            path=os.environ.get("SPEC_INDEX_PATH", ".spec_index.jsonl"),
+            threshold=float(os.environ.get("SPEC_REUSE_THRESHOLD", "0.9")),
+        )
+    return _default_index
@@ -0,0 +1,332 @@
+"""
+In-memory static checks for generated code.
+
+`check_source` parses the source once and runs every check over that single AST, returning
+structured `Diagnostic`s (line, col, code, message) instead of a text report. Nothing is written to
+disk and no process is spawned. Names in string annotations (`-> "Agent"`) count as uses. Codes follow
+flake8/pyflakes where one exists:
+  E999  syntax error (no further checks run)
+  F821  undefined name
+  F401  imported but unused
+  I900  import target not found (top-level module cannot be resolved)
+"""
+import ast
+import builtins
+import functools
+import importlib.machinery
+import importlib.util
+import os
+import sys
+import warnings
+from dataclasses import asdict, dataclass
+from typing import List, Optional, Sequence, Tuple
+
+_MODULE_NAMES = {
+    "__name__", "__file__", "__doc__", "__builtins__", "__spec__", "__loader__",
+    "__package__", "__path__", "__annotations__", "__dict__", "__debug__",
+}
+_BUILTINS = set(dir(builtins)) | _MODULE_NAMES
+
+
+@dataclass(frozen=True)
+class Diagnostic:
+    line: int
+    col: int
+    code: str
+    message: str
+
+    def format(self, filename: str = "<generated>") -> str:
+        return f"{filename}:{self.line}:{self.col}: {self.code} {self.message}"
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+def format_diagnostics(diagnostics: Sequence[Diagnostic], filename: str = "<generated>") -> str:
+    return "\n".join(d.format(filename) for d in diagnostics)
+
+
+class _Scope:
+    def __init__(self, kind: str, parent: Optional["_Scope"]):
+        self.kind = kind  # module | class | function | comprehension
+        self.parent = parent
+        self.bindings = set()
+
+    def function_scope(self) -> "_Scope":
+        """Where a walrus inside a comprehension binds."""
+        scope = self
+        while scope.kind == "comprehension" and scope.parent is not None:
+            scope = scope.parent
+        return scope
+
+
+def _attr_name(node: ast.AST) -> Optional[str]:
+    """`Literal` for both `Literal` and `typing.Literal`."""
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        return node.attr
+    return None
+
+
+class _Collector(ast.NodeVisitor):
+    """One walk over the tree: records bindings per scope, name loads and imports."""
+
+    def __init__(self):
+        self.module = _Scope("module", None)
+        self.scope = self.module
+        self.loads: List[Tuple[_Scope, ast.Name]] = []
+        self.used = set()            # every loaded name, for the unused-import check
+        self.imports: List[Tuple[str, ast.AST, str]] = []  # (bound name, node, description)
+        self.star_import = False
+        self.exported = set()        # names listed in __all__
+
+    def _in_scope(self, kind: str, node: ast.AST, body_visit) -> None:
+        parent, self.scope = self.scope, _Scope(kind, self.scope)
+        try:
+            body_visit(node)
+        finally:
+            self.scope = parent
+
+    def _bind(self, name: str) -> None:
+        self.scope.bindings.add(name)
+
+    # -- scopes --
+    def _visit_function(self, node) -> None:
+        self._bind(node.name)
+        for deco in node.decorator_list:
+            self.visit(deco)
+        self._visit_arguments_outer(node.args)
+        if node.returns is not None:
+            self._visit_annotation(node.returns)
+
+        def body(n):
+            self._bind_arguments(n.args)
+            for stmt in n.body:
+                self.visit(stmt)
+        self._in_scope("function", node, body)
+
+    visit_FunctionDef = _visit_function
+    visit_AsyncFunctionDef = _visit_function
+
+    def visit_Lambda(self, node: ast.Lambda) -> None:
+        self._visit_arguments_outer(node.args)
+
+        def body(n):
+            self._bind_arguments(n.args)
+            self.visit(n.body)
+        self._in_scope("function", node, body)
+
+    def visit_ClassDef(self, node: ast.ClassDef) -> None:
+        self._bind(node.name)
+        for expr in node.decorator_list + node.bases + [k.value for k in node.keywords]:
+            self.visit(expr)
+
+        def body(n):
+            for stmt in n.body:
+                self.visit(stmt)
+        self._in_scope("class", node, body)
+
+    def _visit_comprehension(self, node) -> None:
+        # The first iterable is evaluated in the enclosing scope, everything else in the comprehension's own
+        self.visit(node.generators[0].iter)
+
+        def body(n):
+            for i, gen in enumerate(n.generators):
+                if i:
+                    self.visit(gen.iter)
+                self.visit(gen.target)
+                for cond in gen.ifs:
+                    self.visit(cond)
+            for field in ("elt", "key", "value"):
+                if hasattr(n, field):
+                    self.visit(getattr(n, field))
+        self._in_scope("comprehension", node, body)
+
+    visit_ListComp = _visit_comprehension
+    visit_SetComp = _visit_comprehension
+    visit_DictComp = _visit_comprehension
+    visit_GeneratorExp = _visit_comprehension
+
+    def _visit_arguments_outer(self, args: ast.arguments) -> None:
+        # defaults and annotations are evaluated in the enclosing scope
+        for expr in args.defaults + [d for d in args.kw_defaults if d is not None]:
+            self.visit(expr)
+        for a in args.posonlyargs + args.args + args.kwonlyargs + [args.vararg, args.kwarg]:
+            if a is not None and a.annotation is not None:
+                self._visit_annotation(a.annotation)
+
+    def _visit_annotation(self, expr: ast.expr) -> None:
+        """Visit an annotation, including the names inside its string (forward reference) parts."""
+        self.visit(expr)
+        stack = [expr]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, ast.Subscript) and _attr_name(node.value) == "Literal":
+                continue  # strings in Literal[...] are values
+            if isinstance(node, ast.Constant) and isinstance(node.value, str):
+                try:
+                    parsed = ast.parse(node.value.strip(), mode="eval").body
+                except SyntaxError:
+                    continue
+                for inner in ast.walk(parsed):
+                    if hasattr(inner, "lineno"):
+                        inner.lineno, inner.col_offset = node.lineno, node.col_offset
+                self._visit_annotation(parsed)
+                continue
+            stack.extend(ast.iter_child_nodes(node))
+
+    def _bind_arguments(self, args: ast.arguments) -> None:
+        for a in args.posonlyargs + args.args + args.kwonlyargs + [args.vararg, args.kwarg]:
+            if a is not None:
+                self._bind(a.arg)
+
+    # -- bindings and uses --
+    def visit_Name(self, node: ast.Name) -> None:
+        if isinstance(node.ctx, ast.Load):
+            self.loads.append((self.scope, node))
+            self.used.add(node.id)
+        elif isinstance(node.ctx, ast.Store):
+            self._bind(node.id)
+
+    def visit_NamedExpr(self, node: ast.NamedExpr) -> None:
+        self.visit(node.value)
+        self.scope.function_scope().bindings.add(node.target.id)
+
+    def visit_Global(self, node: ast.Global) -> None:
+        for name in node.names:
+            self._bind(name)
+            self.module.bindings.add(name)
+
+    def visit_Nonlocal(self, node: ast.Nonlocal) -> None:
+        for name in node.names:
+            self._bind(name)
+
+    def visit_ExceptHandler(self, node: ast.ExceptHandler) -> None:
+        if node.name:
+            self._bind(node.name)
+        self.generic_visit(node)
+
+    def visit_MatchAs(self, node) -> None:
+        if node.name:
+            self._bind(node.name)
+        self.generic_visit(node)
+
+    def visit_MatchStar(self, node) -> None:
+        if node.name:
+            self._bind(node.name)
+
+    def visit_MatchMapping(self, node) -> None:
+        if node.rest:
+            self._bind(node.rest)
+        self.generic_visit(node)
+
+    def visit_AnnAssign(self, node: ast.AnnAssign) -> None:
+        self._visit_annotation(node.annotation)
+        if node.value is not None:
+            self.visit(node.value)
+        self.visit(node.target)
+
+    def visit_Assign(self, node: ast.Assign) -> None:
+        if self.scope is self.module and any(isinstance(t, ast.Name) and t.id == "__all__" for t in node.targets):
+            if isinstance(node.value, (ast.List, ast.Tuple)):
+                self.exported.update(
+                    e.value for e in node.value.elts if isinstance(e, ast.Constant) and isinstance(e.value, str)
+                )
+        self.generic_visit(node)
+
+    def visit_Import(self, node: ast.Import) -> None:
+        for alias in node.names:
+            bound = alias.asname or alias.name.split(".")[0]
+            self._bind(bound)
+            self.imports.append((bound, node, alias.name))
+
+    def visit_ImportFrom(self, node: ast.ImportFrom) -> None:
+        if node.module == "__future__":
+            return
+        prefix = "." * node.level + (node.module or "")
+        for alias in node.names:
+            if alias.name == "*":
+                self.star_import = True
+                continue
+            bound = alias.asname or alias.name
+            self._bind(bound)
+            self.imports.append((bound, node, f"{prefix}.{alias.name}" if node.module else prefix + alias.name))
+
+
+def _resolves(scope: _Scope, name: str) -> bool:
+    current = scope
+    while current is not None:
+        # class bodies are only visible to code directly inside them, not to nested functions or comprehensions
+        if name in current.bindings and (current.kind != "class" or current is scope):
+            return True
+        current = current.parent
+    return name in _BUILTINS
+
+
+@functools.lru_cache(maxsize=4096)
+def _installed(name: str) -> bool:
+    try:
+        return name in sys.modules or importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return True  # unusual loaders: don't report what we can't decide
+
+
+def module_exists(name: str, search_path: Optional[str] = None) -> bool:
+    """Whether top-level module `name` can be imported, without importing it.
+
+    Installed modules are looked up once per name; `search_path` (a per-run directory) is checked each time.
+    """
+    if _installed(name):
+        return True
+    if not search_path:
+        return False
+    try:
+        return importlib.machinery.PathFinder.find_spec(name, [search_path]) is not None
+    except (ImportError, ValueError):
+        return True
+
+
+def check_source(source: str, filename: str = "<generated>", search_path: Optional[str] = None) -> List[Diagnostic]:
+    """Run all checks on `source`; `search_path` is the directory the code will run from."""
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            tree = compile(source, filename, "exec", flags=ast.PyCF_ONLY_AST, dont_inherit=True)
+    except SyntaxError as e:
+        kind = type(e).__name__
+        return [Diagnostic(e.lineno or 1, (e.offset or 1), "E999", f"{kind}: {e.msg}")]
+    except (ValueError, OverflowError, RecursionError) as e:
+        return [Diagnostic(1, 1, "E999", f"{type(e).__name__}: {e}")]
+
+    c = _Collector()
+    c.visit(tree)
+    diags = []
+    if not c.star_import:
+        for scope, node in c.loads:
+            if not _resolves(scope, node.id):
+                diags.append(Diagnostic(node.lineno, node.col_offset + 1, "F821", f"undefined name '{node.id}'"))
+    for bound, node, target in c.imports:
+        if bound not in c.used and bound not in c.exported:
+            diags.append(Diagnostic(node.lineno, node.col_offset + 1, "F401", f"'{target}' imported but unused"))
+    checked = set()
+    for _, node, _ in c.imports:
+        if id(node) in checked:
+            continue
+        checked.add(id(node))
+        if isinstance(node, ast.ImportFrom):
+            modules = [node.module] if node.level == 0 and node.module else []
+        else:
+            modules = [a.name for a in node.names]
+        for module in modules:
+            top = module.split(".")[0]
+            if not module_exists(top, search_path):
+                diags.append(Diagnostic(node.lineno, node.col_offset + 1, "I900", f"module '{top}' not found"))
+    diags.sort(key=lambda d: (d.line, d.col, d.code))
+    return diags
+
+
+def check_file(path: str) -> List[Diagnostic]:
+    with open(path, "r", encoding="utf-8") as f:
+        source = f.read()
+    return check_source(source, path, os.path.dirname(os.path.abspath(path)))
@@ -0,0 +1,178 @@
+"""
+Incremental validator for streamed coder output.
+
+`StreamingCodeValidator.feed(delta)` is called with every chunk of the coder's stream and raises
+`StopGeneration` as soon as the rest of the generation is not worth waiting for:
+  - accept=False: the output is unrecoverable (long prose with no code tokens, runaway code fences,
+    broken indentation in the code seen so far) -> cancel and retry straight away. Triple-quoted
+    strings (a module docstring before the first import) are not counted as prose.
+  - accept=True: the first fenced code block has closed; sanitize_generated_code only ever uses that
+    block, so anything generated after it is wasted -> cancel and keep the text so far
+Indentation is checked with codeop on the completed lines of the code region, which tells incomplete
+input (still streaming) apart from input that can never parse.
+"""
+import codeop
+import re
+import textwrap
+import threading
+import warnings
+
+from utils.sanitizer import PY_FENCE_LANGS
+
+# Same tokens _looks_like_valid_python looks for
+_CODE_TOKEN_RE = re.compile(r"\b(def |class |import |from )")
+# A line that starts real code (anchored, so prose mentioning "from the list" does not count)
+_CODE_LINE_RE = re.compile(r"^\s*(def |class |import |from |@|if __name__)")
+_TRIPLE_QUOTE_RE = re.compile(r'"""|\'\'\'')
+# A triple-quoted string opening a line (docstring), optionally with a string prefix
+_STRING_START_RE = re.compile(r'^\s*[rRuUbBfF]{0,2}("""|\'\'\')')
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token) used for reporting."""
+    return (len(text) + 3) // 4
+
+
+class StopGeneration(Exception):
+    def __init__(self, reason: str, text: str, accept: bool = False):
+        super().__init__(reason)
+        self.reason = reason
+        self.text = text
+        self.accept = accept
+
+
+class StreamingCodeValidator:
+    def __init__(self, prose_limit: int = 1500, max_empty_fences: int = 2):
+        self.prose_limit = prose_limit
+        self.max_empty_fences = max_empty_fences
+        self.text = ""
+        self._pos = 0               # start of the first line not yet processed
+        self._has_token = False
+        self._code_start = None     # offset where the code region starts
+        self._fence_lang = None     # language tag of the open ``` fence, None outside fences
+        self._empty_fences = 0
+        self._last_was_fence = False
+        self._bad_syntax = False    # a non-indentation syntax error was seen; stop re-checking
+        self._quote = None          # delimiter of the open triple-quoted string outside fences
+        self._string_chars = 0      # characters of completed lines inside triple-quoted strings
+
+    def feed(self, delta: str) -> None:
+        self.text += delta
+        if not self._has_token and _CODE_TOKEN_RE.search(self.text):
+            self._has_token = True
+        while True:
+            nl = self.text.find("\n", self._pos)
+            if nl < 0:
+                break
+            start, self._pos = self._pos, nl + 1
+            self._line(self.text[start:nl], start)
+        if not self._has_token and "```" not in self.text:
+            prose = len(self.text) - self._string_chars
+            if self._quote is not None:
+                prose -= len(self.text) - self._pos  # the unfinished line is still inside the string
+            if prose > self.prose_limit:
+                raise StopGeneration(f"no code after {prose} chars of prose", self.text)
+
+    def _track_strings(self, line: str) -> None:
+        in_string = self._quote is not None
+        if not in_string and not _STRING_START_RE.match(line):
+            return
+        for m in _TRIPLE_QUOTE_RE.finditer(line):
+            if self._quote is None:
+                self._quote = m.group()
+            elif m.group() == self._quote:
+                self._quote = None
+        self._string_chars += len(line) + 1
+
+    def _line(self, line: str, start: int) -> None:
+        stripped = line.strip()
+        if self._fence_lang is None and not stripped.startswith("```"):
+            self._track_strings(line)
+        if stripped.startswith("```"):
+            if self._last_was_fence:
+                self._empty_fences += 1
+                if self._empty_fences >= self.max_empty_fences:
+                    raise StopGeneration("runaway code fences", self.text)
+            self._last_was_fence = True
+            if self._fence_lang is not None:
+                lang, self._fence_lang = self._fence_lang, None
+                body = self.text[self._code_start:start] if self._code_start is not None else ""
+                # sanitize_generated_code takes the first Python block and ignores the rest
+                if lang in PY_FENCE_LANGS and body.strip():
+                    raise StopGeneration("first fenced block complete", self.text[:start] + "```", accept=True)
+            else:
+                self._fence_lang = stripped[3:].strip().lower()
+                if self._fence_lang in PY_FENCE_LANGS:
+                    self._code_start = start + len(line) + 1
+                    self._bad_syntax = False
+            return
+        self._last_was_fence = False
+        if self._fence_lang is not None and self._fence_lang not in PY_FENCE_LANGS:
+            return  # shell snippets etc. are not checked
+        if self._code_start is None:
+            if _CODE_LINE_RE.match(line):
+                self._code_start = start
+            else:
+                return
+        if stripped and not self._bad_syntax:
+            self._check_indentation(self.text[self._code_start:start + len(line) + 1])
+
+    def _check_indentation(self, code: str) -> None:
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                codeop.compile_command(textwrap.dedent(code), "<stream>", "exec")
+        except IndentationError as e:
+            raise StopGeneration(f"broken indentation: {e.msg} (line {e.lineno})", self.text)
+        except (SyntaxError, ValueError, OverflowError):
+            # Other errors may still be repaired by the sanitizer/debugger; don't abort on them
+            self._bad_syntax = True
+
+
+class StreamStats:
+    """Process-wide counters for coder generations cut short by the streaming validator."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.aborted = 0
+        self.stopped_early = 0
+        self.tokens_streamed = 0
+        self.tokens_saved_est = 0
+        self._completed_tokens = 0
+
+    def typical_tokens(self) -> int:
+        # Mean size of generations that ran to completion; a modest default until we have data
+        return self._completed_tokens // self.completed if self.completed else 800
+
+    def record_completed(self, text: str) -> None:
+        with self._lock:
+            n = estimate_tokens(text)
+            self.completed += 1
+            self._completed_tokens += n
+            self.tokens_streamed += n
+
+    def record_stop(self, stop: StopGeneration) -> int:
+        """Record a cut-short generation; returns the estimated tokens it saved."""
+        with self._lock:
+            n = estimate_tokens(stop.text)
+            saved = max(0, self.typical_tokens() - n)
+            if stop.accept:
+                self.stopped_early += 1
+            else:
+                self.aborted += 1
+            self.tokens_streamed += n
+            self.tokens_saved_est += saved
+            return saved
+
+    def as_dict(self) -> dict:
+        return {
+            "completed": self.completed,
+            "aborted": self.aborted,
+            "stopped_early": self.stopped_early,
+            "tokens_streamed": self.tokens_streamed,
+            "tokens_saved_est": self.tokens_saved_est,
+        }
+
+
+STREAM_STATS = StreamStats()
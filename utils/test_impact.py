@@ -0,0 +1,219 @@
+"""
+Change-aware test selection for incremental iterations.
+
+After a patch only some top-level functions/classes of generated_code.py differ. `plan_rerun` maps
+every test in test_generated.py to the generated definitions it reaches (directly, through helpers,
+fixtures and module-level values of the test file, and transitively through calls inside the
+generated module), diffs the old and patched module definition by definition and returns the tests
+that reach a changed definition, plus the ones that failed last time. It returns None (run
+everything) whenever it cannot tell: a source does not parse, module-level code of the generated
+file changed, an imported name appeared or disappeared, or module-level test code uses a change.
+Decisions err towards running more tests: inside the generated module an attribute call such as
+`obj.method()` counts as a use of every class that defines `method`.
+"""
+import ast
+from typing import Dict, Iterable, List, Optional, Set
+
+from utils.patcher import is_main_guard
+from utils.test_runner import PytestRecord, PytestResult
+
+GENERATED_MODULE = "generated_code"
+_MODULE_KEY = "<module>"
+
+
+def _refs(node: ast.AST) -> Set[str]:
+    """Names loaded and attribute names used anywhere inside `node`."""
+    out = set()
+    for n in ast.walk(node):
+        if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Load):
+            out.add(n.id)
+        elif isinstance(n, ast.Attribute):
+            out.add(n.attr)
+    return out
+
+
+class _Module:
+    """Top-level definitions of the generated module and the definitions each one uses."""
+
+    def __init__(self, source: str):
+        tree = ast.parse(source)
+        self.defs: Dict[str, str] = {}
+        self.deps: Dict[str, Set[str]] = {}
+        module_level = []
+        methods: Dict[str, Set[str]] = {}
+        nodes = {}
+        for node in tree.body:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                self.defs[node.name] = ast.dump(node)
+                nodes[node.name] = node
+                if isinstance(node, ast.ClassDef):
+                    for m in node.body:
+                        if isinstance(m, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                            methods.setdefault(m.name, set()).add(node.name)
+            elif not is_main_guard(node):  # the __main__ block never runs under pytest
+                module_level.append(ast.dump(node))
+        self.defs[_MODULE_KEY] = "\n".join(module_level)
+        for name, node in nodes.items():
+            refs = _refs(node)
+            self.deps[name] = {r for r in refs if r in nodes and r != name}
+            self.deps[name] |= {c for r in refs for c in methods.get(r, ()) if c != name}
+
+    def closure(self, names: Iterable[str]) -> Set[str]:
+        seen, stack = set(), [n for n in names if n in self.deps]
+        while stack:
+            name = stack.pop()
+            if name not in seen:
+                seen.add(name)
+                stack.extend(self.deps.get(name, ()))
+        return seen
+
+
+def _diff(old: _Module, new: _Module) -> Optional[Set[str]]:
+    if old.defs[_MODULE_KEY] != new.defs[_MODULE_KEY]:
+        return None
+    return {n for n in set(old.defs) | set(new.defs) if old.defs.get(n) != new.defs.get(n)}
+
+
+def changed_definitions(old_source: str, new_source: str) -> Optional[Set[str]]:
+    """Top-level names whose definition was added, removed or edited; None if module-level code changed."""
+    try:
+        return _diff(_Module(old_source), _Module(new_source))
+    except (SyntaxError, ValueError):
+        return None
+
+
+class _TestFile:
+    """Per test id ("test_x" or "TestC::test_x"), the generated names it reaches inside the test file."""
+
+    def __init__(self, source: str, generated: Set[str]):
+        tree = ast.parse(source)
+        aliases: Dict[str, str] = {}  # local name -> generated name
+        modules = set()               # local names bound to the generated module
+        self.imported: Set[str] = set()
+        for node in tree.body:
+            if isinstance(node, ast.ImportFrom) and node.module == GENERATED_MODULE:
+                for a in node.names:
+                    if a.name == "*":
+                        aliases.update({g: g for g in generated})
+                    else:
+                        aliases[a.asname or a.name] = a.name
+                        self.imported.add(a.name)
+            elif isinstance(node, ast.Import):
+                modules.update(a.asname or a.name for a in node.names if a.name == GENERATED_MODULE)
+
+        def generated_refs(node: ast.AST) -> Set[str]:
+            out = set()
+            for n in ast.walk(node):
+                if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Load) and n.id in aliases:
+                    out.add(aliases[n.id])
+                elif isinstance(n, ast.Attribute):
+                    if isinstance(n.value, ast.Name) and n.value.id in modules:
+                        out.add(n.attr)
+            return out
+
+        # Locals of the test file (helpers, fixtures, module-level values) with what they use
+        local_nodes: Dict[str, List[ast.AST]] = {}
+        self.module_level_refs: Set[str] = set()
+        tests: Dict[str, List[ast.AST]] = {}
+        for node in tree.body:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                (tests if node.name.startswith("test") else local_nodes).setdefault(node.name, []).append(node)
+            elif isinstance(node, ast.ClassDef):
+                shared = [m for m in node.body if not (isinstance(m, (ast.FunctionDef, ast.AsyncFunctionDef)) and m.name.startswith("test"))]
+                shared += node.decorator_list + node.bases
+                if node.name.startswith("Test"):
+                    for m in node.body:
+                        if isinstance(m, (ast.FunctionDef, ast.AsyncFunctionDef)) and m.name.startswith("test"):
+                            tests.setdefault(f"{node.name}::{m.name}", []).extend([m] + shared)
+                else:
+                    local_nodes.setdefault(node.name, []).append(node)
+            elif isinstance(node, (ast.Assign, ast.AnnAssign)) and node.value is not None:
+                targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+                for t in targets:
+                    for n in ast.walk(t):
+                        if isinstance(n, ast.Name):
+                            local_nodes.setdefault(n.id, []).append(node.value)
+            elif not isinstance(node, (ast.Import, ast.ImportFrom)):
+                self.module_level_refs |= generated_refs(node)
+
+        def uses(nodes: List[ast.AST]) -> Set[str]:
+            names = set()
+            for node in nodes:
+                names |= _refs(node)
+                if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                    names |= {a.arg for a in node.args.args + node.args.kwonlyargs}  # fixtures
+            return names
+
+        local_uses = {name: uses(nodes) & set(local_nodes) for name, nodes in local_nodes.items()}
+        local_generated = {name: set().union(*(generated_refs(n) for n in nodes)) for name, nodes in local_nodes.items()}
+        self.tests: Dict[str, Set[str]] = {}
+        for test_id, nodes in tests.items():
+            reached = set().union(*(generated_refs(n) for n in nodes))
+            seen, stack = set(), list(uses(nodes) & set(local_nodes))
+            while stack:
+                name = stack.pop()
+                if name not in seen:
+                    seen.add(name)
+                    reached |= local_generated[name]
+                    stack.extend(local_uses[name])
+            self.tests[test_id] = reached
+
+
+def definitions_reached(code: str, test_source: str, case_ids: Iterable[str]) -> Set[str]:
+    """Generated top-level definitions the given tests reach (empty if either source does not parse)."""
+    try:
+        module = _Module(code)
+        tests = _TestFile(test_source, set(module.defs))
+    except (SyntaxError, ValueError):
+        return set()
+    return module.closure(set().union(*(tests.tests.get(c, set()) for c in case_ids)))
+
+
+def case_id(nodeid: str) -> str:
+    """"test_generated.py::TestC::test_x[1-2]" -> "TestC::test_x"."""
+    return nodeid.split("::", 1)[-1].split("[", 1)[0]
+
+
+def plan_rerun(old_code: str, new_code: str, test_source: str, previous: Iterable[PytestRecord]) -> Optional[List[str]]:
+    """Test ids to re-run after `old_code` became `new_code`, or None for a full run."""
+    previous = list(previous)
+    if not previous:
+        return None
+    try:
+        old, new = _Module(old_code), _Module(new_code)
+        tests = _TestFile(test_source, set(old.defs) | set(new.defs))
+    except (SyntaxError, ValueError):
+        return None
+    changed = _diff(old, new)
+    if changed is None:
+        return None
+    if tests.imported & (set(old.defs) ^ set(new.defs)):
+        return None  # an imported name appeared or vanished: collection itself changes
+    if tests.module_level_refs & changed:
+        return None
+    if set(tests.tests) - {case_id(r.nodeid) for r in previous}:
+        return None  # tests the previous run did not see
+    selected = {t for t, reached in tests.tests.items() if (old.closure(reached) | new.closure(reached)) & changed}
+    selected |= {case_id(r.nodeid) for r in previous if r.outcome not in ("passed", "skipped")}
+    return sorted(selected)
+
+
+def merge_results(previous: Iterable[PytestRecord], rerun: Iterable[str], result: PytestResult) -> PytestResult:
+    """Records of `result` for the re-run tests, previous records for the rest (in the previous order)."""
+    if not result.records and result.returncode not in (0, 5):
+        return result  # the selected run broke down as a whole (e.g. collection error)
+    rerun = set(rerun)
+    fresh: Dict[str, List[PytestRecord]] = {}
+    for r in result.records:
+        fresh.setdefault(case_id(r.nodeid), []).append(r)
+    records = []
+    for r in previous:
+        key = case_id(r.nodeid)
+        if key not in rerun:
+            records.append(r)
+        elif key in fresh:
+            records.extend(fresh.pop(key))
+    for rs in fresh.values():
+        records.extend(rs)
+    returncode = 1 if any(r.outcome not in ("passed", "skipped") for r in records) else 0
+    return PytestResult(returncode, records, result.stdout, result.stderr, result.shards, result.seconds)
@@ -1,8 +1,24 @@
+import ast
+import json
 import subprocess
 import sys
 import os
 import re
-from typing import Tuple
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from utils import tracing
+from utils.worker_pool import get_default_pool
+
+REPORT_PLUGIN = "utils.pytest_report_plugin"
+_REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Suites smaller than this many tests per shard run in a single pytest process
+MIN_TESTS_PER_SHARD = 4
+# Interpreter start-up + collection allowance on top of the per-test timeouts of a run
+RUN_SLACK_SECONDS = 15
 
 def normalize_test_imports(test_content: str, target_module: str = "generated_code") -> str:
     """
@@ -36,22 +52,34 @@ def _normalize_test_placeholders(test_content: str, target_module: str = "genera
     # Ensure relative imports are converted (already handled earlier)
     return test_content
 
-def save_test_file(test_content: str, path: str = "test_generated.py") -> None:
+def normalize_test_source(test_content: str) -> str:
+    """The test file as save_test_file writes it; use this text wherever the tests are compared or cached."""
     # Normalize relative imports to absolute imports for our generated code file
     normalized = normalize_test_imports(test_content, target_module="generated_code")
-    normalized = _normalize_test_placeholders(normalized, target_module="generated_code")
+    return _normalize_test_placeholders(normalized, target_module="generated_code")
+
+def save_test_file(test_content: str, path: str = "test_generated.py") -> str:
+    """Write the normalized tests to `path` and return them."""
+    normalized = normalize_test_source(test_content)
     with open(path, "w", encoding="utf-8") as f:
         f.write(normalized)
-    return
+    return normalized
 
-def run_pytest(test_path: str = "test_generated.py", timeout: int = 10) -> Tuple[int, str, str]:
-    """
-    Runs pytest on the given test file (in current directory).
-    Returns (returncode, stdout, stderr).
-    """
-    cmd = [sys.executable, "-m", "pytest", "-q", "--disable-warnings", test_path]
+def _invoke_pytest(args: List[str], timeout: float, cwd: str | None) -> Tuple[int, str, str]:
+    """`python -m pytest <args>` through the warm pool when enabled, else a subprocess."""
+    pool = get_default_pool()
+    if pool is not None:
+        try:
+            return pool.run_pytest(args, timeout=timeout, cwd=cwd)
+        except Exception as e:
+            return -3, "", f"runtime error: {e}"
+    env = None
+    if REPORT_PLUGIN in args:
+        # the report plugin lives in this repo, which is not on the path of a run inside a workspace
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [_REPO_ROOT, os.environ.get("PYTHONPATH")])))
     try:
-        completed = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
+        completed = subprocess.run([sys.executable, "-m", "pytest"] + args, capture_output=True, text=True,
+                                   timeout=timeout, cwd=cwd, env=env)
         return completed.returncode, completed.stdout, completed.stderr
     except subprocess.TimeoutExpired:
         return -1, "", "pytest timed out"
@@ -60,6 +88,192 @@ def run_pytest(test_path: str = "test_generated.py", timeout: int = 10) -> Tuple
     except Exception as e:
         return -3, "", f"runtime error: {e}"
 
+def run_pytest(test_path: str = "test_generated.py", timeout: int = 10, cwd: str | None = None) -> Tuple[int, str, str]:
+    """
+    Runs pytest on the given test file, from `cwd` (default: current directory).
+    Returns (returncode, stdout, stderr).
+    Uses the warm worker pool instead of a fresh interpreter when WARM_POOL=1.
+    """
+    return _invoke_pytest(["-q", "--disable-warnings", test_path], timeout, cwd)
+
+@dataclass
+class PytestRecord:
+    nodeid: str
+    outcome: str  # passed | failed | error (setup/teardown) | skipped | timeout | not run
+    duration: float = 0.0
+    message: str = ""
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+@dataclass
+class PytestResult:
+    returncode: int
+    records: List[PytestRecord] = field(default_factory=list)
+    stdout: str = ""
+    stderr: str = ""
+    shards: int = 1
+    seconds: float = 0.0
+
+    def counts(self) -> Tuple[int, int]:
+        """(passed, total), skipped tests not counted."""
+        passed = sum(r.outcome == "passed" for r in self.records)
+        return passed, sum(r.outcome != "skipped" for r in self.records)
+
+    def failures(self) -> List[PytestRecord]:
+        return [r for r in self.records if r.outcome not in ("passed", "skipped")]
+
+def format_failures(records: List[PytestRecord], max_chars: int = 1500) -> str:
+    """One block per failing test for the debugger prompt; long messages keep their tail."""
+    blocks = []
+    for r in records:
+        if r.outcome in ("passed", "skipped"):
+            continue
+        message = r.message if len(r.message) <= max_chars else "..." + r.message[-max_chars:]
+        blocks.append(f"{r.outcome.upper()} {r.nodeid} ({r.duration:.2f}s)" + (f"\n{message.rstrip()}" if message else ""))
+    return "\n\n".join(blocks)
+
+def estimate_test_count(test_path: str) -> int:
+    """Test functions in the file (module level and Test* classes); parametrization is not expanded."""
+    try:
+        with open(test_path, "r", encoding="utf-8") as f:
+            tree = ast.parse(f.read())
+    except (OSError, SyntaxError, ValueError):
+        return 0
+    count = 0
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and node.name.startswith("test"):
+            count += 1
+        elif isinstance(node, ast.ClassDef) and node.name.startswith("Test"):
+            count += sum(isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef)) and n.name.startswith("test") for n in node.body)
+    return count
+
+def _read_report(path: str) -> Tuple[List[str], set, Dict[str, PytestRecord]]:
+    """(collected nodeids, started nodeids, records of tests whose teardown was reported) from a --report-jsonl file."""
+    collected, started, records, finished = [], set(), {}, set()
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            lines = f.readlines()
+    except OSError:
+        return collected, started, records
+    for line in lines:
+        try:
+            ev = json.loads(line)
+        except ValueError:
+            continue  # last line of a killed run
+        if ev["event"] == "collected":
+            collected.extend(ev["nodeids"])
+        elif ev["event"] == "start":
+            started.add(ev["nodeid"])
+        elif ev["event"] == "report":
+            rec = records.setdefault(ev["nodeid"], PytestRecord(ev["nodeid"], "passed"))
+            rec.duration += ev["duration"]
+            if ev["when"] == "teardown":
+                finished.add(ev["nodeid"])
+            if rec.outcome in ("failed", "error", "timeout"):
+                continue  # keep the first problem (e.g. a call failure over its teardown error)
+            if ev["outcome"] in ("failed", "timeout"):
+                rec.outcome = "error" if ev["outcome"] == "failed" and ev["when"] != "call" else ev["outcome"]
+                rec.message = ev["message"]
+            elif ev["outcome"] == "skipped":
+                rec.outcome, rec.message = "skipped", ev["message"]
+    return collected, started, {k: v for k, v in records.items() if k in finished}
+
+def _run_reported(args: List[str], report_path: str, per_test_timeout: float, timeout: float, cwd: str) -> Tuple[int, str, str]:
+    return _invoke_pytest(
+        ["-q", "--disable-warnings", "-p", "no:cacheprovider", "-p", REPORT_PLUGIN, f"--rootdir={cwd}",
+         f"--report-jsonl={report_path}", f"--per-test-timeout={per_test_timeout:g}"] + args,
+        timeout, cwd,
+    )
+
+def _shard_records(nodeids: List[str], report: tuple, returncode: int, timeout: float) -> List[PytestRecord]:
+    _, started, by_id = report
+    records = []
+    for nodeid in nodeids:
+        if nodeid in by_id:
+            records.append(by_id[nodeid])
+        elif nodeid in started:
+            # the process died inside this test: killed at the hard timeout, or the test exited/crashed it
+            killed = returncode == -1
+            records.append(PytestRecord(nodeid, "timeout" if killed else "error", message=(
+                f"pytest process killed after {timeout:g}s while this test was running" if killed
+                else f"pytest process exited during this test (return code {returncode})")))
+        else:
+            records.append(PytestRecord(nodeid, "not run"))
+    return records
+
+def run_pytest_structured(test_path: str = "test_generated.py", cwd: str | None = None,
+                          per_test_timeout: Optional[float] = None, shards: Optional[int] = None,
+                          select: Optional[List[str]] = None) -> PytestResult:
+    """
+    Runs the tests in `test_path` with a timeout per test and returns per-test records.
+    `select` limits the run to these tests ("test_x" or "TestC::test_x"; all parametrizations run).
+    Suites with enough tests are collected once and split round-robin over `shards` pytest processes
+    that run in parallel (default PYTEST_SHARDS, 0 = one per CPU). Each process also gets a hard
+    timeout of its per-test budget, for tests the per-test alarm cannot interrupt.
+    """
+    with tracing.subprocess_span("subprocess.pytest", selected=select is not None) as span:
+        res = _run_pytest_structured(test_path, cwd, per_test_timeout, shards, select)
+        span.set(returncode=res.returncode, shards=res.shards, tests=len(res.records),
+                 output_bytes=len(res.stdout.encode("utf-8")) + len(res.stderr.encode("utf-8")))
+        return res
+
+def _run_pytest_structured(test_path: str, cwd: str | None, per_test_timeout: Optional[float],
+                           shards: Optional[int], select: Optional[List[str]]) -> PytestResult:
+    start = time.perf_counter()
+    cwd = os.path.abspath(cwd or os.getcwd())
+    test_path = os.path.abspath(os.path.join(cwd, test_path))
+    if per_test_timeout is None:
+        per_test_timeout = float(os.environ.get("PYTEST_TEST_TIMEOUT", "10"))
+    if shards is None:
+        shards = int(os.environ.get("PYTEST_SHARDS", "0")) or os.cpu_count() or 1
+    pool = get_default_pool()
+    if pool is not None:
+        shards = min(shards, pool.size)
+    targets = [test_path] if select is None else [f"{test_path}::{t}" for t in select]
+    estimate = estimate_test_count(test_path) if select is None else len(select)
+    shards = max(1, min(shards, estimate // MIN_TESTS_PER_SHARD))
+
+    with tempfile.TemporaryDirectory(prefix="pytest_report_") as tmp:
+        if shards == 1:
+            path = os.path.join(tmp, "report.jsonl")
+            timeout = per_test_timeout * max(estimate, 1) + RUN_SLACK_SECONDS
+            rc, out, err = _run_reported(targets, path, per_test_timeout, timeout, cwd)
+            report = _read_report(path)
+            records = _shard_records(report[0], report, rc, timeout)
+            outputs = [(rc, out, err)]
+        else:
+            path = os.path.join(tmp, "collect.jsonl")
+            rc, out, err = _run_reported(["--collect-only"] + targets, path, per_test_timeout, RUN_SLACK_SECONDS, cwd)
+            nodeids = _read_report(path)[0]
+            if not nodeids:
+                return PytestResult(rc, [], out, err, 1, time.perf_counter() - start)
+            shards = min(shards, len(nodeids))
+            groups = [nodeids[i::shards] for i in range(shards)]
+
+            def run_shard(i):
+                shard_path = os.path.join(tmp, f"shard{i}.jsonl")
+                timeout = per_test_timeout * len(groups[i]) + RUN_SLACK_SECONDS
+                res = _run_reported(groups[i], shard_path, per_test_timeout, timeout, cwd)
+                return res, _shard_records(groups[i], _read_report(shard_path), res[0], timeout)
+
+            with ThreadPoolExecutor(max_workers=shards) as ex:
+                done = list(ex.map(run_shard, range(shards)))
+            outputs = [res for res, _ in done]
+            by_id = {r.nodeid: r for _, recs in done for r in recs}
+            records = [by_id[n] for n in nodeids]  # back in collection order
+
+    if not records:
+        rc, out, err = outputs[0]
+        return PytestResult(rc, [], out, err, shards, time.perf_counter() - start)
+    if len(outputs) == 1:
+        out, err = outputs[0][1], outputs[0][2]
+    else:
+        out = "\n".join(f"[shard {i + 1}/{len(outputs)}, rc={rc}]\n{o}" for i, (rc, o, _) in enumerate(outputs))
+        err = "\n".join(e for _, _, e in outputs if e)
+    returncode = 1 if any(r.outcome not in ("passed", "skipped") for r in records) else 0
+    return PytestResult(returncode, records, out, err, shards, time.perf_counter() - start)
+
 def make_test_runner_safe(test_content: str) -> str:
     """
     Sanity check to ensure tests won't try to do IO/network. 
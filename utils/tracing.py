@@ -0,0 +1,235 @@
+"""
+Spans and per-run metrics for the workflow.
+
+A `Tracer` belongs to one workflow run. `span(name, **attributes)` times a block (wall clock) and
+records it with the span that was current when it started as its parent; the current span follows
+asyncio tasks and `asyncio.to_thread`, so the stages of an iteration nest under it. The workflow
+records:
+  iteration / search       one graph run (workflows/stage_graph.iterate_graph)
+  stage.<name>             each stage of the graph
+  coder.attempt            each coder attempt in arun_coder_with_retries (attempt, outcome)
+  llm.<agent>              each agent call: tokens_in / tokens_out (model usage when the response
+                           reports it, else ~4 characters per token), streamed, and from
+                           utils/rate_limit.py queue_wait_s / retries
+  subprocess.run_file      running generated_code.py: returncode, output_bytes, cpu_s
+  subprocess.pytest        a pytest run: returncode, shards, tests, output_bytes, cpu_s
+`cpu_s` is the CPU time of child processes reaped while the span was open; with overlapping stages it
+also counts the other stage's children, and warm-pool workers (WARM_POOL=1) are not counted at all.
+
+`Tracer.summary()` aggregates spans by name (count, p50/p95/max wall time, SUMMED_ATTRIBUTES totals)
+and `format_summary()` prints it as a table. With TRACE_DIR set, every run is written there as JSON
+lines (`<trace id>.jsonl`, one span per line) and as OTLP/JSON (`<trace id>.otlp.json`), which
+OpenTelemetry collectors and most trace viewers import.
+"""
+import contextvars
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional
+
+try:
+    import resource
+except ImportError:  # not on Windows
+    resource = None
+
+SERVICE_NAME = "autonomous-ml-coach"
+# Numeric span attributes that add up across spans in the summary
+SUMMED_ATTRIBUTES = ("tokens_in", "tokens_out", "queue_wait_s", "retries", "cpu_s", "output_bytes", "tests")
+
+_tracer: contextvars.ContextVar[Optional["Tracer"]] = contextvars.ContextVar("tracer", default=None)
+_current: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str] = None
+    start_ns: int = 0
+    end_ns: int = 0
+    attributes: Dict[str, object] = field(default_factory=dict)
+    status: str = "ok"  # ok | error
+
+    @property
+    def seconds(self) -> float:
+        return max(0, (self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def add(self, **counters) -> None:
+        for key, value in counters.items():
+            self.attributes[key] = self.attributes.get(key, 0) + value
+
+    def as_dict(self) -> dict:
+        return {
+            "name": self.name, "trace_id": self.trace_id, "span_id": self.span_id, "parent_id": self.parent_id,
+            "start_ns": self.start_ns, "end_ns": self.end_ns, "seconds": round(self.seconds, 4),
+            "status": self.status, "attributes": self.attributes,
+        }
+
+    def as_otlp(self) -> dict:
+        span = {
+            "traceId": self.trace_id, "spanId": self.span_id, "name": self.name, "kind": 1,  # INTERNAL
+            "startTimeUnixNano": str(self.start_ns), "endTimeUnixNano": str(self.end_ns or self.start_ns),
+            "attributes": [_otlp_attribute(k, v) for k, v in self.attributes.items()],
+            "status": {"code": 2 if self.status == "error" else 1},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+def _otlp_attribute(key: str, value) -> dict:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile of non-empty `values`."""
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered), math.ceil(q * len(ordered))) - 1)]
+
+
+class Tracer:
+    """The spans of one workflow run, under a root span named "run"."""
+
+    def __init__(self, **attributes):
+        self.trace_id = os.urandom(16).hex()
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+        self.root = Span("run", self.trace_id, os.urandom(8).hex(), start_ns=time.time_ns(), attributes=attributes)
+
+    def start(self, name: str, parent: Optional[Span] = None, **attributes) -> Span:
+        parent = parent or self.root
+        return Span(name, self.trace_id, os.urandom(8).hex(), parent.span_id, time.time_ns(), attributes=attributes)
+
+    def end(self, span: Span) -> None:
+        if not span.end_ns:
+            span.end_ns = time.time_ns()
+        with self._lock:
+            self.spans.append(span)
+
+    def finish(self) -> None:
+        """End the root span (idempotent)."""
+        with self._lock:
+            if self.root.end_ns:
+                return
+        self.end(self.root)
+
+    def finished(self, since: int = 0) -> List[Span]:
+        with self._lock:
+            return list(self.spans[since:])
+
+    def summary(self) -> Dict[str, dict]:
+        by_name: Dict[str, List[Span]] = {}
+        for s in self.finished():
+            by_name.setdefault(s.name, []).append(s)
+        out = {}
+        for name, spans in by_name.items():
+            seconds = [s.seconds for s in spans]
+            row = {
+                "count": len(spans), "errors": sum(s.status == "error" for s in spans),
+                "p50_s": round(percentile(seconds, 0.5), 3), "p95_s": round(percentile(seconds, 0.95), 3),
+                "max_s": round(max(seconds), 3), "total_s": round(sum(seconds), 3),
+            }
+            for key in SUMMED_ATTRIBUTES:
+                values = [s.attributes[key] for s in spans if key in s.attributes]
+                if values:
+                    row[key] = round(sum(values), 3)
+            out[name] = row
+        return out
+
+    def format_summary(self) -> str:
+        summary = self.summary()
+        if not summary:
+            return "(no spans)"
+        extra = [k for k in ("errors",) + SUMMED_ATTRIBUTES if any(row.get(k) for row in summary.values())]
+        header = ["span", "count", "p50_s", "p95_s", "max_s", "total_s"] + extra
+        rows = [[name] + [str(row.get(k, "")) for k in header[1:]] for name, row in summary.items()]
+        widths = [max(len(r[i]) for r in rows + [header]) for i in range(len(header))]
+        return "\n".join("  ".join(c.ljust(w) for c, w in zip(r, widths)).rstrip() for r in [header] + rows)
+
+    def export_jsonl(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            for s in self.finished():
+                f.write(json.dumps(s.as_dict()) + "\n")
+
+    def export_otlp(self, path: str) -> None:
+        payload = {"resourceSpans": [{
+            "resource": {"attributes": [_otlp_attribute("service.name", SERVICE_NAME)]},
+            "scopeSpans": [{"scope": {"name": "workflows.ml_coach"}, "spans": [s.as_otlp() for s in self.finished()]}],
+        }]}
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(payload, f)
+
+    def export(self, directory: str) -> List[str]:
+        os.makedirs(directory, exist_ok=True)
+        paths = [os.path.join(directory, f"{self.trace_id}.jsonl"), os.path.join(directory, f"{self.trace_id}.otlp.json")]
+        self.export_jsonl(paths[0])
+        self.export_otlp(paths[1])
+        return paths
+
+
+def bind(tracer: Optional[Tracer]) -> None:
+    """Make `tracer` the active one for the current context (call at the start of a task)."""
+    _tracer.set(tracer)
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Span]:
+    """Record the enclosed block as a span of the active tracer; without one the span is not kept."""
+    tracer = _tracer.get()
+    if tracer is None:
+        yield Span(name, "", "", attributes=attributes)
+        return
+    s = tracer.start(name, _current.get(), **attributes)
+    token = _current.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.status = "error"
+        s.set(error=type(e).__name__)
+        raise
+    finally:
+        _current.reset(token)
+        tracer.end(s)
+
+
+@contextmanager
+def subprocess_span(name: str, **attributes) -> Iterator[Span]:
+    """`span` that also records the CPU time of child processes reaped while it is open."""
+    with span(name, **attributes) as s:
+        before = _children_cpu()
+        try:
+            yield s
+        finally:
+            if before is not None:
+                s.set(cpu_s=round(_children_cpu() - before, 4))
+
+
+def _children_cpu() -> Optional[float]:
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def export_default(tracer: Tracer) -> List[str]:
+    """Write the trace to TRACE_DIR when it is set; returns the written paths."""
+    directory = os.environ.get("TRACE_DIR")
+    return tracer.export(directory) if directory else []
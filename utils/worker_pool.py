@@ -0,0 +1,281 @@
+"""
+Warm worker pool for running generated code and pytest.
+
+Each worker is a long-lived interpreter that has already imported pytest, its installed plugins and
+common stdlib modules. For every job it forks a fresh child, so jobs stay isolated from each other
+while skipping interpreter start-up and pytest import cost. Workers talk JSON lines over stdin/stdout.
+
+Enable with WARM_POOL=1 (WARM_POOL_SIZE workers, default: CPU count). `python -m utils.worker_pool`
+compares the warm path against plain subprocesses on test_generated.py.
+"""
+import atexit
+import json
+import os
+import queue
+import select
+import subprocess
+import sys
+import threading
+import time
+from typing import Optional, Tuple
+
+PRELOAD_MODULES = (
+    "pytest", "_pytest.python", "_pytest.assertion.rewrite", "_pytest.terminal",
+    "collections", "dataclasses", "datetime", "decimal", "fractions", "functools", "itertools",
+    "json", "math", "random", "re", "runpy", "statistics", "string", "traceback", "typing", "unittest",
+)
+
+
+# ---- Worker side ----
+def _preload() -> None:
+    import importlib
+    from importlib.metadata import entry_points
+    for name in PRELOAD_MODULES:
+        try:
+            importlib.import_module(name)
+        except Exception:
+            pass
+    for ep in entry_points(group="pytest11"):
+        try:
+            ep.load()
+        except Exception:
+            pass
+    # One throwaway session pulls in the modules pytest only imports while configuring/running
+    import tempfile
+    import pytest
+    with tempfile.TemporaryDirectory() as d:
+        with open(os.path.join(d, "test_warmup.py"), "w", encoding="utf-8") as f:
+            f.write("def test_warmup():\n    assert True\n")
+        try:
+            pytest.main(["-q", "-p", "no:cacheprovider", "-W", "ignore::pytest.PytestAssertRewriteWarning", d])
+        except Exception:
+            pass
+
+
+def _child_main(job: dict) -> int:
+    """Runs inside the forked child with fds 0/1/2 already redirected; returns the exit code."""
+    import runpy
+    import traceback
+    os.chdir(job["cwd"])
+    if job["kind"] == "pytest":
+        import pytest
+        # Plugins were imported before pytest could assert-rewrite them; that only matters
+        # for asserts inside the plugins themselves, so silence the warning it would print.
+        args = ["-W", "ignore::pytest.PytestAssertRewriteWarning"] + job["args"]
+        sys.argv = ["pytest"] + args
+        sys.path[0] = os.getcwd()  # as with `python -m pytest`
+        sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # for `-p utils.pytest_report_plugin`
+        return int(pytest.main(args))
+    path = job["path"]
+    sys.argv = [path]
+    sys.path[0] = os.path.dirname(os.path.abspath(path))
+    try:
+        runpy.run_path(path, run_name="__main__")
+        return 0
+    except SystemExit as e:
+        if e.code is None:
+            return 0
+        if isinstance(e.code, int):
+            return e.code
+        print(e.code, file=sys.stderr)
+        return 1
+    except BaseException as e:
+        # Drop the worker/runpy frames so the traceback reads like `python path`
+        tb = e.__traceback__
+        while tb is not None and tb.tb_frame.f_code.co_filename != path:
+            tb = tb.tb_next
+        traceback.print_exception(type(e), e, tb or e.__traceback__)
+        return 1
+
+
+def _wait(pid: int, timeout: float) -> Optional[int]:
+    """Wait for `pid`; returns its wait status, or None if it was killed on timeout."""
+    deadline = time.monotonic() + timeout
+    pidfd = os.pidfd_open(pid) if hasattr(os, "pidfd_open") else None
+    try:
+        while True:
+            done, status = os.waitpid(pid, os.WNOHANG)
+            if done:
+                return status
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                os.kill(pid, 9)
+                os.waitpid(pid, 0)
+                return None
+            if pidfd is not None:
+                select.select([pidfd], [], [], remaining)
+            else:
+                time.sleep(min(0.005, remaining))
+    finally:
+        if pidfd is not None:
+            os.close(pidfd)
+
+
+def _run_forked(job: dict) -> dict:
+    import tempfile
+    out_f = tempfile.TemporaryFile()
+    err_f = tempfile.TemporaryFile()
+    sys.stdout.flush()
+    sys.stderr.flush()
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            devnull = os.open(os.devnull, os.O_RDONLY)
+            os.dup2(devnull, 0)
+            os.dup2(out_f.fileno(), 1)
+            os.dup2(err_f.fileno(), 2)
+            code = _child_main(job)
+        finally:
+            try:
+                sys.stdout.flush()
+                sys.stderr.flush()
+            finally:
+                os._exit(code & 0xFF if code >= 0 else 1)
+    status = _wait(pid, job["timeout"])
+    out_f.seek(0)
+    err_f.seek(0)
+    stdout = out_f.read().decode("utf-8", errors="replace")
+    stderr = err_f.read().decode("utf-8", errors="replace")
+    out_f.close()
+    err_f.close()
+    if status is None:
+        return {"timed_out": True, "returncode": -1, "stdout": stdout, "stderr": stderr}
+    returncode = os.waitstatus_to_exitcode(status)
+    return {"timed_out": False, "returncode": returncode, "stdout": stdout, "stderr": stderr}
+
+
+def _serve() -> None:
+    # Keep the protocol channel private; anything else printed to fd 1 goes to stderr.
+    proto_out = os.fdopen(os.dup(1), "w", encoding="utf-8")
+    os.dup2(2, 1)
+    _preload()
+    proto_out.write(json.dumps({"ready": True}) + "\n")
+    proto_out.flush()
+    for line in sys.stdin:
+        job = json.loads(line)
+        try:
+            res = _run_forked(job)
+        except Exception as e:
+            res = {"timed_out": False, "returncode": -2, "stdout": "", "stderr": f"Worker error: {e}"}
+        proto_out.write(json.dumps(res) + "\n")
+        proto_out.flush()
+
+
+# ---- Client side ----
+class _Worker:
+    def __init__(self):
+        self.proc = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--serve"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            text=True, encoding="utf-8", bufsize=1,
+        )
+        self.proc.stdout.readline()  # wait for the ready line
+
+    def call(self, job: dict) -> dict:
+        self.proc.stdin.write(json.dumps(job) + "\n")
+        self.proc.stdin.flush()
+        line = self.proc.stdout.readline()
+        if not line:
+            raise RuntimeError("warm worker exited")
+        return json.loads(line)
+
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def close(self) -> None:
+        if self.alive():
+            self.proc.stdin.close()
+            try:
+                self.proc.wait(timeout=2)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+
+
+class WarmPool:
+    def __init__(self, size: Optional[int] = None):
+        self.size = size or os.cpu_count() or 1
+        self._idle = queue.Queue()
+        self._workers = []
+        self._lock = threading.Lock()
+        for _ in range(self.size):
+            self._spawn()
+
+    def _spawn(self) -> None:
+        w = _Worker()
+        with self._lock:
+            self._workers.append(w)
+        self._idle.put(w)
+
+    def _call(self, job: dict) -> dict:
+        w = self._idle.get()
+        try:
+            return w.call(job)
+        except Exception:
+            w.close()
+            with self._lock:
+                self._workers.remove(w)
+            self._spawn()
+            raise
+        finally:
+            if w.alive():
+                self._idle.put(w)
+
+    def run_file(self, path: str, timeout: float = 10, cwd: Optional[str] = None) -> Tuple[int, str, str]:
+        res = self._call({"kind": "file", "path": os.path.abspath(path), "cwd": cwd or os.getcwd(), "timeout": timeout})
+        if res["timed_out"]:
+            return -1, "", "Execution timed out"
+        return res["returncode"], res["stdout"], res["stderr"]
+
+    def run_pytest(self, args: list, timeout: float = 10, cwd: Optional[str] = None) -> Tuple[int, str, str]:
+        res = self._call({"kind": "pytest", "args": list(args), "cwd": cwd or os.getcwd(), "timeout": timeout})
+        if res["timed_out"]:
+            return -1, "", "pytest timed out"
+        return res["returncode"], res["stdout"], res["stderr"]
+
+    def close(self) -> None:
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for w in workers:
+            w.close()
+
+
+_default_pool: Optional[WarmPool] = None
+_default_pool_lock = threading.Lock()
+
+
+def get_default_pool() -> Optional[WarmPool]:
+    """Process-wide pool configured from env; None unless WARM_POOL=1."""
+    global _default_pool
+    if os.environ.get("WARM_POOL", "") != "1" or not hasattr(os, "fork"):
+        return None
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = WarmPool(int(os.environ.get("WARM_POOL_SIZE", "0")) or None)
+            atexit.register(_default_pool.close)
+    return _default_pool
+
+
+def _compare(test_path: str = "test_generated.py", rounds: int = 10) -> None:
+    cmd = [sys.executable, "-m", "pytest", "-q", "--disable-warnings", test_path]
+    start = time.perf_counter()
+    for _ in range(rounds):
+        subprocess.run(cmd, capture_output=True, text=True, timeout=60)
+    cold = (time.perf_counter() - start) / rounds
+    pool = WarmPool(1)
+    try:
+        start = time.perf_counter()
+        for _ in range(rounds):
+            pool.run_pytest(cmd[3:], timeout=60)
+        warm = (time.perf_counter() - start) / rounds
+    finally:
+        pool.close()
+    print(f"subprocess pytest: {cold * 1000:.1f} ms/run")
+    print(f"warm pool pytest:  {warm * 1000:.1f} ms/run")
+
+
+if __name__ == "__main__":
+    if "--serve" in sys.argv:
+        _serve()
+    else:
+        _compare(*sys.argv[1:2])
@@ -0,0 +1,75 @@
+"""
+Per-run workspaces so concurrent workflows don't overwrite each other's generated files.
+
+Every run gets its own directory holding generated_code.py and test_generated.py (same file names as
+before, so generated tests can keep importing `generated_code`). Configuration via env:
+  WORKSPACE_ROOT   parent directory (default: ./workspaces)
+  WORKSPACE_TMPFS  1 to place workspaces under /dev/shm when available
+  WORKSPACE_RETAIN all | failed | none  -- which finished workspaces to keep (default: all)
+  WORKSPACE_KEEP   keep at most this many retained workspaces, oldest pruned first (default: 20)
+"""
+import os
+import shutil
+import tempfile
+import time
+from typing import Optional
+
+CODE_FILE = "generated_code.py"
+TEST_FILE = "test_generated.py"
+_PREFIX = "run-"
+_DONE_MARKER = ".done"  # only finished workspaces are eligible for pruning
+
+
+class Workspace:
+    def __init__(self, path: str, owned: bool = True):
+        self.path = path
+        self.owned = owned  # False for the legacy current-directory workspace, which is never deleted
+        self.code_path = os.path.join(path, CODE_FILE)
+        self.test_path = os.path.join(path, TEST_FILE)
+
+    @classmethod
+    def create(cls, root: Optional[str] = None, tmpfs: Optional[bool] = None) -> "Workspace":
+        if tmpfs is None:
+            tmpfs = os.environ.get("WORKSPACE_TMPFS", "") == "1"
+        if root is None:
+            if tmpfs and os.path.isdir("/dev/shm"):
+                root = os.path.join("/dev/shm", "ml_coach")
+            else:
+                root = os.environ.get("WORKSPACE_ROOT", "workspaces")
+        os.makedirs(root, exist_ok=True)
+        path = tempfile.mkdtemp(prefix=_PREFIX + time.strftime("%Y%m%d-%H%M%S-"), dir=root)
+        return cls(os.path.abspath(path))
+
+    @classmethod
+    def current_dir(cls) -> "Workspace":
+        """The pre-workspace layout: files in the current working directory."""
+        return cls(os.getcwd(), owned=False)
+
+    def finish(self, succeeded: bool, retain: Optional[str] = None, keep: Optional[int] = None) -> bool:
+        """Apply the retention policy; returns True if the workspace directory was kept."""
+        if not self.owned:
+            return True
+        retain = retain or os.environ.get("WORKSPACE_RETAIN", "all")
+        keep = keep if keep is not None else int(os.environ.get("WORKSPACE_KEEP", "20"))
+        kept = retain == "all" or (retain == "failed" and not succeeded)
+        if kept:
+            with open(os.path.join(self.path, _DONE_MARKER), "w", encoding="utf-8") as f:
+                f.write("succeeded\n" if succeeded else "failed\n")
+        else:
+            shutil.rmtree(self.path, ignore_errors=True)
+        prune_workspaces(os.path.dirname(self.path), keep)
+        return kept
+
+
+def prune_workspaces(root: str, keep: int) -> None:
+    """Delete all but the `keep` most recent finished workspaces under `root`."""
+    try:
+        runs = sorted(
+            (e for e in os.scandir(root)
+             if e.is_dir() and e.name.startswith(_PREFIX) and os.path.exists(os.path.join(e.path, _DONE_MARKER))),
+            key=lambda e: e.stat().st_mtime,
+        )
+    except OSError:
+        return
+    for e in runs[:max(0, len(runs) - keep)]:
+        shutil.rmtree(e.path, ignore_errors=True)
@@ -0,0 +1,172 @@
+"""
+Batch mode: run the workflow for every prompt of a JSONL file across worker processes.
+
+    python -m workflows.batch prompts.jsonl -o results.jsonl [--workers N] [--max-iters 3] [--run-timeout 8]
+
+Input lines are {"id": ..., "prompt": ...}, optionally with their own "max_iters" / "run_timeout"; a
+line without an id gets its line number. Each prompt runs `autonomous_loop` in a worker process, in its
+own workspace, with patches applied automatically. One JSON line per prompt is appended to the output
+as soon as it finishes:
+  {"id", "status": passed|failed|error, "iterations", "seconds", "result", "final_code",
+   "stage_seconds": {stage: seconds}, "queue_wait_s", "workspace", "error"}
+Re-running with the same output file resumes: prompts with a passed/failed line are skipped, errors
+are retried (--no-resume starts over). Workers default to one per CPU. When LLM_RPM, LLM_TPM or
+LLM_MAX_IN_FLIGHT is set, the workers share those limits through a RATE_LIMIT_FILE
+(utils/rate_limit.py) instead of each applying them on its own; "queue_wait_s" is the time a
+prompt's model calls spent waiting for them.
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Dict, Iterator, List, Set
+
+
+def read_prompts(path: str) -> List[dict]:
+    items, seen = [], set()
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if not isinstance(item.get("prompt"), str):
+                raise ValueError(f"{path}:{line_no}: every line needs a string 'prompt'")
+            item["id"] = str(item.get("id", line_no))
+            if item["id"] in seen:
+                print(f"[BATCH] Skipping duplicate id {item['id']!r} ({path}:{line_no})", file=sys.stderr)
+                continue
+            seen.add(item["id"])
+            items.append(item)
+    return items
+
+
+def finished_ids(path: str) -> Set[str]:
+    """Ids that already have a passed/failed result in `path`."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue  # a line cut off by an interruption
+            if rec.get("status") in ("passed", "failed"):
+                done.add(str(rec.get("id")))
+    return done
+
+
+def run_prompt(item: dict, max_iters: int, run_timeout: int) -> dict:
+    """Run the workflow for one prompt (in a worker process) and summarize the outcome."""
+    from workflows.ml_coach import autonomous_loop
+
+    start = time.perf_counter()
+    record = {"id": item["id"], "status": "error", "iterations": 0, "result": "", "final_code": "", "error": ""}
+    last: Dict[str, object] = {}
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):  # the workflow's progress prints
+            for status in autonomous_loop(item["prompt"], max_iters=int(item.get("max_iters", max_iters)),
+                                          run_timeout=int(item.get("run_timeout", run_timeout)), auto_patch_enabled=True):
+                message = str(status.get("message", ""))
+                if message.startswith("==== ITERATION"):
+                    record["iterations"] += 1
+                elif message.startswith("[RESULT]"):
+                    record["result"] = message
+                elif message.startswith("[ERROR]"):
+                    record["error"] = message
+                last.update(status)
+        passed = bool(last.get("syntax_ok")) and last.get("run_retcode") == 0 and last.get("pytest_code") == 0
+        record["status"] = "error" if record["error"] else ("passed" if passed else "failed")
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+    record["seconds"] = round(time.perf_counter() - start, 3)
+    record["final_code"] = last.get("final_code") or last.get("code_text") or ""
+    record["workspace"] = last.get("workspace", "")
+    record["stage_seconds"] = {
+        name.removeprefix("stage."): row["total_s"]
+        for name, row in (last.get("trace_summary") or {}).items() if name.startswith("stage.")
+    }
+    record["queue_wait_s"] = round(sum(
+        row.get("queue_wait_s", 0.0) for name, row in (last.get("trace_summary") or {}).items() if name.startswith("llm.")
+    ), 3)
+    return record
+
+
+def _init_worker() -> None:
+    os.environ.setdefault("STREAM_AGENTS", "0")  # nobody watches partial output in batch mode
+    os.environ["AUTO_PATCH"] = "1"
+
+
+def run_batch(items: List[dict], output: str, workers: int, max_iters: int, run_timeout: int) -> Iterator[dict]:
+    """Run `items` on `workers` processes, appending each result to `output`; yields results as they finish."""
+    ctx = multiprocessing.get_context("spawn")  # workers start clean instead of forking a threaded parent
+    with open(output, "a", encoding="utf-8") as out, \
+            ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker) as pool:
+        pending = {pool.submit(run_prompt, item, max_iters, run_timeout): item for item in items}
+        try:
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    item = pending.pop(future)
+                    try:
+                        record = future.result()
+                    except Exception as e:  # the worker process died
+                        record = {"id": item["id"], "status": "error", "error": f"{type(e).__name__}: {e}"}
+                    out.write(json.dumps(record) + "\n")
+                    out.flush()
+                    yield record
+        except BaseException:
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("prompts", help="JSONL file with {'id', 'prompt'} lines")
+    parser.add_argument("-o", "--output", default="batch_results.jsonl")
+    parser.add_argument("--workers", type=int, default=int(os.environ.get("BATCH_WORKERS", "0")) or os.cpu_count() or 1)
+    parser.add_argument("--max-iters", type=int, default=int(os.environ.get("MAX_ITERS", "3")))
+    parser.add_argument("--run-timeout", type=int, default=int(os.environ.get("RUN_TIMEOUT", "8")))
+    parser.add_argument("--no-resume", action="store_true", help="truncate the output instead of skipping finished ids")
+    args = parser.parse_args()
+
+    items = read_prompts(args.prompts)
+    if args.no_resume and os.path.exists(args.output):
+        os.remove(args.output)
+    done = finished_ids(args.output)
+    todo = [item for item in items if item["id"] not in done]
+    print(f"[BATCH] {len(items)} prompt(s), {len(items) - len(todo)} already finished, {len(todo)} to run "
+          f"on {args.workers} worker(s) -> {args.output}")
+    shared_limits = None
+    if any(os.environ.get(v) for v in ("LLM_RPM", "LLM_TPM", "LLM_MAX_IN_FLIGHT")) and not os.environ.get("RATE_LIMIT_FILE"):
+        shared_limits = tempfile.mkdtemp(prefix="batch_limits_")
+        os.environ["RATE_LIMIT_FILE"] = os.path.join(shared_limits, "limits.json")  # inherited by the workers
+    start = time.perf_counter()
+    counts = {"passed": 0, "failed": 0, "error": 0}
+    try:
+        for n, record in enumerate(run_batch(todo, args.output, args.workers, args.max_iters, args.run_timeout), 1):
+            counts[record["status"]] += 1
+            print(f"[{n}/{len(todo)}] {record['id']}: {record['status']} after {record.get('iterations', 0)} iteration(s), "
+                  f"{record.get('seconds', 0):.1f}s" + (f" ({record['error']})" if record.get("error") else ""))
+    except KeyboardInterrupt:
+        print("\n[BATCH] Interrupted; run again with the same output file to resume.")
+        return 130
+    finally:
+        if shared_limits:
+            shutil.rmtree(shared_limits, ignore_errors=True)
+    elapsed = time.perf_counter() - start
+    finished = sum(counts.values())
+    rate = finished / elapsed * 3600 if elapsed > 0 else 0.0
+    print(f"[BATCH] {counts} in {elapsed:.1f}s ({rate:.0f} prompts/hour)")
+    return 0 if not counts["error"] else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
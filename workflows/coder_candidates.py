@@ -0,0 +1,197 @@
+"""
+Speculative coder candidates.
+
+With CODER_CANDIDATES=N (N > 1) the coder stage launches N generations at once, each with its own
+sampling temperature and prompt variant. Every candidate is sanitized, statically checked and run in
+its own directory under the workspace, all in parallel. The tests are written from the chosen code, so
+"passing" here means no blocking diagnostics and a clean exit. With CODER_SELECT=first (default) the
+first candidate that passes wins and the remaining generations are cancelled; with CODER_SELECT=best all
+candidates finish and the best-scoring one is used (also the fallback when none passes).
+`evaluate_candidate` also runs a pytest suite when given one; the patch search uses that for its nodes.
+
+`CANDIDATE_STATS` keeps per-N latency and pass-rate figures, so the extra tokens can be weighed against
+the sequential retries and debug iterations they save.
+"""
+import asyncio
+import os
+import statistics
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, List, Optional, Sequence, Tuple
+
+from utils import check_cache
+from utils import inspector
+from utils import test_runner
+from utils.stream_sanitizer import estimate_tokens
+from utils.workspace import CODE_FILE, TEST_FILE
+
+# (temperature, prompt suffix) per candidate; None keeps the model default
+VARIANTS = (
+    (None, ""),
+    (0.2, "\n\nKeep the implementation minimal and deterministic."),
+    (0.7, "\n\nPrefer the Python standard library; only import third-party packages the spec requires."),
+    (1.0, "\n\nInclude a short `if __name__ == \"__main__\":` usage example that runs quickly."),
+)
+# Diagnostics that make a syntactically valid candidate fail (see utils/static_check.py)
+BLOCKING_CODES = ("E999", "F821", "I900")
+
+
+def variant(i: int) -> Tuple[Optional[float], str]:
+    """Sampling settings for candidate `i`; past the listed variants the temperature keeps rising."""
+    temperature, suffix = VARIANTS[i % len(VARIANTS)]
+    rounds = i // len(VARIANTS)
+    if rounds:
+        temperature = min(1.5, (temperature or 0.5) + 0.1 * rounds)
+    return temperature, suffix
+
+
+@dataclass
+class Candidate:
+    index: int
+    temperature: Optional[float] = None
+    code: str = ""
+    diagnostics: list = field(default_factory=list)
+    run_code: Optional[int] = None
+    run_stdout: str = ""
+    run_stderr: str = ""
+    pytest_code: Optional[int] = None
+    pytest_stdout: str = ""
+    pytest_stderr: str = ""
+    tests_passed: int = 0
+    tests_total: int = 0
+    test_records: list = field(default_factory=list)
+    error: str = ""
+    gen_seconds: float = 0.0
+    eval_seconds: float = 0.0
+
+    @property
+    def syntax_ok(self) -> bool:
+        return bool(self.code.strip()) and not any(d.code == "E999" for d in self.diagnostics)
+
+    @property
+    def passed(self) -> bool:
+        return (
+            self.syntax_ok
+            and not any(d.code in BLOCKING_CODES for d in self.diagnostics)
+            and self.run_code == 0
+            and self.pytest_code in (None, 0)
+        )
+
+    def score(self) -> tuple:
+        """Ordering used when no candidate passes; higher is better."""
+        return (
+            self.syntax_ok,
+            self.pytest_code == 0,
+            self.tests_passed / self.tests_total if self.tests_total else 0.0,
+            self.run_code == 0,
+            -sum(d.code in BLOCKING_CODES for d in self.diagnostics),
+            -len(self.diagnostics),
+        )
+
+    def status(self) -> str:
+        if self.error:
+            return f"error ({self.error})"
+        if not self.syntax_ok:
+            return "no valid code"
+        parts = [f"run rc={self.run_code}"]
+        if self.pytest_code is not None:
+            parts.append(f"tests {self.tests_passed}/{self.tests_total}")
+        parts.append(f"{len(self.diagnostics)} static issue(s)")
+        return ("passed" if self.passed else "failed") + ": " + ", ".join(parts)
+
+    def summary(self) -> dict:
+        return {
+            "index": self.index,
+            "temperature": self.temperature,
+            "passed": self.passed,
+            "status": self.status(),
+            "gen_seconds": round(self.gen_seconds, 3),
+            "eval_seconds": round(self.eval_seconds, 3),
+        }
+
+
+def evaluate_candidate(cand: Candidate, directory: str, run_timeout: float, test_text: Optional[str] = None) -> Candidate:
+    """Static checks, a run and (when `test_text` is given) pytest for one candidate, inside `directory`.
+
+    Run and pytest outcomes already known for an equivalent version come from the check cache.
+    """
+    start = time.perf_counter()
+    os.makedirs(directory, exist_ok=True)
+    code_path = os.path.join(directory, CODE_FILE)
+    with open(code_path, "w", encoding="utf-8") as f:
+        f.write(cand.code)
+    cand.diagnostics = inspector.check_code(cand.code, code_path)
+    if cand.syntax_ok:
+        (cand.run_code, cand.run_stdout, cand.run_stderr), _ = check_cache.cached_run_file(cand.code, code_path, run_timeout, directory)
+        if test_text:
+            test_path = os.path.join(directory, TEST_FILE)
+            # Keyed on the saved (normalized) tests, like the workflow's pytest stage
+            test_source = test_runner.save_test_file(test_text, path=test_path)
+            res, _ = check_cache.cached_run_pytest(cand.code, test_source, test_path, directory)
+            cand.pytest_code, cand.pytest_stdout, cand.pytest_stderr = res.returncode, res.stdout, res.stderr
+            cand.test_records = res.records
+            cand.tests_passed, cand.tests_total = res.counts()
+    cand.eval_seconds = time.perf_counter() - start
+    return cand
+
+
+async def race(launchers: Sequence[Callable[[], Awaitable[Candidate]]], first_pass_wins: bool = True) -> Tuple[Candidate, List[Candidate]]:
+    """Run all launchers concurrently; returns (selected candidate, candidates that finished).
+
+    Launchers must not raise (failures are recorded on the Candidate). Unfinished launchers are
+    cancelled once a winner is known.
+    """
+    tasks = [asyncio.ensure_future(launch()) for launch in launchers]
+    finished: List[Candidate] = []
+    winner = None
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            cand = await next_done
+            finished.append(cand)
+            if first_pass_wins and cand.passed:
+                winner = cand
+                break
+    finally:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    if winner is None:
+        winner = max(finished, key=lambda c: c.score())  # ties go to the one that finished first
+    return winner, finished
+
+
+class CandidateStats:
+    """Process-wide latency / pass-rate figures per candidate count N."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_n = {}
+
+    def record(self, n: int, seconds: float, winner: Candidate, finished: Sequence[Candidate]) -> None:
+        with self._lock:
+            s = self._by_n.setdefault(n, {"runs": 0, "passed": 0, "latencies": [], "finished": 0, "cancelled": 0, "tokens": 0})
+            s["runs"] += 1
+            s["passed"] += int(winner.passed)
+            s["latencies"].append(seconds)
+            s["finished"] += len(finished)
+            s["cancelled"] += n - len(finished)
+            s["tokens"] += sum(estimate_tokens(c.code) for c in finished)
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                n: {
+                    "runs": s["runs"],
+                    "pass_rate": round(s["passed"] / s["runs"], 3),
+                    "p50_s": round(statistics.median(s["latencies"]), 3),
+                    "mean_s": round(statistics.fmean(s["latencies"]), 3),
+                    "finished": s["finished"],
+                    "cancelled": s["cancelled"],
+                    "code_tokens_est": s["tokens"],
+                }
+                for n, s in sorted(self._by_n.items())
+            }
+
+
+CANDIDATE_STATS = CandidateStats()
@@ -0,0 +1,194 @@
+"""
+Background job runner for the workflow.
+
+`JobRunner.submit(prompt, **options)` starts `autonomous_loop` on a worker thread and returns a job id
+right away; the caller (the Streamlit app) polls the job instead of driving the loop itself. Pass the
+user's key as the `api_key` option: runs share the process, so the environment cannot carry it.
+  job.snapshot()        the latest view of the run: status, last message, research/code/tests/debugger
+                        text (the streamed partial text while a stage is generating), recent messages
+  job.events(since)     status updates numbered from 1, for subscribers that want every update;
+                        with `timeout` it waits for the next one. Only the last EVENT_BUFFER are kept.
+  job.cancel()          stops the run at its next status update
+  job.respond(approve)  answers a pending patch approval (runs without auto-patch ask instead of
+                        prompting on the terminal; unanswered requests are skipped after
+                        JOBS_APPROVAL_TIMEOUT seconds)
+JOBS_WORKERS runs execute at once (default 4); later submissions queue. Finished jobs are dropped
+JOBS_TTL seconds after they end (default 3600).
+"""
+import collections
+import os
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional, Tuple
+
+from utils.import_timing import timed_import
+
+EVENT_BUFFER = 2000
+RECENT_MESSAGES = 50
+# Final artifact per streamed stage; it replaces the partial text when it arrives
+STAGE_ARTIFACTS = {"researcher": "research_text", "coder": "code_text", "test_writer": "test_text", "debugger": "debugger_output"}
+ACTIVE = ("queued", "running", "awaiting_approval")
+
+
+@dataclass
+class Job:
+    id: str
+    prompt: str
+    options: dict = field(repr=False)  # may hold the user's API key
+    status: str = "queued"  # queued | running | awaiting_approval | finished | cancelled | error
+    error: str = ""
+    created: float = field(default_factory=time.time)
+    started: Optional[float] = None
+    ended: Optional[float] = None
+    state: Dict[str, object] = field(default_factory=dict)    # status updates merged, without streamed text
+    streams: Dict[str, str] = field(default_factory=dict)     # stage -> partial text while it streams
+    _events: Deque[Tuple[int, dict]] = field(default_factory=lambda: collections.deque(maxlen=EVENT_BUFFER))
+    _messages: Deque[str] = field(default_factory=lambda: collections.deque(maxlen=RECENT_MESSAGES))
+    _seq: int = 0
+    _cond: threading.Condition = field(default_factory=threading.Condition)
+    _cancelled: threading.Event = field(default_factory=threading.Event)
+    _approval: Optional[bool] = None
+    _approval_ready: threading.Event = field(default_factory=threading.Event)
+
+    @property
+    def active(self) -> bool:
+        return self.status in ACTIVE
+
+    def publish(self, status: dict) -> None:
+        with self._cond:
+            self._seq += 1
+            self._events.append((self._seq, status))
+            stage = status.get("stream_stage")
+            if stage:
+                self.streams[stage] = status.get("stream_text", "")
+            else:
+                self.state.update(status)
+                for stage, artifact in STAGE_ARTIFACTS.items():
+                    if artifact in status:
+                        self.streams.pop(stage, None)
+                if status.get("message"):
+                    self._messages.append(str(status["message"]))
+            self._cond.notify_all()
+
+    def _set_status(self, status: str) -> None:
+        with self._cond:
+            self.status = status
+            self._cond.notify_all()
+
+    def events(self, since: int = 0, timeout: Optional[float] = None) -> Tuple[List[dict], int]:
+        """Status updates numbered after `since`, and the number to pass next time.
+
+        With `timeout`, waits up to that long for an update when none is there yet (or the job ended).
+        """
+        with self._cond:
+            if timeout is not None:
+                self._cond.wait_for(lambda: self._seq > since or not self.active, timeout)
+            return [status for seq, status in self._events if seq > since], self._seq
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            view = {k: self.state[k] for k in ("message", *STAGE_ARTIFACTS.values(), "patch_text") if k in self.state}
+            return {
+                "id": self.id, "status": self.status, "error": self.error, "events": self._seq,
+                "seconds": round((self.ended or time.time()) - (self.started or time.time()), 1),
+                **view, "streams": dict(self.streams), "messages": list(self._messages),
+            }
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+        self.respond(False)
+
+    def respond(self, approve: bool) -> None:
+        self._approval = approve
+        self._approval_ready.set()
+
+    def _approve_patch(self, code_path: str, patch_text: str) -> bool:
+        # Called on the job's thread by the workflow when auto-patching is off
+        timeout = float(os.environ.get("JOBS_APPROVAL_TIMEOUT", "600"))
+        self._approval_ready.clear()
+        self._set_status("awaiting_approval")
+        self.publish({"message": f"[USER] Waiting for approval to apply the patch to {code_path}...",
+                      "awaiting_approval": True, "patch_text": patch_text})
+        answered = self._approval_ready.wait(timeout)
+        self._set_status("running")
+        self.publish({"awaiting_approval": False})
+        return answered and bool(self._approval) and not self._cancelled.is_set()
+
+    def run(self) -> None:
+        if self._cancelled.is_set():
+            self._set_status("cancelled")
+            self.ended = time.time()
+            return
+        self.started = time.time()
+        self._set_status("running")
+        try:
+            ml_coach = timed_import("workflows.ml_coach")
+            updates = ml_coach.autonomous_loop(self.prompt, approve_patch=self._approve_patch, **self.options)
+            try:
+                for status in updates:
+                    self.publish(status)
+                    if self._cancelled.is_set():
+                        break
+            finally:
+                updates.close()  # ends the current graph and lets the loop clean up its workspace
+            final = "cancelled" if self._cancelled.is_set() else "finished"
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+            self.publish({"message": f"[ERROR] {self.error}", "traceback": traceback.format_exc()})
+            final = "error"
+        self.ended = time.time()
+        self._set_status(final)
+
+
+class JobRunner:
+    def __init__(self, workers: int = 4, ttl: float = 3600.0):
+        self.ttl = ttl
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="coach-job")
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, prompt: str, **options) -> str:
+        """Queue a workflow run; `options` are passed to autonomous_loop. Returns the job id."""
+        job = Job(uuid.uuid4().hex[:12], prompt, options)
+        with self._lock:
+            self._evict()
+            self._jobs[job.id] = job
+        self._pool.submit(job.run)
+        return job.id
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def queued_ahead(self, job_id: str) -> int:
+        """Queued jobs submitted before `job_id`."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return 0
+            return sum(j.status == "queued" and j.created < job.created for j in self._jobs.values())
+
+    def _evict(self) -> None:
+        now = time.time()
+        for job_id in [j.id for j in self._jobs.values() if j.ended and now - j.ended > self.ttl]:
+            del self._jobs[job_id]
+
+
+_default_runner: Optional[JobRunner] = None
+_default_runner_lock = threading.Lock()
+
+
+def get_default_runner() -> JobRunner:
+    """Process-wide runner configured from env (JOBS_WORKERS, JOBS_TTL)."""
+    global _default_runner
+    with _default_runner_lock:
+        if _default_runner is None:
+            _default_runner = JobRunner(
+                workers=max(1, int(os.environ.get("JOBS_WORKERS", "4"))),
+                ttl=float(os.environ.get("JOBS_TTL", "3600")),
+            )
+        return _default_runner
@@ -1,24 +1,49 @@
 """
 Autonomous ML Coach workflow (final):
   - researcher -> coder (with sanitizer + retries) -> save code
-  - inspector (syntax + run)
+  - inspector (syntax + run), concurrently with:
   - test-writer -> save tests -> pytest
   - debugger analyzes diagnostics and may suggest PATCH
   - if syntax failed and debugger provided a PATCH, auto-apply PATCH once (safe)
   - optionally prompt user to apply further PATCHes or use AUTO_PATCH=1
+  - with INCREMENTAL=1 (default) later iterations reuse the research spec and tests
+    and start from the patched generated_code.py, re-running only checks + debugger
+    and the tests affected by the patch
+  - in incremental mode a patch that leads back to an already checked version ends the loop,
+    and run/pytest outcomes of checked versions are reused (utils/check_cache.py)
+  - with PATCH_SEARCH=1 the first iteration is followed by a best-first search over
+    several debugger patches per round, evaluated in parallel sandboxes
 """
 
+import asyncio
 import os
 import re
+import sys
 import time
 from typing import Tuple
 
-from agents.researcher import create_researcher_agent
-from agents.coder import create_coder_agent
-from agents.debugger import create_debugger_agent
-from agents.test_writer import create_test_writer_agent
+_import_start = time.perf_counter()
+from agents.common import arun_agent, model_id
+from utils import check_cache
+from utils import import_timing
 from utils import inspector
+from utils import patcher
+from utils import prompt_budget
+from utils import rate_limit
+from utils import test_impact
 from utils import test_runner
+from utils import tracing
+from utils.agent_cache import get_default_cache
+from utils.sanitizer import sanitize_generated_code, strip_code_fence
+from utils.static_check import format_diagnostics
+from utils.stream_sanitizer import STREAM_STATS, StopGeneration, StreamingCodeValidator
+from utils.workspace import Workspace
+from workflows import coder_candidates
+from workflows import model_routing
+from workflows import patch_search
+from workflows import triage
+from workflows.stage_graph import Stage, StageGraph, iterate_graph
+import_timing.record("workflows.ml_coach", time.perf_counter() - _import_start)
 
 # Helpers 
 def extract_content(obj):
@@ -35,24 +60,15 @@ def extract_content(obj):
         pass
     return str(obj)
 
-def strip_code_fence(s: str) -> str:
-    if not s:
-        return s
-    s = s.strip()
-    # If it's a fenced block, remove fence and return inner content
-    fence_match = re.search(r"```(?:python)?\n(.*?)\n```", s, flags=re.DOTALL | re.IGNORECASE)
-    if fence_match:
-        return fence_match.group(1).strip()
-    # otherwise remove leading/trailing triple-backticks if present
-    s = re.sub(r"^```(?:python)?\s*", "", s, flags=re.IGNORECASE)
-    s = re.sub(r"\s*```$", "", s, flags=re.IGNORECASE)
-    return s
-
 def save_code(text: str, path: str = "generated_code.py"):
     with open(path, "w", encoding="utf-8") as f:
         f.write(text)
     print(f"[IO] Saved code -> {path}")
 
+def load_code(path: str = "generated_code.py") -> str:
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
 # Sanitizer + coder retry logic
 MAX_CODER_RETRIES = 2
 STRICT_CODER_SUFFIX = (
@@ -60,55 +76,6 @@ STRICT_CODER_SUFFIX = (
     "Do NOT use triple-backticks. If you include function docstrings they MUST be triple-quoted. End with valid code."
 )
 
-def _clean_docstring_noise(code: str) -> str:
-    if not code:
-        return code
-    # Replace multiple adjacent triple-quote sequences with one
-    code = re.sub(r'(["\']{3}){2,}', r'\1', code)
-    # If starts with single triple quote and not closed, close it
-    if code.startswith('"""') and code.count('"""') == 1:
-        code = code + '\n"""'
-    if code.startswith("'''") and code.count("'''") == 1:
-        code = code + "\n'''"
-    # Remove stray triple-quote-only lines
-    code = re.sub(r'^[ \t]*("{3}|\'{3})[ \t]*$', '', code, flags=re.MULTILINE)
-    # Collapse duplicated docstrings
-    code = re.sub(r'("""\s*""")+', '"""', code)
-    return code.strip()
-
-def sanitize_generated_code(raw: str) -> str:
-    if not raw:
-        return ""
-    s = raw.strip()
-    # 1) prefer fenced block
-    fence_match = re.search(r"```(?:python)?\n(.*?)\n```", s, flags=re.DOTALL | re.IGNORECASE)
-    if fence_match:
-        code = fence_match.group(1).strip()
-        return _clean_docstring_noise(code)
-    # 2) remove lines that are exactly quote sequences
-    s = re.sub(r'^[ \t]*("{3,}|\'{3,})[ \t]*$', '', s, flags=re.MULTILINE)
-    # 3) accidental '"""def' -> remove leading quotes
-    s = re.sub(r'^(?P<q>["\']{3,})\s*(?=(def |class |import |from ))', '', s, count=1)
-    # 4) find first python code token
-    token_search = re.search(r'\b(def |class |import |from )', s)
-    if token_search:
-        pos = token_search.start()
-        leading = s[:pos].strip()
-        code_part = s[pos:].lstrip()
-        if leading:
-            leading = re.sub(r'(^```(?:python)?\s*|\s*```$)', '', leading, flags=re.IGNORECASE).strip()
-            leading = re.sub(r'(^["\']{3,}\s*|\s*["\']{3,}$)', '', leading).strip()
-            leading = re.sub(r'\n\s*\n+', '\n\n', leading).strip()
-            doc = '"""' + leading + '"""' + "\n\n"
-            cleaned = doc + _clean_docstring_noise(code_part)
-            return cleaned
-        else:
-            return _clean_docstring_noise(code_part)
-    # 5) no tokens found -> strip fences and return best-effort
-    s = re.sub(r'(^```(?:python)?\s*|\s*```$)', '', s, flags=re.IGNORECASE).strip()
-    s = _clean_docstring_noise(s)
-    return s
-
 def _looks_like_valid_python(code: str) -> bool:
     if not code or len(code.strip()) < 5:
         return False
@@ -123,210 +90,690 @@ def _looks_like_valid_python(code: str) -> bool:
         return True
     return False
 
-def run_coder_with_retries(coder_agent, base_coder_prompt: str) -> str:
+def _remember_response(agent, prompt: str, text: str) -> None:
+    # A stream cut short once the code is complete never reaches the cache's own store; keep what was accepted
+    remember = getattr(agent, "remember", None)
+    if callable(remember):
+        remember(prompt, text)
+
+def _forget_response(agent, prompt: str) -> None:
+    # A rejected answer must not be served from the agent cache to the next attempt (or the next run)
+    forget = getattr(agent, "forget", None)
+    if callable(forget):
+        forget(prompt)
+
+async def arun_coder_with_retries(coder_agent, base_coder_prompt: str, stream=None, emit=None, retries: int = MAX_CODER_RETRIES,
+                                  agent_for_attempt=None) -> str:
+    """`stream` is an optional _StreamEmitter that receives the raw coder output of each attempt.
+
+    When streaming, a StreamingCodeValidator watches the output and cancels attempts that cannot be
+    used (retrying immediately) or that already contain everything the sanitizer will keep.
+    `agent_for_attempt(attempt)` picks the coder for each attempt instead of `coder_agent` (model routing).
+    """
     attempt = 0
     sanitized = ""
-    while attempt <= MAX_CODER_RETRIES:
+    validate = stream is not None and os.environ.get("STREAM_VALIDATE", "1") != "0"
+    while attempt <= retries:
         attempt += 1
-        if attempt == 1:
-            raw_out = coder_agent.run(base_coder_prompt)
-        else:
-            raw_out = coder_agent.run(base_coder_prompt + "\n\n" + STRICT_CODER_SUFFIX)
-        last_raw = extract_content(raw_out)
-        last_raw = strip_code_fence(last_raw)
-        sanitized = sanitize_generated_code(last_raw)
-        if _looks_like_valid_python(sanitized):
-            return sanitized
-        time.sleep(0.3)
+        prompt = base_coder_prompt if attempt == 1 else base_coder_prompt + "\n\n" + STRICT_CODER_SUFFIX
+        if agent_for_attempt is not None:
+            previous, coder_agent = coder_agent, agent_for_attempt(attempt)
+            if attempt > 1 and emit is not None and model_id(coder_agent) != model_id(previous):
+                emit({"message": f"[ROUTING] Coder attempt {attempt} escalated to {model_id(coder_agent)} "
+                                 f"(attempt {attempt - 1} was rejected).", "coder_model": model_id(coder_agent)})
+        validator = StreamingCodeValidator() if validate else None
+        def validated_chunk(delta, validator=validator):
+            validator.feed(delta)
+            stream(delta)
+        on_chunk = validated_chunk if validate else stream
+        if stream is not None:
+            stream.reset()
+        with tracing.span("coder.attempt", attempt=attempt) as span:
+            try:
+                raw_out = await arun_agent(coder_agent, prompt, on_chunk=on_chunk)
+                if validate:
+                    STREAM_STATS.record_completed(raw_out)
+            except StopGeneration as stop:
+                saved = STREAM_STATS.record_stop(stop)
+                if emit is not None:
+                    emit({
+                        "message": f"[STREAM] Coder attempt {attempt} {'stopped early' if stop.accept else 'aborted'}: {stop.reason} (~{saved} tokens saved).",
+                        "coder_stream_stats": STREAM_STATS.as_dict(),
+                    })
+                raw_out = stop.text
+                if stop.accept:
+                    _remember_response(coder_agent, prompt, raw_out)
+                else:
+                    span.set(outcome="aborted")
+                    _forget_response(coder_agent, prompt)
+                    sanitized = sanitize_generated_code(strip_code_fence(raw_out))  # best effort if no retry is left
+                    continue  # retry immediately, no back-off
+            finally:
+                if stream is not None:
+                    stream.flush()
+            last_raw = extract_content(raw_out)
+            last_raw = strip_code_fence(last_raw)
+            sanitized = sanitize_generated_code(last_raw)
+            if _looks_like_valid_python(sanitized):
+                span.set(outcome="valid")
+                return sanitized
+            span.set(outcome="invalid")
+            _forget_response(coder_agent, prompt)
+        await asyncio.sleep(0.3)
     return sanitized
 
-# Fix simple unquoted docstrings inside functions
-def fix_unquoted_docstrings(code: str) -> str:
-    if not code:
-        return code
-    lines = code.splitlines()
-    out_lines = []
-    i = 0
-    n = len(lines)
-    while i < n:
-        line = lines[i]
-        out_lines.append(line)
-        m = re.match(r'^(\s*)def\s+\w+\s*\(.*\)\s*:\s*$', line)
-        if m:
-            indent = m.group(1) + "    "
-            j = i + 1
-            while j < n and lines[j].strip() == "":
-                out_lines.append(lines[j])
-                j += 1
-            doc_lines = []
-            while j < n:
-                nxt = lines[j]
-                if not nxt.startswith(indent) and nxt.strip() != "":
-                    break
-                stripped = nxt[len(indent):] if nxt.startswith(indent) else nxt.lstrip()
-                if re.match(r'^(?:return\b|if\b|for\b|while\b|with\b|assert\b|import\b|from\b|def\b|class\b)', stripped):
-                    break
-                if stripped.startswith('"""') or stripped.startswith("'''") or stripped.startswith('"') or stripped.startswith("'"):
-                    break
-                doc_lines.append(stripped)
-                j += 1
-            doc_lines_clean = [dl.rstrip() for dl in doc_lines]
-            non_empty = [dl for dl in doc_lines_clean if dl.strip() != ""]
-            if len(non_empty) >= 1:
-                remove_count = 0
-                while remove_count < (j - (i + 1)):
-                    out_lines.pop()
-                    remove_count += 1
-                docstring = '\n'.join(non_empty)
-                docstring_lines = [indent + '"""' + (docstring.splitlines()[0] if docstring else "")]
-                rem = docstring.splitlines()[1:]
-                for l in rem:
-                    docstring_lines.append(indent + l)
-                docstring_lines.append(indent + '"""')
-                for dl in docstring_lines:
-                    out_lines.append(dl)
-                if j < n and lines[j].strip() != "":
-                    out_lines.append(indent.rstrip())
-                i = j - 1
-        i += 1
-    return "\n".join(out_lines)
-
-# ---- Patch extractor utility ----
-def extract_patch_from_debugger(text: str) -> str | None:
-    if not text:
+def run_coder_with_retries(coder_agent, base_coder_prompt: str) -> str:
+    return asyncio.run(arun_coder_with_retries(coder_agent, base_coder_prompt))
+
+# ---- Streaming ----
+STREAM_INTERVAL = float(os.environ.get("STREAM_INTERVAL", "0.2"))
+
+class _StreamEmitter:
+    """Collects streamed agent text and emits it as throttled "[STREAM]" status updates.
+
+    Each update carries the text so far (`stream_text`) and what arrived since the previous
+    update (`stream_delta`), tagged with the producing stage (`stream_stage`).
+    """
+
+    def __init__(self, emit, stage: str, label: str, interval: float = STREAM_INTERVAL):
+        self.emit = emit
+        self.stage = stage
+        self.label = label
+        self.interval = interval
+        self.text = ""
+        self._pending = ""
+        self._last = 0.0
+
+    def __call__(self, delta: str) -> None:
+        self.text += delta
+        self._pending += delta
+        if time.monotonic() - self._last >= self.interval:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._pending:
+            return
+        self.emit({
+            "message": f"[STREAM] {self.label}: {len(self.text)} chars received...",
+            "stream_stage": self.stage, "stream_text": self.text, "stream_delta": self._pending,
+        })
+        self._pending = ""
+        self._last = time.monotonic()
+
+    def reset(self) -> None:
+        self.text = ""
+        self._pending = ""
+
+def _stream_for(ctx, emit, stage: str, label: str):
+    return _StreamEmitter(emit, stage, label) if ctx["stream"] else None
+
+async def _arun_streamed(agent, prompt, stream):
+    if stream is None:
+        return await arun_agent(agent, prompt)
+    out = await arun_agent(agent, prompt, on_chunk=stream)
+    stream.flush()
+    return out
+
+def _spec_index():
+    # utils.spec_index (and numpy with it) is only imported once SPEC_REUSE is on
+    if os.environ.get("SPEC_REUSE", "") != "1":
         return None
-    m = re.search(r"```PATCH\s*(.*?)\s*```", text, flags=re.DOTALL)
-    if m:
-        return m.group(1).strip()
-    return None
+    return import_timing.timed_import("utils.spec_index").get_default_index()
 
 # ---- One iteration runner ----
-def run_iteration(researcher, coder, test_writer, debugger, user_prompt, run_timeout):
-    """Runs one full iteration and yields status updates."""
-    yield {"message": "[STEP] Running Researcher..."}
-    r_out = researcher.run(user_prompt)
+# Each stage reads/writes artifacts in the shared `ctx` dict and reports progress through `emit`.
+async def _research_stage(ctx, emit):
+    if ctx["r_text"] is not None:
+        emit({"message": "[STEP] Reusing research spec from the first iteration."})
+        return
+    spec_index = _spec_index()
+    if spec_index is not None:
+        r_text, score = spec_index.lookup(ctx["user_prompt"])
+        if r_text is not None:
+            ctx["r_text"] = r_text
+            emit({
+                "message": f"[STEP] Reusing researcher spec of a similar prompt (similarity {score:.2f}, lookup {spec_index.last_lookup_ms:.2f} ms).",
+                "research_text": r_text, "spec_similarity": score, "spec_lookup_ms": spec_index.last_lookup_ms,
+            })
+            return
+    emit({"message": "[STEP] Running Researcher..."})
+    r_out = await _arun_streamed(ctx["researcher"], ctx["user_prompt"], _stream_for(ctx, emit, "researcher", "Researcher"))
     r_text = extract_content(r_out)
-    yield {"message": "[STEP] Researcher produced text.", "research_text": r_text}
-
-    # Coder (with retries + sanitizer)
-    yield {"message": "[STEP] Running Coder (with sanitizer + retries)..."}
-    base_coder_prompt = "Based on this spec produce runnable Python code only (no extra explanation):\n\n" + r_text
-    c_text = run_coder_with_retries(coder, base_coder_prompt)
-    # additional protective fixes
-    c_text = fix_unquoted_docstrings(c_text)
-    yield {"message": "[STEP] Coder produced sanitized code.", "code_text": c_text}
-
-    # Save + static + runtime checks
-    save_code(c_text)
-    syn_ok, syn_msg = inspector.run_syntax_check("generated_code.py")
-    yield {"message": f"[CHECK] Syntax: {syn_msg}", "syntax_ok": syn_ok, "syntax_msg": syn_msg}
-
-    code_run_ret, run_stdout, run_stderr = inspector.run_file("generated_code.py", timeout=run_timeout)
-    yield {
-        "message": f"[RUN] Code executed with return code: {code_run_ret}",
+    if spec_index is not None and r_text:
+        spec_index.add(ctx["user_prompt"], r_text)
+    ctx["r_text"] = r_text
+    emit({"message": "[STEP] Researcher produced text.", "research_text": r_text})
+
+async def _coder_stage(ctx, emit):
+    ws = ctx["workspace"]
+    if ctx["c_text"] is not None:
+        emit({"message": f"[STEP] Continuing from patched {ws.code_path}.", "code_text": ctx["c_text"]})
+        return
+    base_coder_prompt = "Based on this spec produce runnable Python code only (no extra explanation):\n\n" + ctx["r_text"]
+    if ctx["coder_candidates"]:
+        c_text = await _race_coder_candidates(ctx, emit, base_coder_prompt)
+    else:
+        # Coder (with retries + sanitizer)
+        emit({"message": "[STEP] Running Coder (with sanitizer + retries)..."})
+        router = ctx.get("router")
+        c_text = await arun_coder_with_retries(
+            ctx["coder"], base_coder_prompt, stream=_stream_for(ctx, emit, "coder", "Coder"), emit=emit,
+            agent_for_attempt=(lambda attempt: router.agent("coder", attempt)) if router is not None else None,
+        )
+    ctx["c_text"] = c_text
+    save_code(c_text, ws.code_path)
+    emit({"message": "[STEP] Coder produced sanitized code.", "code_text": c_text})
+
+async def _race_coder_candidates(ctx, emit, base_coder_prompt):
+    """Generate and evaluate len(ctx["coder_candidates"]) coder variants concurrently; returns the chosen code."""
+    ws = ctx["workspace"]
+    candidates = ctx["coder_candidates"]
+    first_pass_wins = os.environ.get("CODER_SELECT", "first") != "best"
+    emit({"message": f"[STEP] Running {len(candidates)} Coder candidates in parallel (select: {'first passing' if first_pass_wins else 'best'})..."})
+
+    def launcher(i, agent, temperature, suffix):
+        async def launch():
+            cand = coder_candidates.Candidate(i + 1, temperature)
+            start = time.perf_counter()
+            try:
+                # One attempt each: the other candidates take the place of sequential retries
+                code = await arun_coder_with_retries(agent, base_coder_prompt + suffix, emit=emit, retries=0)
+                cand.code = code
+            except Exception as e:
+                cand.error = f"{type(e).__name__}: {e}"
+            cand.gen_seconds = time.perf_counter() - start
+            if cand.code:
+                directory = os.path.join(ws.path, "candidates", f"c{cand.index}")
+                await asyncio.to_thread(coder_candidates.evaluate_candidate, cand, directory, ctx["run_timeout"])
+            emit({"message": f"[CODER] Candidate {cand.index} (t={temperature}): {cand.status()}", "coder_candidate": cand.summary()})
+            return cand
+        return launch
+
+    start = time.perf_counter()
+    winner, finished = await coder_candidates.race(
+        [launcher(i, agent, t, suffix) for i, (agent, t, suffix) in enumerate(candidates)], first_pass_wins
+    )
+    elapsed = time.perf_counter() - start
+    coder_candidates.CANDIDATE_STATS.record(len(candidates), elapsed, winner, finished)
+    if not winner.code.strip():
+        raise RuntimeError(f"none of the {len(candidates)} coder candidates produced code "
+                           f"({'; '.join(c.status() for c in finished)})")
+    emit({
+        "message": f"[CODER] Selected candidate {winner.index} ({'passed' if winner.passed else 'best score'}) after {elapsed:.1f}s; "
+                   f"{len(finished)}/{len(candidates)} finished, {len(candidates) - len(finished)} cancelled.",
+        "coder_candidates": [c.summary() for c in finished],
+        "candidate_stats": coder_candidates.CANDIDATE_STATS.as_dict(),
+    })
+    return winner.code
+
+async def _checks_stage(ctx, emit):
+    # Static + runtime checks (static ones run on the in-memory code, no file round-trip)
+    ws = ctx["workspace"]
+    diagnostics = inspector.check_code(ctx["c_text"], ws.code_path)
+    syn_ok, syn_msg = inspector.syntax_status(diagnostics, ws.code_path)
+    ctx["syn_ok"], ctx["syn_msg"], ctx["diagnostics"] = syn_ok, syn_msg, diagnostics
+    emit({"message": f"[CHECK] Syntax: {syn_msg}", "syntax_ok": syn_ok, "syntax_msg": syn_msg})
+    if syn_ok:
+        emit({
+            "message": f"[CHECK] Static checks: {len(diagnostics)} issue(s).",
+            "diagnostics": [d.as_dict() for d in diagnostics],
+        })
+
+    (code_run_ret, run_stdout, run_stderr), cached = await asyncio.to_thread(
+        check_cache.cached_run_file, ctx["c_text"], ws.code_path, ctx["run_timeout"], ws.path
+    )
+    ctx["run_code"], ctx["run_stdout"], ctx["run_stderr"] = code_run_ret, run_stdout, run_stderr
+    emit({
+        "message": f"[RUN] Code executed with return code: {code_run_ret}{' (cached)' if cached else ''}",
         "run_retcode": code_run_ret, "run_stdout": run_stdout, "run_stderr": run_stderr
-    }
+    })
 
-    # Test-Writer -> tests -> run pytest
-    yield {"message": "[STEP] Running Test-Writer to generate pytest tests..."}
+async def _test_writer_stage(ctx, emit):
+    if ctx["test_text"] is not None:
+        return
+    ws = ctx["workspace"]
+    emit({"message": "[STEP] Running Test-Writer to generate pytest tests..."})
     test_spec = "Write pytest tests that validate the main public functions in the code. Keep tests deterministic and avoid IO or network."
-    test_in = f"SPEC:\n{test_spec}\n\nCODE:\n{c_text}\n"
-    test_out = test_writer.run(test_in)
+    test_in = f"SPEC:\n{test_spec}\n\nCODE:\n{ctx['c_text']}\n"
+    test_out = await _arun_streamed(ctx["test_writer"], test_in, _stream_for(ctx, emit, "test_writer", "Test-Writer"))
     test_text = extract_content(test_out)
     test_text = strip_code_fence(test_text)
     test_text = test_runner.make_test_runner_safe(test_text)
-    test_runner.save_test_file(test_text, path="test_generated.py")
-    yield {"message": "[TEST] Test file saved as test_generated.py.", "test_text": test_text}
-
-    yield {"message": "[TEST] Running pytest on test_generated.py ..."}
-    tcode, tout, terr = test_runner.run_pytest("test_generated.py", timeout=12)
-    yield {
-        "message": f"[TEST] Pytest finished with return code: {tcode}",
-        "pytest_code": tcode, "pytest_stdout": tout, "pytest_stderr": terr
+    test_text = test_runner.save_test_file(test_text, path=ws.test_path)
+    ctx["test_text"] = test_text
+    emit({"message": f"[TEST] Test file saved as {ws.test_path}.", "test_text": test_text})
+
+async def _pytest_stage(ctx, emit):
+    ws = ctx["workspace"]
+    test_source = load_code(ws.test_path)
+    cache = check_cache.get_default_cache()
+    res = cache.get_pytest(ctx["c_text"], test_source) if cache is not None else None
+    rerun = None
+    if res is None and ctx["previous_tests"] is not None:
+        old_code, old_records = ctx["previous_tests"]
+        rerun = test_impact.plan_rerun(old_code, ctx["c_text"], test_source, old_records)
+    if res is not None:
+        emit({"message": "[TEST] This code and test suite were already run; reusing the cached pytest result."})
+    elif rerun is None:
+        emit({"message": f"[TEST] Running pytest on {ws.test_path} ..."})
+        res, _ = await asyncio.to_thread(check_cache.cached_run_pytest, ctx["c_text"], test_source, ws.test_path, ws.path)
+    else:
+        emit({"message": f"[TEST] Re-running {len(rerun)} test(s) affected by the patch or failing before; "
+                         f"keeping the results of the others..."})
+        res = test_runner.PytestResult(0)
+        if rerun:
+            res = await asyncio.to_thread(test_runner.run_pytest_structured, ws.test_path, cwd=ws.path, select=rerun)
+        res = test_impact.merge_results(old_records, rerun, res)
+        if res.returncode == 0:
+            # a pass built partly on carried-over results is only trusted after a full run
+            emit({"message": "[TEST] Selected tests pass; confirming with a full run ..."})
+            res, _ = await asyncio.to_thread(check_cache.cached_run_pytest, ctx["c_text"], test_source, ws.test_path, ws.path)
+    ctx["tcode"], ctx["tout"], ctx["terr"] = res.returncode, res.stdout, res.stderr
+    ctx["test_records"] = res.records
+    passed, total = res.counts()
+    emit({
+        "message": f"[TEST] Pytest finished with return code: {res.returncode} ({passed}/{total} passed, "
+                   f"{res.shards} shard(s), {res.seconds:.1f}s)",
+        "pytest_code": res.returncode, "pytest_stdout": res.stdout, "pytest_stderr": res.stderr,
+        "test_records": [r.as_dict() for r in res.records],
+        "state_fingerprint": check_cache.state_fingerprint(ctx["c_text"], test_source),
+    })
+
+DEBUGGER_PROMPT_TOKENS = int(os.environ.get("DEBUGGER_PROMPT_TOKENS", "12000"))
+
+def _debugger_prompt(code, syn_msg, diagnostics, run_stdout, run_stderr, tcode, tout, terr, test_records=(),
+                     test_source=None) -> Tuple[str, prompt_budget.BudgetReport]:
+    """The debugger prompt, fitted to DEBUGGER_PROMPT_TOKENS; returns (prompt, budget report)."""
+    failing = [r for r in test_records if r.outcome not in ("passed", "skipped")]
+    sections = {
+        "CODE": code,
+        "SYNTAX_CHECK": syn_msg,
+        "STATIC_CHECKS": format_diagnostics(diagnostics, 'generated_code.py') or 'No issues found',
+        "RUNTIME_STDOUT": run_stdout,
+        "RUNTIME_STDERR": run_stderr,
+        "PYTEST_RETURN_CODE": str(tcode),
+        "FAILED_TESTS": test_runner.format_failures(failing) or 'None',
+        "PYTEST_STDOUT": tout,
+        "PYTEST_STDERR": terr,
     }
-
-    # Debugger analysis
-    yield {"message": "[STEP] Running Debugger (analysis)..."}
-    dbg_prompt = (
+    # keep the code the failures point at: what failing tests reach and functions in tracebacks
+    focus = prompt_budget.traceback_functions(run_stderr, tout, *(r.message for r in failing))
+    if test_source and failing:
+        focus |= test_impact.definitions_reached(code, test_source, {test_impact.case_id(r.nodeid) for r in failing})
+    sections, report = prompt_budget.fit_sections(
+        {k: v or "" for k, v in sections.items()}, DEBUGGER_PROMPT_TOKENS, focus,
+        failed_tests=lambda max_chars: test_runner.format_failures(failing, max_chars),
+    )
+    elided_note = (
+        "Parts of CODE unrelated to the failures are elided: "
+        "answer with an EDIT block, never a full-file PATCH.\n\n" if report.code_elided else ""
+    )
+    prompt = (
         "Analyze this Python file and the diagnostics below. List issues (numbered). "
-        "If you propose a corrected full-file, provide it inside a fenced block labeled ```PATCH``` and nothing else inside that block.\n\n"
-        f"CODE:\n{c_text}\n\n"
-        f"SYNTAX_CHECK:\n{syn_msg}\n\n"
-        f"RUNTIME_STDOUT:\n{run_stdout}\n\n"
-        f"RUNTIME_STDERR:\n{run_stderr}\n\n"
-        f"PYTEST_RETURN_CODE:\n{tcode}\n\n"
-        f"PYTEST_STDOUT:\n{tout}\n\n"
-        f"PYTEST_STDERR:\n{terr}\n\n"
-        "Be concise and precise."
+        f"{patcher.PATCH_INSTRUCTIONS}\n{elided_note}\n"
+        + "".join(f"{name}:\n{text}\n\n" for name, text in sections.items())
+        + "Be concise and precise."
     )
-    dbg_out = debugger.run(dbg_prompt)
+    return prompt, report
+
+def _apply_triage(ctx, emit):
+    """Rule-based verdict on the iteration; True if it replaces the debugger call."""
+    ws = ctx["workspace"]
+    verdict = triage.triage(
+        ctx["c_text"], ctx["syn_ok"], ctx["diagnostics"], ctx["run_code"], ctx["run_stderr"],
+        ctx["tcode"], f"{ctx['tout']}\n{ctx['terr']}", load_code(ws.test_path), ctx["test_records"],
+    )
+    triage.TRIAGE_STATS.record(verdict)
+    if verdict.kind == "escalate":
+        emit({"message": f"[TRIAGE] Escalating to the Debugger: {verdict.reason}.", "triage": verdict.as_dict()})
+        return False
+    emit({"message": f"[TRIAGE] {'All green' if verdict.kind == 'pass' else 'Fixed by rule'}: {verdict.reason}. "
+                     f"Debugger call skipped.", "triage": verdict.as_dict()})
+    if verdict.test_text is not None:
+        ctx["test_text"] = test_runner.save_test_file(verdict.test_text, path=ws.test_path)
+        emit({"message": "[TRIAGE] Test file updated.", "test_text": ctx["test_text"]})
+    # a test-only fix keeps the code; handing it on as the patch makes the next iteration re-test it
+    patch_text = (verdict.code or ctx["c_text"]) if verdict.kind == "fixed" else None
+    emit({"message": "Iteration complete. Ready for next step.", "patch_text": patch_text, "final_code": ctx["c_text"]})
+    return True
+
+async def _debugger_stage(ctx, emit):
+    # Deterministic triage first; the Debugger only sees what the rules cannot settle
+    ws = ctx["workspace"]
+    if ctx["triage_first"] and _apply_triage(ctx, emit):
+        return
+    emit({"message": "[STEP] Running Debugger (analysis)..."})
+    dbg_prompt, budget = _debugger_prompt(
+        ctx["c_text"], ctx["syn_msg"], ctx["diagnostics"], ctx["run_stdout"], ctx["run_stderr"],
+        ctx["tcode"], ctx["tout"], ctx["terr"], ctx["test_records"], load_code(ws.test_path),
+    )
+    if budget.trimmed():
+        emit({
+            "message": f"[DEBUGGER] Prompt trimmed to ~{budget.after} tokens (from ~{budget.before}; "
+                       f"budget {budget.budget}): {', '.join(budget.trimmed())}.",
+            "debugger_prompt_budget": budget.as_dict(),
+        })
+    dbg_out = await _arun_streamed(ctx["debugger"], dbg_prompt, _stream_for(ctx, emit, "debugger", "Debugger"))
     dbg_text = extract_content(dbg_out)
-    yield {"message": "[DEBUGGER] Analysis complete.", "debugger_output": dbg_text}
+    emit({"message": "[DEBUGGER] Analysis complete.", "debugger_output": dbg_text})
+    patch_text = await _resolve_debugger_patch(ctx, emit, dbg_prompt, dbg_text, budget.code_elided)
 
     # Patch handling: auto-apply if syntax failed and patch present (one-time)
-    patch_text = extract_patch_from_debugger(dbg_text)
-    if not syn_ok and patch_text:
-        yield {"message": "[AUTO] Syntax error detected. Applying Debugger PATCH automatically."}
-        inspector.apply_patch("generated_code.py", patch_text)
+    if not ctx["syn_ok"] and patch_text:
+        emit({"message": "[AUTO] Syntax error detected. Applying Debugger PATCH automatically."})
+        inspector.apply_patch(ws.code_path, patch_text)
         # re-check syntax and runtime
-        syn_ok, syn_msg = inspector.run_syntax_check("generated_code.py")
-        code_run_ret, run_stdout, run_stderr = inspector.run_file("generated_code.py", timeout=run_timeout)
-        yield {"message": f"[AUTO] Re-checked syntax: {syn_msg}", "syntax_ok": syn_ok, "syntax_msg": syn_msg}
+        syn_ok, syn_msg = inspector.syntax_status(inspector.check_code(patch_text, ws.code_path), ws.code_path)
+        await asyncio.to_thread(inspector.run_file, ws.code_path, timeout=ctx["run_timeout"], cwd=ws.path)
+        emit({"message": f"[AUTO] Re-checked syntax: {syn_msg}", "syntax_ok": syn_ok, "syntax_msg": syn_msg})
 
-    # Yield a final summary of this iteration's artifacts
-    yield {
+    # Final summary of this iteration's artifacts
+    emit({
         "message": "Iteration complete. Ready for next step.",
         "patch_text": patch_text,
-        "final_code": c_text
+        "final_code": ctx["c_text"]
+    })
+
+def _resolve_patch(code, dbg_text, code_elided=False):
+    patch = patcher.resolve_patch(code, dbg_text)
+    if patch is not None and patch.kind == "full" and code_elided:
+        raise patcher.PatchError("a full-file PATCH cannot be used when parts of CODE were elided")
+    return patch
+
+async def _resolve_debugger_patch(ctx, emit, dbg_prompt, dbg_text, code_elided=False):
+    """The full patched file for the debugger's answer (None if it has no patch).
+
+    An EDIT/DIFF that cannot be applied to the current code is retried once as a full-file request
+    (as an EDIT request when parts of the code were elided from the prompt).
+    """
+    try:
+        patch = _resolve_patch(ctx["c_text"], dbg_text, code_elided)
+    except patcher.PatchError as e:
+        emit({"message": f"[DEBUGGER] Patch could not be applied ({e}); asking again..."})
+        wanted = (
+            "a fenced block labeled ```EDIT``` holding the complete definitions you change" if code_elided
+            else "the complete corrected file inside a fenced block labeled ```PATCH```"
+        )
+        retry_prompt = (
+            f"{dbg_prompt}\n\nYour previous answer was:\n{dbg_text}\n\n"
+            f"Its patch could not be applied: {e}\n"
+            f"Reply with {wanted} and nothing else."
+        )
+        try:
+            patch = _resolve_patch(ctx["c_text"], extract_content(await arun_agent(ctx["debugger"], retry_prompt)), code_elided)
+        except patcher.PatchError:
+            patch = None
+    if patch is None:
+        return None
+    emit({
+        "message": f"[DEBUGGER] {patch.kind.upper()} patch ({', '.join(patch.changes)}): "
+                   f"{patch.patch_chars} chars for a {len(patch.code)}-char file.",
+        "patch_format": patch.kind, "patch_changes": patch.changes, "patch_chars": patch.patch_chars,
+    })
+    return patch.code
+
+# researcher -> coder -> {syntax+run, test-writer -> pytest} -> debugger
+ITERATION_GRAPH = StageGraph([
+    Stage("research", _research_stage),
+    Stage("coder", _coder_stage, deps=("research",)),
+    Stage("checks", _checks_stage, deps=("coder",)),
+    Stage("test_writer", _test_writer_stage, deps=("coder",)),
+    Stage("pytest", _pytest_stage, deps=("test_writer",)),
+    Stage("debugger", _debugger_stage, deps=("checks", "pytest")),
+])
+
+def run_iteration(researcher, coder, test_writer, debugger, user_prompt, run_timeout,
+                  r_text=None, c_text=None, test_text=None, workspace=None, concurrent=None, stream=None,
+                  coder_candidates=None, previous_tests=None, triage_first=None, tracer=None, router=None):
+    """Runs one full iteration and yields status updates.
+
+    Passing `r_text`, `c_text` or `test_text` skips the matching agent stage and reuses
+    the given artifact (incremental mode); `c_text` and `test_text` are assumed to be on disk already.
+    Files are read and written inside `workspace` (default: the current directory).
+    Independent stages overlap unless `concurrent` is False (default from CONCURRENT_STAGES, on).
+    With `stream` (default from STREAM_AGENTS, on) agent output is also yielded as partial "[STREAM]" updates.
+    `coder_candidates` is a list of (coder agent, temperature, prompt suffix) to race instead of `coder`.
+    `previous_tests` is (code, test records) of the last pytest run; with it only the tests affected by the
+    changes since then, plus the failing ones, are re-run (see utils/test_impact.py).
+    With `triage_first` (default from TRIAGE, on) the Debugger is skipped when all checks pass or
+    rule-based fixes cover every failure (see workflows/triage.py).
+    With a `tracer` (utils/tracing.py) the iteration, its stages, agent calls and subprocesses are
+    recorded as spans, and a final "[TRACE]" update lists them.
+    With a `router` (workflows/model_routing.py) coder retries move up a model tier.
+    """
+    if concurrent is None:
+        concurrent = os.environ.get("CONCURRENT_STAGES", "1") != "0"
+    if stream is None:
+        stream = os.environ.get("STREAM_AGENTS", "1") != "0"
+    if triage_first is None:
+        triage_first = os.environ.get("TRIAGE", "1") != "0"
+    ctx = {
+        "researcher": researcher, "coder": coder, "test_writer": test_writer, "debugger": debugger,
+        "user_prompt": user_prompt, "run_timeout": run_timeout,
+        "r_text": r_text, "c_text": c_text, "test_text": test_text,
+        "workspace": workspace or Workspace.current_dir(), "stream": stream,
+        "coder_candidates": coder_candidates, "previous_tests": previous_tests, "triage_first": triage_first,
+        "tracer": tracer, "router": router,
     }
+    yield from iterate_graph(ITERATION_GRAPH, ctx, concurrent=concurrent, name="iteration")
+
+# ---- Patch search ----
+async def _search_stage(ctx, emit):
+    ws = ctx["workspace"]
+    debuggers = ctx["debuggers"]
+
+    async def evaluate(code, node_id):
+        cand = coder_candidates.Candidate(node_id, code=code)
+        directory = os.path.join(ws.path, "search", f"n{node_id}")
+        return await asyncio.to_thread(coder_candidates.evaluate_candidate, cand, directory, ctx["run_timeout"], ctx["test_text"])
+
+    async def propose(node, i):
+        c = node.candidate
+        _, syn_msg = inspector.syntax_status(c.diagnostics, ws.code_path)
+        prompt, budget = _debugger_prompt(c.code, syn_msg, c.diagnostics, c.run_stdout, c.run_stderr, c.pytest_code,
+                                     c.pytest_stdout, c.pytest_stderr, c.test_records, ctx["test_text"])
+        try:
+            out = await arun_agent(debuggers[i % len(debuggers)], prompt)
+        except Exception as e:
+            emit({"message": f"[SEARCH] Debugger proposal {i + 1} for node {node.id} failed: {e}"})
+            return None
+        try:
+            patch = _resolve_patch(c.code, extract_content(out), budget.code_elided)
+        except patcher.PatchError as e:
+            emit({"message": f"[SEARCH] Debugger proposal {i + 1} for node {node.id} could not be applied: {e}"})
+            return None
+        return patch.code if patch else None
+
+    result = await patch_search.best_first_search(
+        ctx["code"], propose, evaluate, width=len(debuggers), max_calls=ctx["max_calls"],
+        max_seconds=ctx["max_seconds"], emit=emit, seed_patches=ctx["seed_patches"],
+    )
+    best = result.best.candidate
+    if best.code != ctx["code"]:
+        save_code(best.code, ws.code_path)
+    stats = result.as_dict()
+    emit({
+        "message": f"[SEARCH] {'Passing version found' if best.passed else 'No passing version'}: node {result.best.id} "
+                   f"at depth {result.best.depth} after {result.rounds} round(s), {result.calls} debugger call(s), "
+                   f"{result.seconds:.1f}s ({result.stop_reason}).",
+        "search_stats": stats,
+        "code_text": best.code, "final_code": best.code,
+        "syntax_ok": best.syntax_ok, "run_retcode": best.run_code,
+        "pytest_code": best.pytest_code, "pytest_stdout": best.pytest_stdout, "pytest_stderr": best.pytest_stderr,
+    })
+
+SEARCH_GRAPH = StageGraph([Stage("search", _search_stage)])
+
+def run_patch_search(debuggers, code, test_text, run_timeout, workspace, seed_patches=(), max_calls=9, max_seconds=300.0,
+                     tracer=None):
+    """Best-first search for a passing version of `code`, yielding status updates.
+
+    Each round asks every agent in `debuggers` for a patch of the most promising version so far and
+    evaluates the proposals in parallel sandboxes under the workspace; the best version is written to
+    the workspace's generated_code.py.
+    """
+    ctx = {
+        "debuggers": debuggers, "code": code, "run_timeout": run_timeout,
+        "test_text": test_runner.normalize_test_source(test_text) if test_text else test_text,
+        "workspace": workspace, "seed_patches": [p for p in seed_patches if p],
+        "max_calls": max_calls, "max_seconds": max_seconds, "tracer": tracer,
+    }
+    yield from iterate_graph(SEARCH_GRAPH, ctx, name="search")
 
 # ---- Autonomous loop ----
-def autonomous_loop(user_prompt: str, max_iters: int = 3, run_timeout: int = 8, auto_patch_enabled: bool = False):
-    """Generator that yields status updates for the autonomous workflow."""
-    researcher = create_researcher_agent()
-    coder = create_coder_agent()
-    test_writer = create_test_writer_agent()
-    debugger = create_debugger_agent()
+def autonomous_loop(user_prompt: str, max_iters: int = 3, run_timeout: int = 8, auto_patch_enabled: bool = False,
+                    incremental: bool | None = None, workspace: Workspace | None = None, candidates: int | None = None,
+                    search: bool | None = None, routing: str | None = None, approve_patch=None, api_key: str | None = None):
+    """Generator that yields status updates for the autonomous workflow.
+
+    Each run works in its own workspace directory unless one is passed in; workspaces created here
+    are kept or removed according to WORKSPACE_RETAIN/WORKSPACE_KEEP when the run ends.
+    `candidates` > 1 races that many coder generations (default from CODER_CANDIDATES, 1).
+    With `search` (default from PATCH_SEARCH, off) the first iteration is followed by a best-first
+    patch search instead of one patch per iteration.
+    `routing` is the model routing policy, adaptive or fixed (default from MODEL_ROUTING, adaptive; see
+    workflows/model_routing.py).
+    Without auto-patching, `approve_patch(code_path, patch_text) -> bool` decides whether a patch is
+    applied (default: ask on the terminal).
+    `api_key` is the Google API key the agents use (default: GOOGLE_API_KEY).
+    The run is traced (utils/tracing.py): the last update carries a per-span p50/p95 summary, and with
+    TRACE_DIR set the spans are written there as JSON lines and OTLP/JSON.
+    """
+    ws = workspace or Workspace.create()
+    yield {"message": f"[CONFIG] Workspace: {ws.path}", "workspace": ws.path, "code_path": ws.code_path}
+    tracer = tracing.Tracer(workspace=ws.path)
+    last = {}
+    try:
+        for status_update in _run_loop(user_prompt, max_iters, run_timeout, auto_patch_enabled, incremental, ws, candidates,
+                                       search, tracer, routing, approve_patch, api_key):
+            last.update(status_update)
+            yield status_update
+        tracer.finish()
+        yield {"message": f"[TRACE] Run summary (seconds per span):\n{tracer.format_summary()}",
+               "trace_id": tracer.trace_id, "trace_summary": tracer.summary()}
+    finally:
+        tracer.finish()
+        for path in tracing.export_default(tracer):
+            print(f"[IO] Saved trace -> {path}")
+        if workspace is None:
+            ws.finish(succeeded=bool(last.get("syntax_ok")) and last.get("pytest_code") == 0)
+
+def _run_loop(user_prompt, max_iters, run_timeout, auto_patch_enabled, incremental, ws, candidates=None, search=None,
+              tracer=None, routing=None, approve_patch=None, api_key=None):
+    router = model_routing.ModelRouter(routing, api_key=api_key)
+    if candidates is None:
+        candidates = int(os.environ.get("CODER_CANDIDATES", "1"))
 
     # For CLI mode, check env var. For UI, use passed param.
     auto_patch = auto_patch_enabled or (os.environ.get("AUTO_PATCH", "") == "1")
-    yield {"message": f"[CONFIG] AUTO_PATCH={auto_patch}, MAX_ITERS={max_iters}, RUN_TIMEOUT={run_timeout}s"}
-
+    if incremental is None:
+        incremental = os.environ.get("INCREMENTAL", "1") != "0"
+    if search is None:
+        search = os.environ.get("PATCH_SEARCH", "") == "1"
+    yield {"message": f"[CONFIG] AUTO_PATCH={auto_patch}, MAX_ITERS={max_iters}, RUN_TIMEOUT={run_timeout}s, INCREMENTAL={incremental}, CODER_CANDIDATES={max(candidates, 1)}, PATCH_SEARCH={search}, MODEL_ROUTING={router.policy}"}
+
+    # Artifacts carried between iterations in incremental mode
+    r_text = c_text = test_text = previous_tests = None
+    seen_states = {}  # state fingerprint -> first iteration that checked it
+    full_test_every = max(1, int(os.environ.get("PYTEST_FULL_EVERY", "3")))
+    routes = None
     for iteration in range(1, max_iters + 1):
         yield {"message": f"==== ITERATION {iteration} ===="}
+        if router.routes() != routes:
+            routes = router.routes()
+            yield {"message": f"[ROUTING] Models ({router.reason()}): " + ", ".join(f"{k}={v}" for k, v in routes.items()),
+                   "model_routes": routes}
+        researcher, coder, test_writer, debugger = (router.agent(stage) for stage in ("researcher", "coder", "test_writer", "debugger"))
+        coder_pool = None
+        if candidates > 1:
+            coder_pool = [
+                (router.agent("coder", temperature=t), t, suffix)
+                for t, suffix in map(coder_candidates.variant, range(candidates))
+            ]
         iteration_artifacts = {}
         try:
             # Collect all yielded dictionaries from the iteration run
-            for status_update in run_iteration(researcher, coder, test_writer, debugger, user_prompt, run_timeout):
+            for status_update in run_iteration(researcher, coder, test_writer, debugger, user_prompt, run_timeout,
+                                               r_text=r_text, c_text=c_text, test_text=test_text, workspace=ws,
+                                               coder_candidates=coder_pool, previous_tests=previous_tests, tracer=tracer,
+                                               router=router):
                 iteration_artifacts.update(status_update)
                 yield status_update # Pass status up to the UI
         except Exception as e:
             yield {"message": f"[ERROR] Exception during iteration: {e}", "exception": str(e)}
             return
 
+        passed = (bool(iteration_artifacts.get("syntax_ok")) and iteration_artifacts.get("run_retcode") == 0
+                  and iteration_artifacts.get("pytest_code") == 0)
+        router.record_iteration(passed)
         patch = iteration_artifacts.get("patch_text")
+        if search:
+            yield from _search_after_first_iteration(router, iteration_artifacts, max_iters, run_timeout, ws, tracer)
+            return
+        by_triage = iteration_artifacts.get("triage", {}).get("kind") in ("pass", "fixed")
         if not patch:
-            yield {"message": "[RESULT] No PATCH suggested by Debugger. Workflow completed."}
+            if by_triage:
+                yield {"message": "[RESULT] All checks pass. Workflow completed."}
+            else:
+                yield {"message": "[RESULT] No PATCH suggested by Debugger. Workflow completed."}
             return
 
-        yield {"message": "[RESULT] Debugger suggested a PATCH.", "patch_text": patch}
+        yield {"message": f"[RESULT] {'Triage' if by_triage else 'Debugger'} suggested a PATCH.", "patch_text": patch}
+        if incremental:
+            # A patch that leads back to a checked (code, tests) state would replay the same verdict
+            if iteration_artifacts.get("state_fingerprint"):
+                seen_states.setdefault(iteration_artifacts["state_fingerprint"], iteration)
+            earlier = seen_states.get(check_cache.state_fingerprint(patch, load_code(ws.test_path)))
+            if earlier is not None:
+                how = "does not change the code" if earlier == iteration else f"returns to the version checked in iteration {earlier}"
+                yield {"message": f"[RESULT] The PATCH {how}. Stopping early: further iterations would repeat it.",
+                       "converged": earlier}
+                return
 
         if auto_patch:
-            inspector.apply_patch("generated_code.py", patch)
+            inspector.apply_patch(ws.code_path, patch)
             yield {"message": "[AUTO] Patch applied."}
-            continue
-
-        apply = input("Apply the suggested patch to generated_code.py? (y/n) ").strip().lower()
-        if apply == "y":
-            inspector.apply_patch("generated_code.py", patch)
-            yield {"message": "[USER] Patch applied."}
-            continue
         else:
-            yield {"message": "[USER] Patch skipped. Ending workflow."}
-            return
+            if not (approve_patch or _ask_on_terminal)(ws.code_path, patch):
+                yield {"message": "[USER] Patch skipped. Ending workflow."}
+                return
+            inspector.apply_patch(ws.code_path, patch)
+            yield {"message": "[USER] Patch applied."}
+
+        if incremental:
+            # Next iteration starts from the patched file; research and tests are kept
+            r_text = iteration_artifacts.get("research_text", r_text)
+            test_text = iteration_artifacts.get("test_text", test_text)
+            c_text = load_code(ws.code_path)
+            # Change-aware re-testing, with every `full_test_every`-th iteration running the whole suite
+            previous_tests = None
+            if iteration % full_test_every and iteration_artifacts.get("test_records") and iteration_artifacts.get("final_code"):
+                records = [test_runner.PytestRecord(**r) for r in iteration_artifacts["test_records"]]
+                previous_tests = (iteration_artifacts.get("final_code"), records)
 
     yield {"message": "[RESULT] Reached max iterations without converging."}
 
+def _ask_on_terminal(code_path, patch_text):
+    return input(f"Apply the suggested patch to {code_path}? (y/n) ").strip().lower() == "y"
+
+def _search_after_first_iteration(router, artifacts, max_iters, run_timeout, ws, tracer=None):
+    if artifacts.get("syntax_ok") and artifacts.get("run_retcode") == 0 and artifacts.get("pytest_code") == 0:
+        yield {"message": "[RESULT] First iteration already passes. Workflow completed."}
+        return
+    width = max(1, int(os.environ.get("PATCH_SEARCH_WIDTH", "3")))
+    debuggers = [router.agent("debugger")] + [
+        router.agent("debugger", temperature=t) for t in patch_search.PROPOSAL_TEMPERATURES[1:width]
+    ]
+    # The default call budget matches what the linear loop could spend on its remaining iterations, width-fold
+    max_calls = int(os.environ.get("PATCH_SEARCH_CALLS", str(len(debuggers) * max(1, max_iters - 1))))
+    max_seconds = float(os.environ.get("PATCH_SEARCH_SECONDS", "300"))
+    yield {"message": f"[SEARCH] Best-first patch search: width {len(debuggers)}, up to {max_calls} debugger calls / {max_seconds:.0f}s."}
+    # The file on disk may already hold an auto-applied syntax fix; the iteration's own patch is a free first proposal
+    yield from run_patch_search(
+        debuggers, load_code(ws.code_path), artifacts.get("test_text"), run_timeout, ws,
+        seed_patches=[artifacts.get("patch_text")], max_calls=max_calls, max_seconds=max_seconds, tracer=tracer,
+    )
+
 # ---- Main entry ----
 if __name__ == "__main__":
     prompt = (
@@ -338,17 +785,44 @@ if __name__ == "__main__":
     run_timeout = int(os.environ.get("RUN_TIMEOUT", "8"))
     start = time.time()
 
-    # For CLI execution, we just print the yielded messages
+    # For CLI execution, we just print the yielded messages; streamed agent text is printed as it arrives
     final_artifacts = {}
+    streaming = None
     for status_update in autonomous_loop(prompt, max_iters=max_iters, run_timeout=run_timeout):
+        if "stream_delta" in status_update:
+            if streaming != status_update["stream_stage"]:
+                streaming = status_update["stream_stage"]
+                print(f"\n--- {streaming} (streaming) ---")
+            sys.stdout.write(status_update["stream_delta"])
+            sys.stdout.flush()
+            continue
+        if streaming is not None:
+            print()
+            streaming = None
         print(status_update.get("message", ""))
         final_artifacts.update(status_update)
 
     dur = time.time() - start
     print("\n==== WORKFLOW FINISHED ====")
     print("duration:", f"{dur:.2f}s")
+    cache = get_default_cache()
+    if cache is not None:
+        print("agent cache:", cache.stats())
+    if STREAM_STATS.aborted or STREAM_STATS.stopped_early:
+        print("coder stream:", STREAM_STATS.as_dict())
+    for n, figures in coder_candidates.CANDIDATE_STATS.as_dict().items():
+        print(f"coder candidates (N={n}):", figures)
+    checks = check_cache.get_default_cache()
+    if checks is not None and checks.hits:
+        print("check cache:", checks.stats())
+    print("imports:", import_timing.format_import_times())
+    if triage.TRIAGE_STATS.skipped:
+        print("triage:", triage.TRIAGE_STATS.counts, f"({triage.TRIAGE_STATS.skipped} debugger call(s) skipped)")
+    limits = rate_limit.get_default_limiter().stats.as_dict()
+    if limits["retries"] or limits["failures"] or limits["queue_wait_s"]:
+        print("rate limiter:", limits)
 
     for k in ("research_text", "code_text", "syntax_msg", "run_stdout", "run_stderr", "pytest_stdout", "pytest_stderr", "debugger_output"):
         if k in final_artifacts:
             print(f"\n--- {k.upper()} (truncated) ---\n", str(final_artifacts[k])[:1000])
-    print("\nFinal generated file: generated_code.py")
+    print("\nFinal generated file:", final_artifacts.get("code_path", "generated_code.py"))
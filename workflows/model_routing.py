@@ -0,0 +1,96 @@
+"""
+Model routing: which model each agent call uses, per stage, attempt and iteration.
+
+Models come in three tiers, each set from env:
+  light     MODEL_LIGHT     (default gemini-2.5-flash-lite)
+  standard  MODEL_STANDARD  (default gemini-2.5-flash, the agent factories' default)
+  strong    MODEL_STRONG    (default gemini-2.5-pro)
+MODEL_ROUTING selects the policy:
+  adaptive  (default) each stage starts at its tier in START_TIERS, so the researcher and the coder's
+            first attempt use the light model and the test-writer and debugger the standard one.
+            Each coder retry after the sanitizer rejects an attempt moves the coder up a tier. After
+            MODEL_ESCALATE_AFTER iterations in a row end with failing checks (default 2), every stage
+            moves up a tier.
+  fixed     every stage uses the standard model (the behaviour before routing)
+Tiers stop at strong. Agents are built once per (stage, model, temperature) and reused.
+"""
+import os
+from typing import Dict, Optional, Tuple
+
+from agents.coder import create_coder_agent
+from agents.debugger import create_debugger_agent
+from agents.researcher import create_researcher_agent
+from agents.test_writer import create_test_writer_agent
+
+TIERS = ("light", "standard", "strong")
+DEFAULT_MODELS = {"light": "gemini-2.5-flash-lite", "standard": "gemini-2.5-flash", "strong": "gemini-2.5-pro"}
+# Tier each stage starts from under the adaptive policy
+START_TIERS = {"researcher": "light", "coder": "light", "test_writer": "standard", "debugger": "standard"}
+POLICIES = ("adaptive", "fixed")
+
+_FACTORIES = {
+    "researcher": lambda model_id, temperature, api_key: create_researcher_agent(model_id=model_id, api_key=api_key),
+    "coder": lambda model_id, temperature, api_key: create_coder_agent(model_id=model_id, temperature=temperature,
+                                                                       api_key=api_key),
+    "test_writer": lambda model_id, temperature, api_key: create_test_writer_agent(model_id=model_id, api_key=api_key),
+    "debugger": lambda model_id, temperature, api_key: create_debugger_agent(model_id=model_id, temperature=temperature,
+                                                                             api_key=api_key),
+}
+
+
+def model_for(tier: str) -> str:
+    return os.environ.get(f"MODEL_{tier.upper()}") or DEFAULT_MODELS[tier]
+
+
+class ModelRouter:
+    """Picks and builds the agent for each stage; `record_iteration` feeds back how iterations end.
+
+    Agents are built with `api_key` (default: GOOGLE_API_KEY).
+    """
+
+    def __init__(self, policy: Optional[str] = None, escalate_after: Optional[int] = None, api_key: Optional[str] = None):
+        policy = policy or os.environ.get("MODEL_ROUTING", "adaptive")
+        if policy not in POLICIES:
+            raise ValueError(f"MODEL_ROUTING must be one of {', '.join(POLICIES)}, not {policy!r}")
+        self.policy = policy
+        if escalate_after is None:
+            escalate_after = int(os.environ.get("MODEL_ESCALATE_AFTER", "2"))
+        self.escalate_after = max(1, escalate_after)
+        self.api_key = api_key
+        self.failed_streak = 0  # iterations in a row that ended with failing checks
+        self._agents: Dict[Tuple[str, str, Optional[float]], object] = {}
+
+    @property
+    def escalated(self) -> bool:
+        return self.policy == "adaptive" and self.failed_streak >= self.escalate_after
+
+    def tier(self, stage: str, attempt: int = 1) -> str:
+        if self.policy == "fixed":
+            return "standard"
+        level = TIERS.index(START_TIERS[stage]) + self.escalated
+        if stage == "coder":
+            level += attempt - 1
+        return TIERS[min(level, len(TIERS) - 1)]
+
+    def model(self, stage: str, attempt: int = 1) -> str:
+        return model_for(self.tier(stage, attempt))
+
+    def agent(self, stage: str, attempt: int = 1, temperature: Optional[float] = None):
+        key = (stage, self.model(stage, attempt), temperature)
+        if key not in self._agents:
+            self._agents[key] = _FACTORIES[stage](key[1], temperature, self.api_key)
+        return self._agents[key]
+
+    def routes(self) -> Dict[str, str]:
+        """Model per stage for the next iteration (coder: its first attempt)."""
+        return {stage: self.model(stage) for stage in START_TIERS}
+
+    def record_iteration(self, passed: bool) -> None:
+        self.failed_streak = 0 if passed else self.failed_streak + 1
+
+    def reason(self) -> str:
+        if self.policy == "fixed":
+            return "fixed policy"
+        if self.escalated:
+            return f"checks failed in the last {self.failed_streak} iteration(s)"
+        return "starting tiers"
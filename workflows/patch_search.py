@@ -0,0 +1,127 @@
+"""
+Best-first search over debugger patches.
+
+Instead of following one PATCH per iteration, the search keeps every evaluated version of the code
+and repeatedly expands the most promising one that has not been expanded yet. Each expansion asks the
+debugger for `width` patch proposals concurrently, evaluates every new proposal in its own sandbox
+directory (static checks, run, the generated pytest suite; see coder_candidates.evaluate_candidate)
+and adds them to the frontier. Proposals equivalent to a version already seen (same fingerprint, see
+utils/check_cache.py) are dropped. The search stops at the first version that passes, or when the budget
+of debugger calls or wall-clock seconds is used up, and returns the best version seen.
+"""
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Iterable, List, Optional
+
+from utils.check_cache import code_fingerprint
+from workflows.coder_candidates import Candidate
+
+# Sampling temperatures of the debugger calls within one expansion (None = model default)
+PROPOSAL_TEMPERATURES = (None, 0.5, 0.9, 1.2)
+
+# (node to fix, proposal index) -> full-file patch text, or None if the debugger gave no usable patch
+Propose = Callable[["SearchNode", int], Awaitable[Optional[str]]]
+# (code, node id) -> evaluated candidate
+Evaluate = Callable[[str, int], Awaitable[Candidate]]
+
+
+@dataclass
+class SearchNode:
+    id: int
+    candidate: Candidate
+    parent: Optional[int] = None
+    depth: int = 0
+    expanded: bool = False
+
+    def rank(self) -> tuple:
+        return (self.candidate.passed,) + self.candidate.score()
+
+
+@dataclass
+class SearchResult:
+    best: SearchNode
+    nodes: List[SearchNode]
+    rounds: int
+    calls: int
+    seconds: float
+    stop_reason: str
+
+    def as_dict(self) -> dict:
+        return {
+            "best_node": self.best.id,
+            "best_depth": self.best.depth,
+            "passed": self.best.candidate.passed,
+            "rounds": self.rounds,
+            "debugger_calls": self.calls,
+            "nodes_evaluated": len(self.nodes),
+            "seconds": round(self.seconds, 2),
+            "stop_reason": self.stop_reason,
+        }
+
+
+async def best_first_search(root_code: str, propose: Propose, evaluate: Evaluate, width: int = 3,
+                            max_calls: int = 9, max_seconds: float = 300.0,
+                            emit: Optional[Callable[[dict], None]] = None,
+                            seed_patches: Iterable[str] = ()) -> SearchResult:
+    """Search from `root_code`; `seed_patches` are proposals for the root that are already known (free)."""
+    emit = emit or (lambda status: None)
+    start = time.monotonic()
+    deadline = start + max_seconds
+    nodes: List[SearchNode] = []
+    seen = set()
+    calls = rounds = 0
+
+    async def add_children(parent: Optional[SearchNode], patches: Iterable[Optional[str]]) -> List[SearchNode]:
+        fresh = []
+        for code in patches:
+            if code and code.strip() and code_fingerprint(code) not in seen:
+                seen.add(code_fingerprint(code))
+                node = SearchNode(len(nodes) + len(fresh), Candidate(len(nodes) + len(fresh), code=code))
+                if parent is not None:
+                    node.parent, node.depth = parent.id, parent.depth + 1
+                fresh.append(node)
+        evaluated = await asyncio.gather(*(evaluate(n.candidate.code, n.id) for n in fresh))
+        for node, cand in zip(fresh, evaluated):
+            node.candidate = cand
+            nodes.append(node)
+            emit({
+                "message": f"[SEARCH] Node {node.id} (depth {node.depth}, from {node.parent}): {cand.status()}",
+                "search_node": {"id": node.id, "parent": node.parent, "depth": node.depth, **cand.summary()},
+            })
+        return fresh
+
+    def result(reason: str) -> SearchResult:
+        best = max(nodes, key=lambda n: (n.rank(), -n.id))
+        return SearchResult(best, nodes, rounds, calls, time.monotonic() - start, reason)
+
+    seen.add(code_fingerprint(root_code))
+    root = SearchNode(0, await evaluate(root_code, 0))
+    nodes.append(root)
+    emit({"message": f"[SEARCH] Start: {root.candidate.status()}"})
+    if root.candidate.passed:
+        return result("root passed")
+    await add_children(nodes[0], seed_patches)
+
+    while True:
+        if any(n.candidate.passed for n in nodes):
+            return result("passed")
+        frontier = [n for n in nodes if not n.expanded]
+        if not frontier:
+            return result("frontier exhausted")
+        if calls >= max_calls:
+            return result("call budget")
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return result("time budget")
+        node = max(frontier, key=lambda n: (n.rank(), -n.id))
+        node.expanded = True
+        rounds += 1
+        k = min(width, max_calls - calls)
+        calls += k
+        emit({"message": f"[SEARCH] Round {rounds}: expanding node {node.id} ({node.candidate.status()}) with {k} proposals..."})
+        try:
+            patches = await asyncio.wait_for(asyncio.gather(*(propose(node, i) for i in range(k))), remaining)
+            await asyncio.wait_for(add_children(node, patches), max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            return result("time budget")
@@ -0,0 +1,104 @@
+"""
+Minimal asyncio stage graph for the workflow.
+
+A stage is an async function `fn(ctx, emit)` plus the names of the stages it depends on. Stages start
+as soon as all their dependencies have finished, so independent stages overlap; `emit(status_dict)`
+may be called from the event loop or from worker threads. `iterate_graph` drives the graph on a
+private event loop and turns it back into a plain generator of status dicts, which is what the
+Streamlit app and the CLI consume.
+
+With a `utils.tracing.Tracer` in `ctx["tracer"]`, the graph run and each stage are recorded as spans
+("<name>" and "stage.<stage name>"), and a final "[TRACE]" status carries the graph's spans.
+"""
+import asyncio
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Iterator, Sequence
+
+from utils import tracing
+
+StageFn = Callable[[dict, Callable[[dict], None]], Awaitable[None]]
+
+
+@dataclass(frozen=True)
+class Stage:
+    name: str
+    fn: StageFn
+    deps: Sequence[str] = field(default_factory=tuple)
+
+
+class StageGraph:
+    def __init__(self, stages: Sequence[Stage]):
+        self.stages = list(stages)
+        names = {s.name for s in self.stages}
+        for s in self.stages:
+            missing = [d for d in s.deps if d not in names]
+            if missing:
+                raise ValueError(f"stage {s.name!r} depends on unknown stages {missing}")
+
+    async def run(self, ctx: dict, emit: Callable[[dict], None], concurrent: bool = True) -> None:
+        if not concurrent:
+            # Declaration order is a valid topological order for the graphs built in this repo
+            for stage in self.stages:
+                with tracing.span(f"stage.{stage.name}"):
+                    await stage.fn(ctx, emit)
+            return
+        done = {s.name: asyncio.Event() for s in self.stages}
+
+        async def run_stage(stage: Stage):
+            for dep in stage.deps:
+                await done[dep].wait()
+            with tracing.span(f"stage.{stage.name}"):
+                await stage.fn(ctx, emit)
+            done[stage.name].set()
+
+        tasks = [asyncio.ensure_future(run_stage(s)) for s in self.stages]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+
+def iterate_graph(graph: StageGraph, ctx: dict, concurrent: bool = True, name: str = "graph") -> Iterator[dict]:
+    """Run `graph` and yield the status dicts its stages emit, in emission order."""
+    loop = asyncio.new_event_loop()
+    events: asyncio.Queue = asyncio.Queue()
+    tracer = ctx.get("tracer")
+    first_span = len(tracer.finished()) if tracer is not None else 0
+
+    def emit(status: dict) -> None:
+        loop.call_soon_threadsafe(events.put_nowait, status)
+
+    async def run_traced():
+        tracing.bind(tracer)  # the task runs in its own copy of the context
+        with tracing.span(name):
+            await graph.run(ctx, emit, concurrent=concurrent)
+
+    main = loop.create_task(run_traced())
+    try:
+        while True:
+            getter = loop.create_task(events.get())
+            loop.run_until_complete(asyncio.wait({getter, main}, return_when=asyncio.FIRST_COMPLETED))
+            if getter.done():
+                yield getter.result()
+                continue
+            getter.cancel()
+            loop.run_until_complete(asyncio.gather(getter, return_exceptions=True))
+            # let thread-side emits scheduled with call_soon_threadsafe land before draining
+            loop.run_until_complete(asyncio.sleep(0))
+            while not events.empty():
+                yield events.get_nowait()
+            main.result()  # re-raise a stage failure
+            if tracer is not None:
+                spans = tracer.finished(first_span)
+                stages = ", ".join(f"{s.name.removeprefix('stage.')} {s.seconds:.2f}s" for s in spans if s.name.startswith("stage."))
+                yield {"message": f"[TRACE] {name} {spans[-1].seconds:.2f}s: {stages}", "spans": [s.as_dict() for s in spans]}
+            return
+    finally:
+        if not main.done():
+            main.cancel()
+            loop.run_until_complete(asyncio.gather(main, return_exceptions=True))
+        loop.run_until_complete(loop.shutdown_default_executor())
+        loop.close()
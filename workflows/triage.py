@@ -0,0 +1,222 @@
+"""
+Deterministic triage before the debugger.
+
+`triage` looks at an iteration's diagnostics and decides without a model call when it can:
+  pass      syntax OK, no blocking static finding, the run exited 0 and pytest passed: nothing to debug
+  fixed     every problem found belongs to a known class with a mechanical fix (catalogue below); the
+            fixed code and/or test file are returned and the next iteration verifies them
+  escalate  anything else goes to the debugger
+Catalogue:
+  missing-import     F821 for a standard-library module or typing name (`math`, `List`, ...) -> import it
+  test-import-alias  tests import a name generated_code does not define, but exactly one definition
+                     differs from it only by case/underscores or by a one-character typo (and is
+                     ALIAS_CUTOFF similar) -> add `wanted = existing` to the code. Merely similar
+                     names (load_data/save_data, encode/decode, mean/median) go to the debugger.
+  test-placeholder   tests import a module that does not exist (`solution`, `your_module`, ...) whose
+                     imported names generated_code defines -> import them from generated_code
+"""
+import ast
+import difflib
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence
+
+from utils import patcher
+from utils.static_check import module_exists
+from workflows.coder_candidates import BLOCKING_CODES
+
+GENERATED_MODULE = "generated_code"
+# difflib similarity a test-import-alias typo target needs on top of being one edit away
+ALIAS_CUTOFF = 0.85
+# Undefined names that are safe to fix with an import
+KNOWN_IMPORTS = {
+    **{m: f"import {m}" for m in (
+        "math", "os", "sys", "re", "json", "random", "itertools", "collections", "functools", "statistics",
+        "time", "datetime", "string", "heapq", "bisect", "copy", "operator", "textwrap", "decimal", "fractions",
+    )},
+    **{n: f"from typing import {n}" for n in (
+        "Any", "Callable", "Dict", "Iterable", "Iterator", "List", "Optional", "Sequence", "Set", "Tuple", "Union",
+    )},
+    **{n: f"from collections import {n}" for n in ("Counter", "defaultdict", "deque", "OrderedDict", "namedtuple")},
+    "dataclass": "from dataclasses import dataclass",
+    "field": "from dataclasses import field",
+    "np": "import numpy as np",
+    "pd": "import pandas as pd",
+}
+_CANNOT_IMPORT_RE = re.compile(rf"ImportError: cannot import name '(\w+)' from '{GENERATED_MODULE}'")
+_NO_MODULE_RE = re.compile(r"ModuleNotFoundError: No module named '(\w+)'")
+_NAME_ERROR_RE = re.compile(r"NameError: name '(\w+)' is not defined")
+
+
+@dataclass
+class Verdict:
+    kind: str                          # pass | fixed | escalate
+    reason: str = ""
+    fixes: List[str] = field(default_factory=list)
+    code: Optional[str] = None         # fixed generated_code.py, if changed
+    test_text: Optional[str] = None    # fixed test file, if changed
+
+    def as_dict(self) -> dict:
+        return {"kind": self.kind, "reason": self.reason, "fixes": self.fixes}
+
+
+def _top_level_names(code: str) -> List[str]:
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        return []
+    return [n.name for n in tree.body if isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef))]
+
+
+def _fix_missing_imports(code: str, diagnostics: Sequence) -> Optional[tuple]:
+    undefined = {d.message.split("'")[1] for d in diagnostics if d.code == "F821"}
+    if not undefined or not all(n in KNOWN_IMPORTS for n in undefined):
+        return None
+    lines = sorted({KNOWN_IMPORTS[n] for n in undefined})
+    if not all(module_exists(line.split()[1].split(".")[0]) for line in lines):
+        return None  # e.g. numpy is not installed: installing is not a mechanical fix
+    fixed, _ = patcher.apply_edits(code, "\n".join(lines) + "\n")
+    return fixed, [f"missing-import: {line}" for line in lines], undefined
+
+
+def _add_aliases(code: str, aliases: dict) -> str:
+    """Append `wanted = existing` lines after the definitions (before a __main__ block)."""
+    block = "".join(f"{wanted} = {existing}\n" for wanted, existing in aliases.items())
+    lines = code.splitlines(keepends=True)
+    at = len(lines)
+    try:
+        for node in ast.parse(code).body:
+            if patcher.is_main_guard(node):
+                at = node.lineno - 1
+                break
+    except (SyntaxError, ValueError):
+        pass
+    head = "".join(lines[:at]).rstrip("\n")
+    tail = "".join(lines[at:])
+    return f"{head}\n\n\n# names the tests expect\n{block}" + (f"\n\n{tail}" if tail else "")
+
+
+def _fold(name: str) -> str:
+    return name.replace("_", "").lower()
+
+
+def _one_edit_apart(a: str, b: str) -> bool:
+    """One inserted, deleted or substituted character, or two adjacent ones swapped."""
+    if abs(len(a) - len(b)) > 1:
+        return False
+    i = 0
+    while i < min(len(a), len(b)) and a[i] == b[i]:
+        i += 1
+    return (a[i + 1:] == b[i + 1:] or a[i:] == b[i + 1:] or a[i + 1:] == b[i:]
+            or (a[i:i + 2] == b[i:i + 2][::-1] and a[i + 2:] == b[i + 2:]))
+
+
+def _alias_target(name: str, names: Sequence[str]) -> Optional[str]:
+    """The one definition `name` is a variant or misspelling of, or None when there isn't exactly one."""
+    same = [n for n in names if _fold(n) == _fold(name)]
+    if same:
+        return same[0] if len(same) == 1 else None
+    typos = [n for n in names if _one_edit_apart(_fold(n), _fold(name))
+             and difflib.SequenceMatcher(None, _fold(n), _fold(name)).ratio() >= ALIAS_CUTOFF]
+    return typos[0] if len(typos) == 1 else None
+
+
+def _fix_test_import_names(code: str, test_output: str) -> Optional[tuple]:
+    wanted = sorted(set(_CANNOT_IMPORT_RE.findall(test_output)))
+    if not wanted:
+        return None
+    names = [n for n in _top_level_names(code) if n not in wanted]
+    aliases = {}
+    for name in wanted:
+        target = _alias_target(name, names)
+        if target is None:
+            return None
+        aliases[name] = target
+    return _add_aliases(code, aliases), [f"test-import-alias: {w} = {e}" for w, e in aliases.items()]
+
+
+def _fix_placeholder_module(code: str, test_text: str, test_output: str) -> Optional[tuple]:
+    missing = set(_NO_MODULE_RE.findall(test_output)) - {GENERATED_MODULE}
+    if not missing or any(module_exists(m) for m in missing):
+        return None
+    try:
+        tree = ast.parse(test_text)
+    except (SyntaxError, ValueError):
+        return None
+    defined = set(_top_level_names(code))
+    lines = test_text.splitlines(keepends=True)
+    changed = []
+    for node in tree.body:
+        if isinstance(node, ast.ImportFrom) and node.module in missing and node.level == 0:
+            if not all(a.name in defined for a in node.names):
+                return None
+            new = f"from {GENERATED_MODULE} import " + ", ".join(
+                a.name + (f" as {a.asname}" if a.asname else "") for a in node.names)
+        elif isinstance(node, ast.Import) and any(a.name in missing for a in node.names):
+            if len(node.names) != 1:
+                return None
+            new = f"import {GENERATED_MODULE} as {node.names[0].asname or node.names[0].name}"
+        else:
+            continue
+        lines[node.lineno - 1] = new + "\n"
+        for extra in range(node.lineno, node.end_lineno):
+            lines[extra] = "\n"  # keep line numbers stable
+        changed.append(f"test-placeholder: {ast.unparse(node)} -> {new}")
+    if not changed:
+        return None
+    return "".join(lines), changed
+
+
+def triage(code: str, syntax_ok: bool, diagnostics: Sequence, run_code: Optional[int], run_stderr: str,
+           pytest_code: Optional[int], test_output: str, test_text: Optional[str], test_records: Sequence = ()) -> Verdict:
+    blocking = [d for d in diagnostics if d.code in BLOCKING_CODES]
+    if syntax_ok and not blocking and run_code == 0 and pytest_code in (0, None):
+        return Verdict("pass", "syntax, static checks, run and tests all pass")
+    if not syntax_ok:
+        return Verdict("escalate", "syntax error")
+
+    fixed_code, fixed_test, fixes, imported = code, None, [], set()
+    if blocking:
+        res = _fix_missing_imports(code, blocking) if all(d.code == "F821" for d in blocking) else None
+        if res is None:
+            return Verdict("escalate", "static findings need the debugger")
+        fixed_code, fixes, imported = res
+
+    # every failure must be explained by a fix, else the debugger sees the whole picture instead
+    if run_code not in (0, None) and not set(_NAME_ERROR_RE.findall(run_stderr or "")) & imported:
+        return Verdict("escalate", "run failure outside the rule catalogue")
+    if pytest_code not in (0, None):
+        failing = [r for r in test_records if r.outcome not in ("passed", "skipped")]
+        if failing and imported and all(set(_NAME_ERROR_RE.findall(r.message)) & imported for r in failing):
+            pass  # the tests only fail on the missing imports
+        elif (res := _fix_test_import_names(fixed_code, test_output)) is not None:
+            fixed_code, found = res
+            fixes += found
+        elif test_text is not None and (res := _fix_placeholder_module(fixed_code, test_text, test_output)) is not None:
+            fixed_test, found = res
+            fixes += found
+        else:
+            return Verdict("escalate", "test failures outside the rule catalogue")
+    if not fixes:
+        return Verdict("escalate", "no rule applies")
+    return Verdict("fixed", "; ".join(fixes), fixes, fixed_code if fixed_code != code else None, fixed_test)
+
+
+class TriageStats:
+    """Process-wide count of debugger calls triage avoided."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {"pass": 0, "fixed": 0, "escalate": 0}
+
+    def record(self, verdict: Verdict) -> None:
+        with self._lock:
+            self.counts[verdict.kind] += 1
+
+    @property
+    def skipped(self) -> int:
+        return self.counts["pass"] + self.counts["fixed"]
+
+
+TRIAGE_STATS = TriageStats()